@@ -78,35 +78,56 @@ class UserPermissionNameSerializer(serializers.ModelSerializer):
         )
 
 
-class AuthSerializer(serializers.ModelSerializer):
+def get_avatar_image(user):
+    """
+    Return the first image of the user's teacher profile, None without one
+
+    The images prefetched with `profile__images` are used when present.
+    """
+    try:
+        images = list(user.profile.images.all())
+    except ObjectDoesNotExist:
+        return None
+
+    return min(images, key=lambda image: image.id, default=None)
+
+
+class AvatarSerializerMixin:
+    """
+    `avatar` and `avatar_thumbnail` fields of a user
+    """
+
+    def get_avatar(self, instance):
+        return self._avatar_url(instance, 'image')
+
+    def get_avatar_thumbnail(self, instance):
+        return self._avatar_url(instance, 'thumbnail')
+
+    def _avatar_url(self, instance, field):
+        request = self.context.get('request', None)
+        avatar = get_avatar_image(instance)
+        if avatar is None or request is None or not getattr(avatar, field):
+            return ''
+
+        return request.build_absolute_uri(getattr(avatar, field).url)
+
+
+class AuthSerializer(AvatarSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for auth data of user
     """
     permissions = serializers.SerializerMethodField()
     # TODO: I think these fields need to be wrapped
     avatar = serializers.SerializerMethodField()
+    avatar_thumbnail = serializers.SerializerMethodField()
     department = serializers.SerializerMethodField()
 
     class Meta:
         model = m.User
         fields = (
-            'id', 'username', 'name', 'mobile', 'avatar', 'permissions', 'department'
+            'id', 'username', 'name', 'mobile', 'avatar', 'avatar_thumbnail', 'permissions', 'department'
         )
 
-    def get_avatar(self, instance):
-        try:
-            profile = instance.profile
-            request = self.context.get('request', None)
-            avatar = profile.images.first()
-            if avatar and request:
-                avatar = request.build_absolute_uri(avatar.image.url)
-            else:
-                avatar = ''
-        except ObjectDoesNotExist:
-            avatar = ''
-
-        return avatar
-
     def get_department(self, instance):
         try:
             profile = instance.profile
@@ -254,9 +275,10 @@ class ShortUserSerializer(serializers.ModelSerializer):
         )
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(AvatarSerializerMixin, serializers.ModelSerializer):
 
     avatar = serializers.SerializerMethodField(required=False)
+    avatar_thumbnail = serializers.SerializerMethodField(required=False)
 
     class Meta:
         model = m.User
@@ -281,17 +303,3 @@ class UserSerializer(serializers.ModelSerializer):
 
         instance.save()
         return instance
-
-    def get_avatar(self, instance):
-        try:
-            profile = instance.profile
-            request = self.context.get('request', None)
-            avatar = profile.images.first()
-            if avatar and request:
-                avatar = request.build_absolute_uri(avatar.image.url)
-            else:
-                avatar = ''
-        except ObjectDoesNotExist:
-            avatar = ''
-
-        return avatar
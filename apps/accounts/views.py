@@ -54,7 +54,8 @@ class VerifyJWTAPIView(JWTAPIView):
 
 class UserViewSet(viewsets.ModelViewSet):
 
-    queryset = m.User.objects.all()
+    # the avatar fields read the images of the profile
+    queryset = m.User.objects.select_related('profile').prefetch_related('profile__images')
     serializer_class = s.UserSerializer
 
     @action(detail=False, url_path='names/all')
@@ -40,21 +40,32 @@ class TMSChoiceField(serializers.Field):
 
 
 class Base64ImageField(serializers.ImageField):
+    """
+    Image given as a base64 data URL
+
+    The payload is decoded once into a `ContentFile`. Its buffer is shared by
+    the format sniffing, the image validation, the storage and the face
+    decoder, none of them copy it. The base64 text itself is copied once.
+    """
 
     def to_internal_value(self, data):
         from django.core.files.base import ContentFile
-        import base64
+        import binascii
         import six
         import uuid
 
         if isinstance(data, six.string_types) and\
            data.startswith('data:image'):
 
-            header, data = data.split(';base64,')
+            offset = data.find(';base64,')
+            if offset < 0:
+                self.fail('invalid_image')
 
             try:
-                decoded_file = base64.b64decode(data)
-            except TypeError:
+                # slicing off the header copies the base64 text once, a str cannot be viewed
+                decoded_file = binascii.a2b_base64(data[offset + len(';base64,'):])
+            except ValueError:
+                # binascii.Error, or characters outside ASCII
                 self.fail('invalid_image')
 
             file_name = str(uuid.uuid4())[:12]
@@ -67,7 +78,8 @@ class Base64ImageField(serializers.ImageField):
     def get_file_extension(self, file_name, decoded_file):
         import imghdr
 
-        extension = imghdr.what(file_name, decoded_file)
+        # the signatures are in the first 32 bytes
+        extension = imghdr.what(file_name, decoded_file[:32])
         extension = "jpg" if extension == "jpeg" else extension
 
         return extension
@@ -0,0 +1,53 @@
+"""
+Fixed-size JPEG thumbnails of uploaded photos, for list pages
+
+A thumbnail is stored under `thumbnails/` with the path of its original, so
+one storage holds both and they are easy to tell apart.
+"""
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+
+def thumbnail_path(instance, filename):
+    return f"thumbnails/{filename}"
+
+
+def render_thumbnail(image_bytes, size=None):
+    """
+    Return the JPEG bytes of the photo center-cropped and scaled to a `size` square
+    """
+    size = size or settings.THUMBNAIL_SIZE
+    image = Image.open(io.BytesIO(image_bytes))
+    # JPEG decoders scale down by 1/2, 1/4 or 1/8 while decoding
+    image.draft('RGB', (size, size))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    image = ImageOps.fit(image, (size, size), Image.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=settings.THUMBNAIL_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def save_thumbnail(instance, thumbnail_bytes=None):
+    """
+    Store the thumbnail of `instance.image` in `instance.thumbnail`, replacing an older one
+
+    Only the thumbnail column is written, so concurrent changes of other
+    fields are kept.
+    """
+    if thumbnail_bytes is None:
+        with instance.image.open('rb') as f:
+            thumbnail_bytes = render_thumbnail(f.read())
+
+    if instance.thumbnail:
+        instance.thumbnail.delete(save=False)
+
+    name = os.path.splitext(instance.image.name)[0] + '.jpg'
+    instance.thumbnail.save(name, ContentFile(thumbnail_bytes), save=False)
+    type(instance).objects.filter(id=instance.id).update(thumbnail=instance.thumbnail.name)
@@ -0,0 +1,269 @@
+"""
+Archive of old check-ins
+
+`AttendanceHistory` is read by every check-in and report, so it only keeps
+the last `ATTENDANCE_ARCHIVE['HORIZON_DAYS']`. Older check-ins are moved month
+by month to `ArchivedAttendanceHistory`, with their ids, and their photos to a
+zip bundle per month and run:
+
+    archive/attendance/2025-03.zip
+
+A check-in is only archived once its day is counted in `AttendanceDatePerson`,
+the daily rollups themselves are never archived. The tickets of the archived
+check-ins are deleted.
+
+Restoring the month of a teacher extracts the photos back under their names
+and copies the check-ins back to the history. The archived rows are kept and
+marked restored; after `RESTORED_DAYS` the copies are saved back to them and
+deleted again.
+"""
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.functions import TruncDate
+
+from .models import (
+    AttendanceArchive, AttendanceDatePerson, AttendanceHistory, AttendanceTicket, ArchivedAttendanceHistory
+)
+
+
+# columns copied between the history and the archive
+FIELDS = (
+    'membership_id', 'time_slot_id', 'is_open_attend', 'is_bad_attendance', 'identified_on', 'longitude',
+    'latitude', 'is_right_place', 'address', 'description', 'device_id'
+)
+
+# fields a restored copy may change
+EDITABLE_FIELDS = ('time_slot_id', 'is_open_attend', 'is_bad_attendance', 'is_right_place', 'address', 'description')
+
+BATCH_SIZE = 500
+
+
+def archive_horizon(today=None):
+    """
+    First day of the oldest month kept in the history
+    """
+    today = today or date.today()
+    return (today - timedelta(days=settings.ATTENDANCE_ARCHIVE['HORIZON_DAYS'])).replace(day=1)
+
+
+def month_range(month):
+    start = datetime(month.year, month.month, 1)
+    if month.month == 12:
+        return start, datetime(month.year + 1, 1, 1)
+
+    return start, datetime(month.year, month.month + 1, 1)
+
+
+def batches(items, size=BATCH_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def release_files(names):
+    """
+    Delete the photos and thumbnails no history or ticket refers to any more
+
+    Photos are stored under their content hash and shared, see `photos`.
+    """
+    deleted = 0
+    for chunk in batches(set(name for name in names if name)):
+        referenced = set(AttendanceHistory.objects.filter(image__in=chunk).values_list('image', flat=True))
+        referenced |= set(AttendanceHistory.objects.filter(thumbnail__in=chunk).values_list('thumbnail', flat=True))
+        referenced |= set(AttendanceTicket.objects.filter(image__in=chunk).values_list('image', flat=True))
+        for name in set(chunk) - referenced:
+            default_storage.delete(name)
+            deleted += 1
+
+    return deleted
+
+
+def write_bundle(names, path):
+    """
+    Zip the photos to `path`, return the names of the missing ones
+    """
+    missing = []
+    # JPEG hardly deflates, the bundle mostly saves the file per photo
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as bundle:
+        for name in sorted(names):
+            try:
+                with default_storage.open(name, 'rb') as src, bundle.open(name, 'w') as dst:
+                    shutil.copyfileobj(src, dst)
+            except OSError:
+                missing.append(name)
+
+    return missing
+
+
+def archive_month(month):
+    """
+    Move the counted check-ins of the month and their photos to the archive
+
+    Return the archive, or None when there was nothing to archive, and the
+    number of check-ins held back because their day is not counted yet.
+    """
+    start, end = month_range(month)
+    counted = AttendanceDatePerson.objects.filter(teacher=OuterRef('membership__teacher'), date=OuterRef('day'))
+    histories = AttendanceHistory.objects.filter(
+        identified_on__gte=start, identified_on__lt=end
+    ).exclude(
+        # restored copies are already archived
+        id__in=ArchivedAttendanceHistory.objects.values('id')
+    ).annotate(
+        day=TruncDate('identified_on'),
+        is_counted=Exists(counted)
+    )
+    held_back = histories.filter(is_counted=False).count()
+    histories = list(histories.filter(is_counted=True).select_related('membership').order_by('id'))
+    if not histories:
+        return None, held_back
+
+    names = set(history.image.name for history in histories if history.image)
+    fd, path = tempfile.mkstemp(suffix='.zip')
+    os.close(fd)
+    try:
+        missing = write_bundle(names, path)
+        archive = AttendanceArchive(month=month, photos=len(names) - len(missing), size=os.path.getsize(path))
+        with open(path, 'rb') as f:
+            archive.bundle.save(f'{month:%Y-%m}.zip', File(f), save=False)
+    finally:
+        os.unlink(path)
+
+    thumbnails = [history.thumbnail.name for history in histories if history.thumbnail]
+    try:
+        with transaction.atomic():
+            archive.save()
+            ArchivedAttendanceHistory.objects.bulk_create([
+                ArchivedAttendanceHistory(
+                    id=history.id,
+                    archive=archive,
+                    teacher_id=history.membership.teacher_id,
+                    image=history.image.name,
+                    **{field: getattr(history, field) for field in FIELDS}
+                )
+                for history in histories
+            ], batch_size=BATCH_SIZE)
+
+            archived = ArchivedAttendanceHistory.objects.filter(archive=archive).values('id')
+            AttendanceTicket.objects.filter(identified_on__gte=start, identified_on__lt=end).filter(
+                Q(history__isnull=True) | Q(history__in=archived)
+            ).delete()
+            AttendanceHistory.objects.filter(id__in=archived).delete()
+    except Exception:
+        archive.bundle.delete(save=False)
+        raise
+
+    release_files(list(names) + thumbnails)
+    return archive, held_back
+
+
+def expire_restored(now=None):
+    """
+    Save the restored copies older than `RESTORED_DAYS` to the archive and delete them
+    """
+    now = now or datetime.now()
+    restored_before = now - timedelta(days=settings.ATTENDANCE_ARCHIVE['RESTORED_DAYS'])
+    ids = ArchivedAttendanceHistory.objects.filter(restored_on__lt=restored_before).values_list('id', flat=True)
+
+    expired = 0
+    for chunk in batches(ids):
+        copies = {copy.id: copy for copy in AttendanceHistory.objects.filter(id__in=chunk)}
+        archived = list(ArchivedAttendanceHistory.objects.filter(id__in=chunk))
+        for row in archived:
+            copy = copies.get(row.id)
+            if copy is not None:
+                for field in EDITABLE_FIELDS:
+                    setattr(row, field, getattr(copy, field))
+
+            row.restored_on = None
+
+        with transaction.atomic():
+            ArchivedAttendanceHistory.objects.bulk_update(archived, EDITABLE_FIELDS + ('restored_on',))
+            AttendanceHistory.objects.filter(id__in=chunk).delete()
+
+        release_files(
+            [copy.image.name for copy in copies.values()] + [copy.thumbnail.name for copy in copies.values()]
+        )
+        expired += len(copies)
+
+    return expired
+
+
+def archive_attendance(horizon=None):
+    """
+    Archive every month before `horizon` and expire the restored copies
+    """
+    horizon = horizon or archive_horizon()
+    archives = []
+    held_back = 0
+    months = AttendanceHistory.objects.filter(
+        identified_on__lt=datetime(horizon.year, horizon.month, 1)
+    ).dates('identified_on', 'month')
+    for month in months:
+        archive, count = archive_month(month)
+        held_back += count
+        if archive is not None:
+            archives.append(archive)
+
+    return {
+        'archives': archives,
+        'held_back': held_back,
+        'expired': expire_restored(),
+    }
+
+
+def restore_attendance(teacher, month, now=None):
+    """
+    Copy the archived check-ins of the teacher's month back to the history
+
+    Return the ids of the copies created, the check-ins already restored are
+    only kept for `RESTORED_DAYS` more.
+    """
+    start, end = month_range(month)
+    archived = list(ArchivedAttendanceHistory.objects.filter(
+        teacher=teacher, identified_on__gte=start, identified_on__lt=end
+    ).select_related('archive'))
+    restored_ids = set(
+        AttendanceHistory.objects.filter(id__in=[row.id for row in archived]).values_list('id', flat=True)
+    )
+    rows = [row for row in archived if row.id not in restored_ids]
+
+    by_archive = {}
+    for row in rows:
+        by_archive.setdefault(row.archive, set()).add(row.image)
+
+    for archive, names in by_archive.items():
+        with archive.bundle.open('rb') as f, zipfile.ZipFile(f) as bundle:
+            members = set(bundle.namelist())
+            for name in names:
+                if name in members and not default_storage.exists(name):
+                    default_storage.save(name, ContentFile(bundle.read(name)))
+
+    with transaction.atomic():
+        AttendanceHistory.objects.bulk_create([
+            AttendanceHistory(
+                id=row.id,
+                image=row.image,
+                **{field: getattr(row, field) for field in FIELDS}
+            )
+            for row in rows
+        ], batch_size=BATCH_SIZE)
+        # `identified_on` is set to the current time on creation
+        for row in rows:
+            AttendanceHistory.objects.filter(id=row.id).update(identified_on=row.identified_on)
+
+        ArchivedAttendanceHistory.objects.filter(
+            id__in=[row.id for row in archived]
+        ).update(restored_on=now or datetime.now())
+
+    return [row.id for row in rows]
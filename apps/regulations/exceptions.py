@@ -24,3 +24,44 @@ class FACE_RECOGNITION_IMEI_NOT_MATCH(Exception):
 
 class FACE_DETECTION_FAILED(Exception):
     pass
+
+
+class NO_ATTENDANCE_MEMBERSHIP(Exception):
+    pass
+
+
+class FACE_RECOGNITION_BUSY(Exception):
+    pass
+
+
+class ATTENDANCE_DUPLICATED(Exception):
+    """The window is already checked, `history` is that check"""
+
+    def __init__(self, history=None):
+        super().__init__('Already checked')
+        self.history = history
+
+
+ERROR_MESSAGES = (
+    (FACE_RECOGNITION_NO_DATASET, '无本人人脸库，请输入本人人脸后进行操作'),
+    (FACE_RECOGNITION_FAILED, '检查失败, 请确保是本人'),
+    (NO_ATTENDANCE_DAY, '今天是休息天，无需考勤'),
+    (OUT_OF_ATTENDANCE_TIME, '已过考勤时间，所以不能操作'),
+    (TIMESLOT_MISSING, 'Timeslot error'),
+    (FACE_RECOGNITION_IMEI_NOT_MATCH, '这台设备不是登记的考勤设备，请确认'),
+    (FACE_DETECTION_FAILED, '未识别到人脸，请正确面对镜头'),
+    (NO_ATTENDANCE_MEMBERSHIP, '没有考勤规则，请联系管理员'),
+    (FACE_RECOGNITION_BUSY, '人脸识别繁忙，请稍后再试'),
+    (ATTENDANCE_DUPLICATED, '已经考勤过了，无需重复考勤'),
+)
+
+
+def get_error_message(exc):
+    """
+    Message shown in the app for an exception raised while attending
+    """
+    for exception_class, message in ERROR_MESSAGES:
+        if isinstance(exc, exception_class):
+            return message
+
+    return '未知问题'
@@ -1,3 +1,8 @@
+from . import exceptions as e
+from .geofence import Geofence
+from .schedules import get_schedule
+
+
 def get_week_day(instance, week_index):
     week_mapping = {
         0: instance.mon,
@@ -10,3 +15,75 @@ def get_week_day(instance, week_index):
     }
 
     return week_mapping[week_index]
+
+
+def get_day_rule(rule_id, day):
+    """
+    Return the compiled attendance time of the rule on the day, see `schedules`
+
+    Raise NO_ATTENDANCE_DAY when nobody needs to attend that day.
+    """
+    return get_schedule(rule_id).get_day(day)
+
+
+def get_attendance_window(time_slot, is_open_attend):
+    """
+    Return the rule time, the start time and the finish time of the open or close check
+    """
+    if is_open_attend:
+        return time_slot.open_time, time_slot.start_open_time, time_slot.finish_open_time
+
+    return time_slot.close_time, time_slot.start_close_time, time_slot.finish_close_time
+
+
+def is_bad_attendance(time_slot, is_open_attend, current_time):
+    """
+    Whether the check at `current_time` is late or early
+
+    Raise OUT_OF_ATTENDANCE_TIME when the check is outside of its window.
+    """
+    attendance_time, attendance_start_time, attendance_end_time = get_attendance_window(time_slot, is_open_attend)
+
+    if current_time < attendance_start_time or current_time > attendance_end_time:
+        raise e.OUT_OF_ATTENDANCE_TIME
+
+    return (current_time > attendance_time and is_open_attend) or\
+        (current_time < attendance_time and not is_open_attend)
+
+
+def find_time_slot(day_rule, current_time):
+    """
+    Return the time slot and whether it is an open check for the window containing `current_time`
+    """
+    for window in day_rule.windows:
+        if window.start_time > current_time:
+            break
+
+        if current_time <= window.finish_time:
+            return window.slot, window.is_open_attend
+
+    raise e.OUT_OF_ATTENDANCE_TIME
+
+
+def is_right_place(rule_id, latitude, longitude):
+    """
+    Whether the point is inside the geofence of the rule, see `geofence`
+    """
+    return get_schedule(rule_id).geofence.contains(latitude, longitude)
+
+
+def get_check_place(rule, latitude, longitude):
+    """
+    Return the place of a check, the rule's `attendance_place` or else the zone containing the point
+
+    Return None when the rule has neither.
+    """
+    if rule.attendance_place is not None:
+        return rule.attendance_place
+
+    zones = list(rule.zones.all())
+    for zone in zones:
+        if Geofence.from_places([zone]).contains(latitude, longitude):
+            return zone
+
+    return zones[0] if zones else None
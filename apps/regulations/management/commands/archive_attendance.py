@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from apps.regulations.archive import archive_attendance, archive_horizon
+from apps.regulations.models import AttendanceHistory
+
+
+class Command(BaseCommand):
+    help = 'Move the check-ins older than the archive horizon and their photos to the archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help='Archive the months before this YYYY-MM, the horizon by default')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            horizon = datetime.strptime(options['before'], '%Y-%m').date()
+        else:
+            horizon = archive_horizon()
+
+        result = archive_attendance(horizon)
+        for archive in result['archives']:
+            self.stdout.write(
+                f'{archive.month:%Y-%m}: {archive.histories.count()} check-ins, {archive.photos} photos, '
+                f'{archive.size / 1024 / 1024:.1f}MB in {archive.bundle.name}'
+            )
+
+        if result['held_back']:
+            self.stderr.write(
+                f"{result['held_back']} check-ins were kept because their day is not counted yet, "
+                f"run calculate_dates first"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {len(result['archives'])} months before {horizon:%Y-%m}, expired {result['expired']} "
+            f"restored check-ins, {AttendanceHistory.objects.count()} check-ins left in the history"
+        ))
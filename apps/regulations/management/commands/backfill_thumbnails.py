@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from apps.core.thumbnails import save_thumbnail
+from apps.regulations.models import AttendanceHistory
+from apps.regulations.status import invalidate_day_checks
+from apps.teachers.models import TeacherImage
+
+
+MODELS = {
+    'teachers': TeacherImage,
+    'attendance': AttendanceHistory,
+}
+
+
+class Command(BaseCommand):
+    help = 'Render the missing thumbnails of teacher images and attendance photos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--models', default=','.join(MODELS))
+        parser.add_argument('--force', action='store_true', help='Render the existing thumbnails again')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        for name in options['models'].split(','):
+            model = MODELS[name]
+            queryset = model.objects.exclude(image='')
+            if not options['force']:
+                queryset = queryset.filter(Q(thumbnail='') | Q(thumbnail__isnull=True))
+
+            total = queryset.count()
+            rendered = failed = 0
+            memberships = set()
+            for index, instance in enumerate(queryset.order_by('id').iterator(chunk_size=options['batch_size']), 1):
+                try:
+                    save_thumbnail(instance)
+                    rendered += 1
+                    if model is AttendanceHistory:
+                        memberships.add(instance.membership_id)
+                except (OSError, ValueError) as exc:
+                    failed += 1
+                    self.stderr.write(f'{name} {instance.id}: {exc}')
+
+                if index % options['batch_size'] == 0:
+                    self.stdout.write(f'{name}: {index}/{total}')
+
+            for membership_id in memberships:
+                invalidate_day_checks(membership_id)
+
+            self.stdout.write(self.style.SUCCESS(f'{name}: rendered {rendered} thumbnails, {failed} failed'))
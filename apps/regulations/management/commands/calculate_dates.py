@@ -1,6 +1,9 @@
 from datetime import timedelta, date
 from django.core.management.base import BaseCommand
-from apps.regulations.models import AttendanceHistory, AttendanceDatePerson, AttendanceEvent
+from django.db.models import Min
+from apps.regulations.memberships import MembershipTimeline
+from apps.regulations.models import AttendanceHistory, AttendanceDatePerson, MembershipPeriod
+from apps.regulations.schedules import get_schedule
 from apps.teachers.models import TeacherProfile
 
 
@@ -8,49 +11,43 @@ class Command(BaseCommand):
     help = 'Calculate the number of attendance dates'
 
     def handle(self, *args, **options):
+        first_day = MembershipPeriod.objects.aggregate(first=Min('valid_from'))['first']
+        if first_day is None:
+            return
+
+        # the day before yesterday, yesterday is counted by `update_attendance_report`
+        last_day = date.today() - timedelta(days=2)
+        timeline = MembershipTimeline(first_day, last_day)
+        # attendance days of each rule since the first membership, shared by its members
+        working_days = {}
         for teacher in TeacherProfile.objects.all():
-            first_membership = teacher.attendance_membership.order_by('joined_on').first()
-            if first_membership is None:
+            periods = timeline.periods(teacher.id)
+            if not periods:
                 continue
 
-            joined_date = first_membership.joined_on.date()
-            period = (date.today() - joined_date).days - 1
-
+            counted = set(AttendanceDatePerson.objects.filter(teacher=teacher).values_list('date', flat=True))
             result = []
-            membership = None
-            for single_date in (joined_date + timedelta(n) for n in range(period)):
-                if AttendanceDatePerson.objects.filter(teacher=teacher, date=single_date).exists():
-                    continue
-
-                try:
-                    if membership is None or membership.joined_on.date() >= single_date:
-                        membership = teacher.attendance_membership.filter(
-                            joined_on__date__lte=single_date).order_by('-joined_on').first()
-
-                except Exception:
-                    break
+            for period in periods:
+                start, end = period.valid_from, min(period.valid_to or last_day, last_day)
+                for single_date in (start + timedelta(n) for n in range((end - start).days + 1)):
+                    if single_date in counted:
+                        continue
 
-                else:
-                    rule = membership.rule
-                    if AttendanceEvent.objects.filter(
-                        rule=rule, is_attendance_day=False, start_date__gte=single_date, end_date__lte=single_date
-                    ).exists():
-                        pass
+                    if period.rule_id not in working_days:
+                        working_days[period.rule_id] = set(
+                            get_schedule(period.rule_id).working_days(first_day, date.today())
+                        )
 
-                    week_mapping = {
-                        0: rule.mon,
-                        1: rule.tue,
-                        2: rule.wed,
-                        3: rule.thr,
-                        4: rule.fri,
-                        5: rule.sat,
-                        6: rule.sun
-                    }
+                    if single_date in working_days[period.rule_id]:
+                        schedule = get_schedule(period.rule_id)
+                        total_check = len(schedule.days[single_date.weekday()].slots) * 2
+                        holidays = 0
+                    else:
+                        total_check = 0
+                        holidays = 1
 
-                    time_rule = week_mapping[single_date.weekday()]
-                    total_check = time_rule.slots.count() * 2
                     attendance_history = AttendanceHistory.objects.filter(
-                        membership=membership, identified_on__date=single_date
+                        membership_id=period.membership_id, identified_on__date=single_date
                     )
                     checks = attendance_history.count()
                     late_attendances = 0
@@ -74,7 +71,7 @@ class Command(BaseCommand):
                         late_attendances=late_attendances,
                         early_leaves=early_leaves,
                         outside_checks=outside_checks,
-                        holidays=0
+                        holidays=holidays
                     ))
 
             AttendanceDatePerson.objects.bulk_create(result)
@@ -0,0 +1,75 @@
+import hashlib
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.regulations.models import AttendanceHistory, AttendanceTicket
+from apps.regulations.photos import is_stored_photo, photo_path, reencode_photo
+
+
+class Command(BaseCommand):
+    help = 'Move the attendance photos to the re-encoded, content-addressed layout and report the bytes saved'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the bytes that would be saved')
+        parser.add_argument('--keep-originals', action='store_true', help='Do not delete the migrated files')
+        parser.add_argument('--limit', type=int, help='Migrate at most this many files')
+
+    def handle(self, *args, **options):
+        names = set(AttendanceHistory.objects.exclude(image='').values_list('image', flat=True))
+        names |= set(AttendanceTicket.objects.exclude(image='').values_list('image', flat=True))
+        names = sorted(name for name in names if not is_stored_photo(name))[:options['limit']]
+
+        migrated = missing = failed = deduplicated = 0
+        bytes_before = bytes_after = 0
+        created = set()
+        for index, name in enumerate(names, 1):
+            try:
+                with default_storage.open(name, 'rb') as f:
+                    original = f.read()
+            except OSError:
+                missing += 1
+                continue
+
+            try:
+                photo_bytes = reencode_photo(original)
+            except (OSError, ValueError) as exc:
+                failed += 1
+                self.stderr.write(f'{name}: {exc}')
+                continue
+
+            bytes_before += len(original)
+            migrated += 1
+            new_name = photo_path(hashlib.sha256(photo_bytes).hexdigest())
+            if new_name in created or default_storage.exists(new_name):
+                deduplicated += 1
+            else:
+                created.add(new_name)
+                bytes_after += len(photo_bytes)
+                if not options['dry_run']:
+                    new_name = default_storage.save(new_name, ContentFile(photo_bytes))
+
+            if not options['dry_run']:
+                # a ticket and its history share the photo
+                with transaction.atomic():
+                    AttendanceHistory.objects.filter(image=name).update(image=new_name)
+                    AttendanceTicket.objects.filter(image=name).update(image=new_name)
+
+                if not options['keep_originals']:
+                    default_storage.delete(name)
+
+            if index % 500 == 0:
+                self.stdout.write(f'{index}/{len(names)} files')
+
+        saved = bytes_before - bytes_after
+        ratio = 100 * saved / bytes_before if bytes_before else 0
+        prefix = 'Would migrate' if options['dry_run'] else 'Migrated'
+        self.stdout.write(
+            f'{prefix} {migrated} files ({deduplicated} duplicates), {missing} missing, {failed} unreadable'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{bytes_before / 1024 / 1024:.1f}MB -> {bytes_after / 1024 / 1024:.1f}MB, '
+            f'saved {saved / 1024 / 1024:.1f}MB ({ratio:.0f}%)'
+        ))
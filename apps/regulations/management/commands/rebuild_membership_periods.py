@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from apps.regulations.memberships import refresh_membership_periods
+from apps.regulations.models import MembershipPeriod
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the membership periods of the teachers from their attendance memberships'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--teachers', help='Comma separated teacher ids, every teacher by default')
+
+    def handle(self, *args, **options):
+        teacher_ids = None
+        if options['teachers']:
+            teacher_ids = [int(teacher_id) for teacher_id in options['teachers'].split(',')]
+
+        refresh_membership_periods(teacher_ids)
+        periods = MembershipPeriod.objects.all()
+        if teacher_ids is not None:
+            periods = periods.filter(teacher_id__in=teacher_ids)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {periods.count()} membership periods'))
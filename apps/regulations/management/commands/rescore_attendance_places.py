@@ -0,0 +1,65 @@
+from datetime import datetime
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from apps.regulations.archive import batches
+from apps.regulations.models import AttendanceHistory, AttendanceRule
+from apps.regulations.schedules import get_schedule
+from apps.regulations.status import invalidate_day_checks
+
+
+class Command(BaseCommand):
+    help = "Evaluate the check-ins again against their rule's current places and update is_right_place"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rules', help='Comma separated rule ids, every rule by default')
+        parser.add_argument('--since', help='Only the check-ins from this YYYY-MM-DD on')
+        parser.add_argument('--dry-run', action='store_true', help='Only report the check-ins which would change')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        rules = AttendanceRule.objects.order_by('id')
+        if options['rules']:
+            rules = rules.filter(id__in=options['rules'].split(','))
+
+        total = changed = 0
+        for rule in rules:
+            geofence = get_schedule(rule.id).geofence
+            histories = AttendanceHistory.objects.filter(membership__rule=rule)
+            if options['since']:
+                since = datetime.strptime(options['since'], '%Y-%m-%d').date()
+                histories = histories.filter(identified_on__date__gte=since)
+
+            rows = histories.order_by('id').values_list(
+                'id', 'latitude', 'longitude', 'is_right_place', 'membership_id'
+            )
+            inside, outside = [], []
+            memberships = set()
+            iterator = rows.iterator(chunk_size=options['batch_size'])
+            while True:
+                chunk = list(islice(iterator, options['batch_size']))
+                if not chunk:
+                    break
+
+                ids, latitudes, longitudes, current, membership_ids = zip(*chunk)
+                scores = geofence.contains_many(latitudes, longitudes)
+                for history_id, score, was_right, membership_id in zip(ids, scores.tolist(), current, membership_ids):
+                    if score != was_right:
+                        (inside if score else outside).append(history_id)
+                        memberships.add(membership_id)
+
+                total += len(ids)
+
+            changed += len(inside) + len(outside)
+            self.stdout.write(f'{rule.name}: {len(inside)} now inside, {len(outside)} now outside')
+            if not options['dry_run']:
+                for ids, is_right_place in ((inside, True), (outside, False)):
+                    for chunk in batches(ids):
+                        AttendanceHistory.objects.filter(id__in=chunk).update(is_right_place=is_right_place)
+
+                for membership_id in memberships:
+                    invalidate_day_checks(membership_id)
+
+        prefix = 'Would change' if options['dry_run'] else 'Changed'
+        self.stdout.write(self.style.SUCCESS(f'{prefix} {changed} of {total} check-ins'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.regulations.tasks import restore_attendance_history
+from apps.teachers.models import TeacherProfile
+
+
+class Command(BaseCommand):
+    help = "Copy a teacher's archived check-ins of one month back to the history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('work_no')
+        parser.add_argument('month', help='YYYY-MM')
+
+    def handle(self, *args, **options):
+        teacher = TeacherProfile.objects.filter(work_no=options['work_no']).first()
+        if teacher is None:
+            raise CommandError(f"No teacher with the work number {options['work_no']}")
+
+        ids = restore_attendance_history({
+            'teacher': teacher.id,
+            'month': f"{options['month']}-01"
+        })
+        self.stdout.write(self.style.SUCCESS(f"Restored {len(ids)} check-ins of {options['month']}"))
@@ -0,0 +1,120 @@
+"""
+Effective-dated attendance memberships
+
+The rule a teacher follows on a day is the one of their latest membership
+joined on or before that day. `MembershipPeriod` stores, for each membership,
+the days on which it is that one, so the membership of many teachers on many
+days is read with one query instead of one sorted query per teacher and day.
+
+The periods of a teacher are rebuilt whenever one of their memberships is
+saved or deleted, see `signals`. Memberships created with `bulk_create` send
+no signal, their callers refresh the periods themselves.
+"""
+from bisect import bisect_right
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import AttendanceMembership, MembershipPeriod
+
+
+def build_periods(memberships):
+    """
+    Return the periods of one teacher's memberships, ordered by `joined_on`
+    """
+    periods = []
+    for membership in memberships:
+        valid_from = membership.joined_on.date()
+        if periods and periods[-1].valid_from == valid_from:
+            # replaced on the day it was joined
+            periods.pop()
+
+        if periods:
+            periods[-1].valid_to = valid_from - timedelta(days=1)
+
+        periods.append(MembershipPeriod(
+            teacher_id=membership.teacher_id,
+            membership_id=membership.id,
+            rule_id=membership.rule_id,
+            valid_from=valid_from
+        ))
+
+    return periods
+
+
+def refresh_membership_periods(teacher_ids=None):
+    """
+    Rebuild the periods of the teachers, or of every teacher
+    """
+    memberships = AttendanceMembership.objects.order_by('teacher_id', 'joined_on', 'id')
+    periods = MembershipPeriod.objects.all()
+    if teacher_ids is not None:
+        teacher_ids = list(teacher_ids)
+        memberships = memberships.filter(teacher_id__in=teacher_ids)
+        periods = periods.filter(teacher_id__in=teacher_ids)
+
+    by_teacher = {}
+    for membership in memberships.only('id', 'teacher_id', 'rule_id', 'joined_on'):
+        by_teacher.setdefault(membership.teacher_id, []).append(membership)
+
+    with transaction.atomic():
+        periods.delete()
+        MembershipPeriod.objects.bulk_create(
+            [period for memberships in by_teacher.values() for period in build_periods(memberships)],
+            batch_size=500
+        )
+
+
+def current_period(teacher_id, *related):
+    """
+    Return the period of the teacher's latest membership, with its membership and `related` selected
+    """
+    return MembershipPeriod.objects.filter(
+        teacher_id=teacher_id, valid_to__isnull=True
+    ).select_related('membership', *related).first()
+
+
+class MembershipTimeline:
+    """
+    Periods of many teachers over a range of days, loaded in one query
+    """
+
+    def __init__(self, start, end, teacher_ids=None):
+        periods = MembershipPeriod.objects.filter(
+            Q(valid_to__isnull=True) | Q(valid_to__gte=start), valid_from__lte=end
+        ).order_by('teacher_id', 'valid_from')
+        if teacher_ids is not None:
+            periods = periods.filter(teacher_id__in=list(teacher_ids))
+
+        self._periods = {}
+        for period in periods:
+            self._periods.setdefault(period.teacher_id, []).append(period)
+
+        self._starts = {
+            teacher_id: [period.valid_from for period in periods] for teacher_id, periods in self._periods.items()
+        }
+
+    def periods(self, teacher_id):
+        """
+        Return the loaded periods of the teacher, ordered by `valid_from`
+        """
+        return self._periods.get(teacher_id, [])
+
+    def get(self, teacher_id, day):
+        """
+        Return the period of the teacher on the day, None before their first membership
+        """
+        periods = self._periods.get(teacher_id)
+        if not periods:
+            return None
+
+        index = bisect_right(self._starts[teacher_id], day) - 1
+        if index < 0:
+            return None
+
+        period = periods[index]
+        if period.valid_to is not None and period.valid_to < day:
+            return None
+
+        return period
@@ -0,0 +1,18 @@
+# Generated by Django 2.2 on 2026-10-18 14:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('regulations', '0010_auto_20200409_0955'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendancehistory',
+            name='device_id',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 2.2 on 2026-10-18 14:37
+
+import apps.regulations.models
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('regulations', '0011_attendancehistory_device_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceTicket',
+            fields=[
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('is_open_attend', models.BooleanField(default=True)),
+                ('is_bad_attendance', models.BooleanField(default=False)),
+                ('identified_on', models.DateTimeField(auto_now_add=True)),
+                ('image', models.ImageField(upload_to=apps.regulations.models.attendance_image_path)),
+                ('longitude', models.DecimalField(blank=True, decimal_places=10, max_digits=20, null=True)),
+                ('latitude', models.DecimalField(blank=True, decimal_places=10, max_digits=20, null=True)),
+                ('imei', models.CharField(blank=True, max_length=100, null=True)),
+                ('status', models.CharField(choices=[('P', '处理中'), ('S', '成功'), ('F', '失败')], default='P', max_length=1)),
+                ('msg', models.CharField(blank=True, default='', max_length=200)),
+                ('history', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ticket', to='regulations.AttendanceHistory')),
+                ('membership', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tickets', to='regulations.AttendanceMembership')),
+                ('time_slot', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='regulations.TimeSlot')),
+            ],
+            options={
+                'ordering': ('-updated',),
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.2 on 2026-10-18 14:49
+
+import apps.core.thumbnails
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('regulations', '0012_attendanceticket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendancehistory',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to=apps.core.thumbnails.thumbnail_path),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 2.2 on 2026-10-18 16:12
+
+import apps.regulations.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teachers', '0005_teacherimage_thumbnail'),
+        ('regulations', '0013_attendancehistory_thumbnail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceArchive',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('month', models.DateField()),
+                ('bundle', models.FileField(upload_to=apps.regulations.models.archive_bundle_path)),
+                ('photos', models.PositiveIntegerField(default=0)),
+                ('size', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ('-updated',),
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedAttendanceHistory',
+            fields=[
+                ('id', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('is_open_attend', models.BooleanField(default=True)),
+                ('is_bad_attendance', models.BooleanField(default=False)),
+                ('identified_on', models.DateTimeField()),
+                ('image', models.CharField(max_length=100)),
+                ('longitude', models.DecimalField(blank=True, decimal_places=10, max_digits=20, null=True)),
+                ('latitude', models.DecimalField(blank=True, decimal_places=10, max_digits=20, null=True)),
+                ('is_right_place', models.BooleanField(default=True)),
+                ('address', models.TextField(blank=True, null=True)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('device_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('restored_on', models.DateTimeField(blank=True, null=True)),
+                ('archive', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='histories', to='regulations.AttendanceArchive')),
+                ('membership', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_history', to='regulations.AttendanceMembership')),
+                ('teacher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_attendance_history', to='teachers.TeacherProfile')),
+                ('time_slot', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='regulations.TimeSlot')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedattendancehistory',
+            index=models.Index(fields=['teacher', 'identified_on'], name='regulations_teacher_cfb7de_idx'),
+        ),
+    ]
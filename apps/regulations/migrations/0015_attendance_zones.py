@@ -0,0 +1,23 @@
+# Generated by Django 2.2 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('regulations', '0014_attendance_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendanceplace',
+            name='polygon',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='attendancerule',
+            name='zones',
+            field=models.ManyToManyField(blank=True, related_name='zone_rules', to='regulations.AttendancePlace'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 2.2 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+def set_identified_dates(apps, schema_editor):
+    """
+    Date the first check of each window and day, the later duplicates stay undated
+    """
+    AttendanceHistory = apps.get_model('regulations', 'AttendanceHistory')
+    seen = set()
+    dates = {}
+    histories = AttendanceHistory.objects.order_by('id').values_list(
+        'id', 'membership_id', 'time_slot_id', 'is_open_attend', 'identified_on'
+    )
+    for history_id, membership_id, time_slot_id, is_open_attend, identified_on in histories.iterator():
+        check = (membership_id, time_slot_id, is_open_attend, identified_on.date())
+        if time_slot_id is not None and check in seen:
+            continue
+
+        seen.add(check)
+        dates.setdefault(identified_on.date(), []).append(history_id)
+
+    for day, ids in dates.items():
+        for i in range(0, len(ids), 500):
+            AttendanceHistory.objects.filter(id__in=ids[i:i + 500]).update(identified_date=day)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('regulations', '0015_attendance_zones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendancehistory',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='attendancehistory',
+            name='identified_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.RunPython(set_identified_dates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='attendancehistory',
+            constraint=models.UniqueConstraint(fields=('membership', 'time_slot', 'is_open_attend', 'identified_date'), name='unique_attendance_check'),
+        ),
+        migrations.AddConstraint(
+            model_name='attendancehistory',
+            constraint=models.UniqueConstraint(fields=('membership', 'idempotency_key'), name='unique_attendance_idempotency_key'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 2.2 on 2026-10-18 18:20
+
+from datetime import timedelta
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_membership_periods(apps, schema_editor):
+    """
+    Give each membership the days on which it is its teacher's latest one
+    """
+    AttendanceMembership = apps.get_model('regulations', 'AttendanceMembership')
+    MembershipPeriod = apps.get_model('regulations', 'MembershipPeriod')
+    periods = []
+    last = None
+    memberships = AttendanceMembership.objects.order_by('teacher_id', 'joined_on', 'id')
+    for membership in memberships.iterator():
+        valid_from = membership.joined_on.date()
+        if last is not None and last.teacher_id == membership.teacher_id:
+            if last.valid_from == valid_from:
+                periods.pop()
+            else:
+                last.valid_to = valid_from - timedelta(days=1)
+
+        last = MembershipPeriod(
+            teacher_id=membership.teacher_id,
+            membership_id=membership.id,
+            rule_id=membership.rule_id,
+            valid_from=valid_from
+        )
+        periods.append(last)
+
+    MembershipPeriod.objects.bulk_create(periods, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teachers', '0005_teacherimage_thumbnail'),
+        ('regulations', '0016_attendance_check_uniqueness'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MembershipPeriod',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('valid_from', models.DateField()),
+                ('valid_to', models.DateField(blank=True, null=True)),
+                ('membership', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='period', to='regulations.AttendanceMembership')),
+                ('rule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='regulations.AttendanceRule')),
+                ('teacher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='membership_periods', to='teachers.TeacherProfile')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='membershipperiod',
+            index=models.Index(fields=['teacher', 'valid_from'], name='regulations_teacher_0ad91f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='membershipperiod',
+            index=models.Index(fields=['valid_from', 'valid_to'], name='regulations_valid_f_db7aba_idx'),
+        ),
+        migrations.RunPython(create_membership_periods, migrations.RunPython.noop),
+    ]
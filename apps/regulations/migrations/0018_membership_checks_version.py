@@ -0,0 +1,18 @@
+# Generated by Django 2.2 on 2026-10-18 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('regulations', '0017_membership_periods'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendancemembership',
+            name='checks_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
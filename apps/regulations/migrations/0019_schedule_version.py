@@ -0,0 +1,20 @@
+# Generated by Django 2.2 on 2026-10-18 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('regulations', '0018_membership_checks_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
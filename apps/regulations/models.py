@@ -1,6 +1,12 @@
+import uuid
+from datetime import datetime
+
 from django.db import models
+from django.db.models import F
 from ..teachers.models import TeacherProfile
 from ..core.models import TimeStampedModel
+from ..core.thumbnails import thumbnail_path
+from .photos import store_uploaded_photo
 
 
 class AttendancePlace(TimeStampedModel):
@@ -27,6 +33,12 @@ class AttendancePlace(TimeStampedModel):
         default=100
     )
 
+    # JSON list of [latitude, longitude] vertices, the place is this polygon instead of a circle
+    polygon = models.TextField(
+        null=True,
+        blank=True
+    )
+
 
 class TimeSlot(models.Model):
 
@@ -83,6 +95,13 @@ class AttendanceRule(TimeStampedModel):
         blank=True
     )
 
+    # more places checked in at the right place, see `geofence`
+    zones = models.ManyToManyField(
+        AttendancePlace,
+        blank=True,
+        related_name='zone_rules'
+    )
+
     mon = models.ForeignKey(
         AttendanceTime,
         on_delete=models.SET_NULL,
@@ -140,6 +159,27 @@ class AttendanceRule(TimeStampedModel):
     )
 
 
+class ScheduleVersion(models.Model):
+    """Attendance schedules version
+
+    Single row counter incremented whenever a rule or what it is made of
+    changes, so every process on every node compiles its schedules again,
+    see `apps.regulations.schedules`
+    """
+    version = models.PositiveIntegerField(
+        default=0
+    )
+
+    @classmethod
+    def get_version(cls):
+        return cls.objects.filter(id=1).values_list('version', flat=True).first() or 0
+
+    @classmethod
+    def bump(cls):
+        if not cls.objects.filter(id=1).update(version=F('version') + 1):
+            cls.objects.get_or_create(id=1, defaults={'version': 1})
+
+
 class AttendanceMembership(models.Model):
 
     teacher = models.ForeignKey(
@@ -157,9 +197,62 @@ class AttendanceMembership(models.Model):
         auto_now_add=True
     )
 
+    # incremented whenever a check of the membership changes, see `status`
+    checks_version = models.PositiveIntegerField(
+        default=0
+    )
+
     def __str__(self):
         return f"{self.teacher.user.name}'s' - {self.rule.name}"
 
+    def save(self, *args, **kwargs):
+        # an instance loaded before a check-in must not move the version back
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'checks_version'
+            ]
+
+        super().save(*args, **kwargs)
+
+
+class MembershipPeriod(models.Model):
+    """Days on which an attendance membership is the teacher's latest one
+
+    Derived from the memberships, see `apps.regulations.memberships`.
+    """
+
+    teacher = models.ForeignKey(
+        TeacherProfile,
+        on_delete=models.CASCADE,
+        related_name='membership_periods'
+    )
+
+    membership = models.OneToOneField(
+        AttendanceMembership,
+        on_delete=models.CASCADE,
+        related_name='period'
+    )
+
+    rule = models.ForeignKey(
+        AttendanceRule,
+        on_delete=models.CASCADE
+    )
+
+    valid_from = models.DateField()
+
+    # empty while the membership is the current one
+    valid_to = models.DateField(
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['teacher', 'valid_from']),
+            models.Index(fields=['valid_from', 'valid_to']),
+        ]
+
 
 class UnAttendanceMembership(models.Model):
 
@@ -200,7 +293,7 @@ class AttendanceEvent(models.Model):
 def attendance_image_path(instance, filename):
     year = instance.identified_on.year
     month = instance.identified_on.month
-    day = instance.identified_on.month
+    day = instance.identified_on.day
     return f"{year}/{month}/{day}/{filename}"
 
 
@@ -235,6 +328,13 @@ class AttendanceHistory(models.Model):
 
     image = models.ImageField(upload_to=attendance_image_path)
 
+    # rendered by `make_attendance_thumbnail` once the history is created
+    thumbnail = models.ImageField(
+        upload_to=thumbnail_path,
+        null=True,
+        blank=True
+    )
+
     longitude = models.DecimalField(
         max_digits=20,
         decimal_places=10,
@@ -263,6 +363,157 @@ class AttendanceHistory(models.Model):
         blank=True
     )
 
+    # set when the check was made from a shared kiosk device
+    device_id = models.CharField(
+        max_length=100,
+        null=True,
+        blank=True
+    )
+
+    # date of `identified_on`, a window of a slot is checked once a day. Left empty
+    # for the checks restored from the archive and the duplicates made before
+    identified_date = models.DateField(
+        null=True,
+        blank=True
+    )
+
+    # `Idempotency-Key` header of the check-in request, a retry gets this check back
+    idempotency_key = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['membership', 'time_slot', 'is_open_attend', 'identified_date'],
+                name='unique_attendance_check'
+            ),
+            models.UniqueConstraint(
+                fields=['membership', 'idempotency_key'],
+                name='unique_attendance_idempotency_key'
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        # a new photo is stored re-encoded under its content hash, see `photos`
+        if self.image and not self.image._committed:
+            self.image = store_uploaded_photo(self.image)
+
+        if self._state.adding and self.identified_date is None:
+            self.identified_date = (self.identified_on or datetime.now()).date()
+
+        super().save(*args, **kwargs)
+
+        # the checks of the day are cached for the status screen
+        from .status import invalidate_day_checks
+
+        invalidate_day_checks(self.membership_id)
+
+    def delete(self, *args, **kwargs):
+        from .status import invalidate_day_checks
+
+        ret = super().delete(*args, **kwargs)
+        invalidate_day_checks(self.membership_id)
+        return ret
+
+
+class AttendanceTicket(TimeStampedModel):
+    """Asynchronous check-in
+
+    The cheap checks are done when the photo is uploaded; face verification
+    and the history creation run in the `attendance` Celery queue.
+    """
+    STATUS_PENDING = 'P'
+    STATUS_SUCCEEDED = 'S'
+    STATUS_FAILED = 'F'
+    STATUS = (
+        (STATUS_PENDING, '处理中'),
+        (STATUS_SUCCEEDED, '成功'),
+        (STATUS_FAILED, '失败'),
+    )
+
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+
+    membership = models.ForeignKey(
+        AttendanceMembership,
+        on_delete=models.CASCADE,
+        related_name='tickets'
+    )
+
+    time_slot = models.ForeignKey(
+        TimeSlot,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True
+    )
+
+    is_open_attend = models.BooleanField(
+        default=True
+    )
+
+    is_bad_attendance = models.BooleanField(
+        default=False
+    )
+
+    # time of the upload, the history keeps it instead of the processing time
+    identified_on = models.DateTimeField(
+        auto_now_add=True
+    )
+
+    image = models.ImageField(upload_to=attendance_image_path)
+
+    longitude = models.DecimalField(
+        max_digits=20,
+        decimal_places=10,
+        null=True,
+        blank=True
+    )
+
+    latitude = models.DecimalField(
+        max_digits=20,
+        decimal_places=10,
+        null=True,
+        blank=True
+    )
+
+    imei = models.CharField(
+        max_length=100,
+        null=True,
+        blank=True
+    )
+
+    status = models.CharField(
+        max_length=1,
+        choices=STATUS,
+        default=STATUS_PENDING
+    )
+
+    msg = models.CharField(
+        max_length=200,
+        blank=True,
+        default=''
+    )
+
+    history = models.OneToOneField(
+        AttendanceHistory,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='ticket'
+    )
+
+    def save(self, *args, **kwargs):
+        if self.image and not self.image._committed:
+            self.image = store_uploaded_photo(self.image)
+
+        super().save(*args, **kwargs)
+
 
 class AttendanceDatePerson(models.Model):
 
@@ -284,3 +535,122 @@ class AttendanceDatePerson(models.Model):
     outside_checks = models.PositiveIntegerField()
 
     holidays = models.PositiveIntegerField()
+
+
+def archive_bundle_path(instance, filename):
+    return f"archive/attendance/{filename}"
+
+
+class AttendanceArchive(TimeStampedModel):
+    """Photos of the check-ins of one month moved out of the history by one archival run
+
+    See `apps.regulations.archive`.
+    """
+    month = models.DateField()
+
+    # zip file of the photos, stored under their names in the storage
+    bundle = models.FileField(
+        upload_to=archive_bundle_path
+    )
+
+    photos = models.PositiveIntegerField(
+        default=0
+    )
+
+    size = models.BigIntegerField(
+        default=0
+    )
+
+
+class ArchivedAttendanceHistory(models.Model):
+    """Check-in moved out of `AttendanceHistory`, with the same id"""
+
+    id = models.PositiveIntegerField(
+        primary_key=True
+    )
+
+    archive = models.ForeignKey(
+        AttendanceArchive,
+        on_delete=models.PROTECT,
+        related_name='histories'
+    )
+
+    # restores look the check-ins up by teacher and month
+    teacher = models.ForeignKey(
+        TeacherProfile,
+        on_delete=models.CASCADE,
+        related_name='archived_attendance_history'
+    )
+
+    membership = models.ForeignKey(
+        AttendanceMembership,
+        on_delete=models.CASCADE,
+        related_name='archived_history'
+    )
+
+    time_slot = models.ForeignKey(
+        TimeSlot,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True
+    )
+
+    is_open_attend = models.BooleanField(
+        default=True
+    )
+
+    is_bad_attendance = models.BooleanField(
+        default=False
+    )
+
+    identified_on = models.DateTimeField()
+
+    # name of the photo in the storage and in the bundle
+    image = models.CharField(
+        max_length=100
+    )
+
+    longitude = models.DecimalField(
+        max_digits=20,
+        decimal_places=10,
+        null=True,
+        blank=True
+    )
+
+    latitude = models.DecimalField(
+        max_digits=20,
+        decimal_places=10,
+        null=True,
+        blank=True
+    )
+
+    is_right_place = models.BooleanField(
+        default=True
+    )
+
+    address = models.TextField(
+        null=True,
+        blank=True
+    )
+
+    description = models.TextField(
+        null=True,
+        blank=True
+    )
+
+    device_id = models.CharField(
+        max_length=100,
+        null=True,
+        blank=True
+    )
+
+    # set while a copy is restored to the history
+    restored_on = models.DateTimeField(
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['teacher', 'identified_on']),
+        ]
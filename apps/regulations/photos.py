@@ -0,0 +1,80 @@
+"""
+Storage of check-in photos
+
+Photos are re-encoded as JPEG of bounded size and quality, with the EXIF
+orientation applied and the metadata dropped, and stored under the sha256 of
+the stored bytes in two levels of 256 directories:
+
+    attendance/3f/a2/3fa2...c9.jpg
+
+The same photo sent twice is stored once, so a file may be referenced by a
+ticket and its history, or by several histories. It must not be deleted
+while a row still references it.
+"""
+import hashlib
+import io
+import re
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+
+PHOTO_ROOT = 'attendance'
+
+PHOTO_NAME = re.compile(rf'^{PHOTO_ROOT}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/[0-9a-f]{{64}}\.jpg$')
+
+
+def photo_path(content_hash):
+    return f"{PHOTO_ROOT}/{content_hash[:2]}/{content_hash[2:4]}/{content_hash}.jpg"
+
+
+def is_stored_photo(name):
+    """
+    Whether the file name is already in the content-addressed layout
+    """
+    return bool(PHOTO_NAME.match(name or ''))
+
+
+def reencode_photo(image_bytes, max_dimension=None, quality=None):
+    """
+    Return the photo as a JPEG no larger than `max_dimension`
+
+    The photo is always re-encoded, even when the original is a smaller JPEG,
+    so its EXIF block with the GPS position never reaches the storage.
+    """
+    max_dimension = max_dimension or settings.ATTENDANCE_PHOTO['MAX_DIMENSION']
+    quality = quality or settings.ATTENDANCE_PHOTO['QUALITY']
+
+    image = Image.open(io.BytesIO(image_bytes))
+    # JPEG decoders scale down by 1/2, 1/4 or 1/8 while decoding
+    image.draft('RGB', (max_dimension, max_dimension))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    image.thumbnail((max_dimension, max_dimension), Image.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def store_photo(image_bytes):
+    """
+    Re-encode and store the photo, return its name in the storage
+    """
+    photo_bytes = reencode_photo(image_bytes)
+    name = photo_path(hashlib.sha256(photo_bytes).hexdigest())
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(photo_bytes))
+
+    return name
+
+
+def store_uploaded_photo(file):
+    """
+    `store_photo` for the image of a model which is not saved to the storage yet
+    """
+    file.seek(0)
+    return store_photo(file.read())
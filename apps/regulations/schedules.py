@@ -0,0 +1,207 @@
+"""
+Compiled attendance schedules
+
+A `Schedule` is the read-only form of an `AttendanceRule` which check-ins are
+validated against: per weekday the time slots of its `AttendanceTime` with
+their check windows in time order, its non-attendance events merged into
+sorted date ranges and its `Geofence`. Each process compiles a rule once and
+keeps it while the `ScheduleVersion` is unchanged. The version is incremented
+in the database whenever a rule, time, slot, event or place is saved or
+deleted on any node, see `signals`.
+"""
+import threading
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import timedelta
+
+from django.db.models import Q
+
+from . import exceptions as e
+from .geofence import Geofence
+from .models import AttendanceEvent, AttendancePlace, AttendanceRule, AttendanceTime, ScheduleVersion
+
+WEEK_DAYS = ('mon', 'tue', 'wed', 'thr', 'fri', 'sat', 'sun')
+
+# the fields of a `TimeSlot`, so the helpers take either
+Slot = namedtuple('Slot', [
+    'id', 'open_time', 'start_open_time', 'finish_open_time', 'close_time', 'start_close_time', 'finish_close_time'
+])
+
+Window = namedtuple('Window', ['start_time', 'finish_time', 'slot', 'is_open_attend'])
+
+
+class DaySchedule(namedtuple('DaySchedule', ['time_id', 'slots', 'windows'])):
+    """
+    Slots of the `AttendanceTime` of a weekday, ordered by their open time,
+    and their open and close check windows ordered by start
+    """
+    __slots__ = ()
+
+    @property
+    def slot_ids(self):
+        return frozenset(slot.id for slot in self.slots)
+
+
+class DateRanges:
+    """
+    Date ranges merged into sorted, disjoint ranges, a day is looked up by bisection
+    """
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self, ranges=()):
+        merged = []
+        for start, end in sorted(ranges):
+            if end < start:
+                continue
+
+            # ranges which overlap or touch make one
+            if merged and start <= merged[-1][1] + timedelta(days=1):
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+
+        self.starts = tuple(start for start, _ in merged)
+        self.ends = tuple(end for _, end in merged)
+
+    def __contains__(self, day):
+        index = bisect_right(self.starts, day) - 1
+        return index >= 0 and day <= self.ends[index]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+    def days_outside(self, start, end):
+        """
+        Yield the days from `start` to `end` which are in no range
+        """
+        index = bisect_left(self.ends, start)
+        day = start
+        while day <= end:
+            if index < len(self.starts) and self.starts[index] <= day:
+                day = self.ends[index] + timedelta(days=1)
+                index += 1
+                continue
+
+            yield day
+            day += timedelta(days=1)
+
+
+class Schedule(namedtuple('Schedule', ['rule_id', 'days', 'holidays', 'geofence'])):
+    """
+    `days` holds a `DaySchedule` or None per weekday from Monday, `holidays`
+    the `DateRanges` of the non-attendance events and `geofence` the places
+    of the rule
+    """
+    __slots__ = ()
+
+    def is_attendance_day(self, day):
+        return self.days[day.weekday()] is not None and day not in self.holidays
+
+    def get_day(self, day):
+        """
+        Return the `DaySchedule` of the day
+
+        Raise NO_ATTENDANCE_DAY when nobody needs to attend that day.
+        """
+        if not self.is_attendance_day(day):
+            raise e.NO_ATTENDANCE_DAY
+
+        return self.days[day.weekday()]
+
+    def working_days(self, start, end):
+        """
+        Yield the attendance days from `start` to `end`, both included
+        """
+        for day in self.holidays.days_outside(start, end):
+            if self.days[day.weekday()] is not None:
+                yield day
+
+
+def compile_day(slots):
+    slots = tuple(sorted(slots, key=lambda slot: (slot.start_open_time, slot.id)))
+    windows = []
+    for slot in slots:
+        windows.append(Window(slot.start_open_time, slot.finish_open_time, slot, True))
+        windows.append(Window(slot.start_close_time, slot.finish_close_time, slot, False))
+
+    windows.sort(key=lambda window: window.start_time)
+    return slots, tuple(windows)
+
+
+def compile_schedule(rule_id):
+    """
+    Load the rule, its times, slots, events and places in four queries
+    """
+    place_id, *time_ids = AttendanceRule.objects.values_list(
+        'attendance_place_id', *(f'{name}_id' for name in WEEK_DAYS)
+    ).get(id=rule_id)
+
+    slots = {}
+    through = AttendanceTime.slots.through.objects.filter(
+        attendancetime_id__in=set(filter(None, time_ids))
+    ).select_related('timeslot')
+    for row in through:
+        slots.setdefault(row.attendancetime_id, []).append(
+            Slot(**{field: getattr(row.timeslot, field) for field in Slot._fields})
+        )
+
+    compiled = {time_id: DaySchedule(time_id, *compile_day(slots.get(time_id, ()))) for time_id in set(time_ids)}
+    days = tuple(compiled[time_id] if time_id else None for time_id in time_ids)
+
+    events = AttendanceEvent.objects.filter(rule_id=rule_id, is_attendance_day=False)
+    holidays = DateRanges(events.values_list('start_date', 'end_date'))
+
+    places = AttendancePlace.objects.filter(Q(id=place_id) | Q(zone_rules=rule_id)).distinct()
+    geofence = Geofence.from_places(places)
+
+    return Schedule(rule_id, days, holidays, geofence)
+
+
+class ScheduleCache:
+    """
+    Compiled schedules of the rules used by this process
+    """
+
+    def __init__(self):
+        self._schedules = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, rule_id):
+        version = ScheduleVersion.get_version()
+        with self._lock:
+            if version != self._version:
+                self._schedules = {}
+                self._version = version
+
+            schedule = self._schedules.get(rule_id)
+
+        if schedule is None:
+            schedule = compile_schedule(rule_id)
+            with self._lock:
+                if version == self._version:
+                    self._schedules[rule_id] = schedule
+
+        return schedule
+
+    def clear(self):
+        with self._lock:
+            self._schedules = {}
+            self._version = None
+
+
+schedule_cache = ScheduleCache()
+
+
+def get_schedule(rule_id):
+    return schedule_cache.get(rule_id)
+
+
+def invalidate_schedules():
+    """
+    Make every process compile its schedules again
+    """
+    ScheduleVersion.bump()
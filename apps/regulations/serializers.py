@@ -1,23 +1,127 @@
-import os
-
-import face_recognition
-import numpy as np
 from datetime import date, datetime
 from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.shortcuts import get_object_or_404
-from geopy import distance
 from itertools import islice
 from rest_framework import serializers
 
 from . import models as m
 from . import exceptions as e
-from .helpers import get_week_day
+from .helpers import find_time_slot, get_check_place, get_day_rule, is_bad_attendance, is_right_place
+from .geofence import parse_polygon
+from .memberships import current_period, refresh_membership_periods
+from .schedules import invalidate_schedules
 from ..teachers.serializers import ShortTeacherProfileSerializer
-from ..core.serializers import Base64ImageField
+from ..core.serializers import Base64ImageField, TMSChoiceField
 
 
 batch_size = 100
 
+# Maximum distance between two encodings of the same face
+FACE_TOLERANCE = 0.5
+
+
+def encode_query_face(image, timings=None):
+    """
+    Return the encoding of the only face in the photo, see `encode_faces` for `timings`
+    """
+    from ..teachers.inference import InferenceError, encode_faces
+
+    try:
+        face_locations, encodings = encode_faces(image, timings)
+    except InferenceError:
+        raise e.FACE_RECOGNITION_BUSY('Face inference unavailable')
+
+    if len(face_locations) != 1:
+        raise e.FACE_DETECTION_FAILED('No face in the photo')
+
+    return encodings[0]
+
+
+def validate_attendance_rule(data, current_time):
+    """
+    Check the time slot against today's rule and flag a check out of its window
+    """
+    membership = data['membership']
+    time_slot = data['time_slot']
+    day_rule = get_day_rule(membership.rule_id, date.today())
+
+    # check whether day rule has time slots
+    if time_slot is None or time_slot.id not in day_rule.slot_ids:
+        raise e.TIMESLOT_MISSING
+
+    # check whether it is in range of attendable time
+    if is_bad_attendance(time_slot, data['is_open_attend'], current_time):
+        data['is_bad_attendance'] = True
+
+    check_duplicate_attendance(membership, time_slot.id, data['is_open_attend'], date.today())
+    return data
+
+
+def check_duplicate_attendance(membership, time_slot_id, is_open_attend, day):
+    """
+    Raise ATTENDANCE_DUPLICATED with the check when the window is already checked on the day
+    """
+    history = m.AttendanceHistory.objects.filter(
+        membership=membership, time_slot_id=time_slot_id, is_open_attend=is_open_attend, identified_date=day
+    ).first()
+    if history is not None:
+        raise e.ATTENDANCE_DUPLICATED(history)
+
+
+def create_attendance_history(validated_data):
+    """
+    Create the check, or raise ATTENDANCE_DUPLICATED with the concurrent request's one
+    """
+    try:
+        with transaction.atomic():
+            return m.AttendanceHistory.objects.create(**validated_data)
+    except IntegrityError:
+        membership = validated_data['membership']
+        history = None
+        if validated_data.get('idempotency_key'):
+            history = m.AttendanceHistory.objects.filter(
+                membership=membership, idempotency_key=validated_data['idempotency_key']
+            ).first()
+
+        if history is None and validated_data.get('time_slot') is not None:
+            history = m.AttendanceHistory.objects.filter(
+                membership=membership, time_slot=validated_data['time_slot'],
+                is_open_attend=validated_data.get('is_open_attend', True), identified_date=date.today()
+            ).first()
+
+        if history is None:
+            raise
+
+        raise e.ATTENDANCE_DUPLICATED(history)
+
+
+def verify_attendance_face(user, image):
+    """
+    Check that the face in the photo is the user's
+    """
+    match_attendance_face(user, encode_query_face(image))
+
+
+def match_attendance_face(user, query_encoding):
+    """
+    Check that the encoding is close to most of the user's enrolled encodings
+    """
+    from ..teachers.features import count_matches, feature_cache
+
+    encodings = feature_cache.get(user.profile)
+    if encodings is None or len(encodings) == 0:
+        raise e.FACE_RECOGNITION_NO_DATASET('No dataset')
+
+    matches_count, total = count_matches(encodings, query_encoding, FACE_TOLERANCE)
+    if matches_count <= total // 2:
+        raise e.FACE_RECOGNITION_FAILED('Failed recognition')
+
+
+def check_attendance_imei(user, imei):
+    if user.imei is not None and imei is not None and user.imei != imei:
+        raise e.FACE_RECOGNITION_IMEI_NOT_MATCH('Imei not match')
+
 
 class AttendancePlaceNameSerializer(serializers.ModelSerializer):
 
@@ -43,6 +147,15 @@ class AttendancePlaceSerializer(serializers.ModelSerializer):
         model = m.AttendancePlace
         fields = '__all__'
 
+    def validate_polygon(self, value):
+        if value:
+            try:
+                parse_polygon(value)
+            except ValueError as exc:
+                raise serializers.ValidationError(str(exc))
+
+        return value or None
+
 
 class ShortTimeSlotSerializer(serializers.ModelSerializer):
 
@@ -189,7 +302,9 @@ class AttendanceRuleSerializer(serializers.ModelSerializer):
         nonattendees = self.context.get('nonattendees', [])
         events = self.context.get('events', [])
 
+        zones = validated_data.pop('zones', [])
         attendance_rule = m.AttendanceRule.objects.create(**validated_data)
+        attendance_rule.zones.set(zones)
 
         # create attendees
         attendees = m.TeacherProfile.objects.filter(id__in=attendees)
@@ -200,6 +315,8 @@ class AttendanceRuleSerializer(serializers.ModelSerializer):
                 break
             m.AttendanceMembership.objects.bulk_create(batch, batch_size)
 
+        refresh_membership_periods(attendees.values_list('id', flat=True))
+
         # create nonattendees
         nonattendees = m.TeacherProfile.objects.filter(id__in=nonattendees)
         objs = (m.UnAttendanceMembership(teacher=teacher, rule=attendance_rule) for teacher in nonattendees)
@@ -219,6 +336,8 @@ class AttendanceRuleSerializer(serializers.ModelSerializer):
             if not batch:
                 break
             m.AttendanceEvent.objects.bulk_create(batch, batch_size)
+
+        invalidate_schedules()
         return attendance_rule
 
     def update(self, instance, validated_data):
@@ -226,10 +345,13 @@ class AttendanceRuleSerializer(serializers.ModelSerializer):
         nonattendees = self.context.get('nonattendees', [])
         events = self.context.get('events', [])
 
+        zones = validated_data.pop('zones', None)
         for key, value in validated_data.items():
             setattr(instance, key, value)
 
         instance.save()
+        if zones is not None:
+            instance.zones.set(zones)
 
         # update attendees
         old_attendees_ids = set(instance.attendees.values_list('id', flat=True))
@@ -246,6 +368,8 @@ class AttendanceRuleSerializer(serializers.ModelSerializer):
                 break
             m.AttendanceMembership.objects.bulk_create(batch, batch_size)
 
+        refresh_membership_periods(new_attendees.values_list('id', flat=True))
+
         # update nonattendees
         old_non_attendees_ids = set(instance.nonattendees.values_list('id', flat=True))
         new_non_attendees_ids = set(nonattendees)
@@ -279,6 +403,7 @@ class AttendanceRuleSerializer(serializers.ModelSerializer):
                 break
             m.AttendanceEvent.objects.bulk_create(batch, batch_size)
 
+        invalidate_schedules()
         return instance
 
 
@@ -353,11 +478,12 @@ class AttendanceRuleDetailSerializer(serializers.ModelSerializer):
     nonattendees = ShortTeacherProfileSerializer(many=True)
     events = serializers.SerializerMethodField()
     attendance_place = AttendancePlaceNameSerializer()
+    zones = AttendancePlaceNameSerializer(many=True)
 
     class Meta:
         model = m.AttendanceRule
         fields = (
-            'id', 'name', 'attendees', 'nonattendees', 'attendance_place', 'week', 'events'
+            'id', 'name', 'attendees', 'nonattendees', 'attendance_place', 'zones', 'week', 'events'
         )
 
     def get_events(self, instance):
@@ -372,6 +498,9 @@ class AttendanceHistorySerializer(serializers.ModelSerializer):
     class Meta:
         model = m.AttendanceHistory
         fields = '__all__'
+        read_only_fields = (
+            'thumbnail', 'identified_date', 'idempotency_key',
+        )
 
 
 class AttendSerializer(serializers.ModelSerializer):
@@ -382,93 +511,125 @@ class AttendSerializer(serializers.ModelSerializer):
     class Meta:
         model = m.AttendanceHistory
         fields = '__all__'
+        read_only_fields = (
+            'thumbnail', 'identified_date', 'idempotency_key',
+        )
 
     def create(self, validated_data):
-        attendance_place = validated_data['membership'].rule.attendance_place
-        if attendance_place:
-            distance_delta = distance.distance((attendance_place.latitude, attendance_place.longitude),
-                                               (validated_data['latitude'], validated_data['longitude'])).m
-            if distance_delta > attendance_place.radius:
-                validated_data['is_right_place'] = False
+        if not is_right_place(
+            validated_data['membership'].rule_id, validated_data.get('latitude'), validated_data.get('longitude')
+        ):
+            validated_data['is_right_place'] = False
 
-        return m.AttendanceHistory.objects.create(**validated_data)
+        return create_attendance_history(validated_data)
 
     def validate(self, data):
         # Rule validations
-        today = date.today()
-        membership = data['membership']
-        time_slot = data['time_slot']
-        if membership.rule.events.filter(
-            is_attendance_day=False, start_date__gte=today, end_date__lte=today
-        ).exists():
-            raise e.NO_ATTENDANCE_DAY
-
-        # check day attendance rule
-        day_rule = get_week_day(membership.rule, today.weekday())
-        if not day_rule:
-            raise e.NO_ATTENDANCE_DAY
-
-        # check whether day rule has time slots
-        if time_slot not in day_rule.slots.all():
-            raise e.TIMESLOT_MISSING
-
-        # check whether it is in range of attendable time
-        current_time = datetime.now().time()
-
-        if data['is_open_attend']:
-            attendance_time = time_slot.open_time
-            attendance_start_time = time_slot.start_open_time
-            attendance_end_time = time_slot.finish_open_time
-        else:
-            attendance_time = time_slot.close_time
-            attendance_start_time = time_slot.start_close_time
-            attendance_end_time = time_slot.finish_close_time
-
-        if current_time < attendance_start_time or current_time > attendance_end_time:
-            raise e.OUT_OF_ATTENDANCE_TIME
-
-        if (current_time > attendance_time and data['is_open_attend']) or\
-           (current_time < attendance_time and not data['is_open_attend']):
-            data['is_bad_attendance'] = True
+        data = validate_attendance_rule(data, datetime.now().time())
 
         # TODO OR NOT: Right now I am not sure whether this validation is needed or no.
         # Filtering duplicate attendance request
 
         # face validations
-        query_image = face_recognition.load_image_file(data['image'])
-        face_locations = face_recognition.face_locations(query_image, model="hog")
-        if len(face_locations) != 1:
-            raise e.FACE_DETECTION_FAILED('No face in the photo')
-
-        query_encoding = face_recognition.face_encodings(query_image, face_locations)[0]
         user = self.context.get('user')
-        username = user.username
-        file_name = os.path.join(settings.FEATURE_ROOT, f"{username}.txt")
-        if not os.path.exists(file_name):
-            raise e.FACE_RECOGNITION_NO_DATASET('No dataset')
+        verify_attendance_face(user, data['image'])
 
-        encodings = np.loadtxt(file_name)
-        if len(encodings) == 0:
-            raise e.FACE_RECOGNITION_NO_DATASET('No dataset')
+        # imei validation
+        check_attendance_imei(user, self.context.get('imei', None))
+        return data
 
-        if encodings.ndim == 1:
-            encodings = [encodings]
+    def to_representation(self, instance):
+        ret = super().to_representation(instance)
+        place = get_check_place(instance.membership.rule, instance.latitude, instance.longitude)
+        ret["place"] = place.address if place is not None else None
+        return ret
 
-        matches = face_recognition.compare_faces(encodings, query_encoding, tolerance=0.5)
-        matches_count = matches.count(True)
-        if matches_count <= len(matches) // 2:
-            raise e.FACE_RECOGNITION_FAILED('Failed recognition')
 
-        # imei validation
-        imei = self.context.get('imei', None)
-        if user.imei is not None and imei is not None and user.imei != imei:
-            raise e.FACE_RECOGNITION_IMEI_NOT_MATCH('Imei not match')
+class AttendTicketSerializer(serializers.ModelSerializer):
+    """
+    Check-in whose face verification runs in the background
+    """
+    image = Base64ImageField(write_only=True)
+    identified_on = serializers.DateTimeField(format='%H:%M:%S', read_only=True)
+    status = TMSChoiceField(m.AttendanceTicket.STATUS, read_only=True)
 
+    class Meta:
+        model = m.AttendanceTicket
+        fields = (
+            'id', 'membership', 'time_slot', 'is_open_attend', 'is_bad_attendance', 'identified_on',
+            'image', 'longitude', 'latitude', 'status', 'msg', 'history',
+        )
+        read_only_fields = (
+            'is_bad_attendance', 'msg', 'history',
+        )
+
+    def validate(self, data):
+        # only the cheap checks, the face is verified by the worker
+        data = validate_attendance_rule(data, datetime.now().time())
+        imei = self.context.get('imei', None)
+        check_attendance_imei(self.context.get('user'), imei)
+        data['imei'] = imei
         return data
 
     def to_representation(self, instance):
         ret = super().to_representation(instance)
-        ret["place"] = instance.membership.rule.attendance_place.address
+        if instance.history is not None:
+            ret['history'] = AttendSerializer(instance.history, context=self.context).data
+
+        return ret
+
+
+class KioskAttendSerializer(serializers.Serializer):
+    """
+    Check-in from a shared device, the teacher is identified from the photo alone
+    """
+    image = Base64ImageField()
+    device_id = serializers.CharField(max_length=100)
+    longitude = serializers.DecimalField(max_digits=20, decimal_places=10)
+    latitude = serializers.DecimalField(max_digits=20, decimal_places=10)
+
+    def validate(self, data):
+        from ..teachers.gallery import get_gallery
+
+        # face identification
+        query_encoding = encode_query_face(data['image'])
+        candidates = [
+            match for match in get_gallery().identify(query_encoding, k=3, tolerance=FACE_TOLERANCE)
+            if match.matches > match.total // 2
+        ]
+        if not candidates:
+            raise e.FACE_RECOGNITION_FAILED('Failed recognition')
+
+        teacher_id = max(candidates, key=lambda match: (match.matches / match.total, -match.distance)).teacher_id
+
+        period = current_period(teacher_id, 'membership__teacher__user', 'membership__rule__attendance_place')
+        if period is None:
+            raise e.NO_ATTENDANCE_MEMBERSHIP('No attendance membership')
+
+        membership = period.membership
+
+        # Rule validations
+        today = date.today()
+        current_time = datetime.now().time()
+        day_rule = get_day_rule(membership.rule_id, today)
+        time_slot, is_open_attend = find_time_slot(day_rule, current_time)
+
+        data['membership'] = membership
+        data['time_slot'] = m.TimeSlot(**time_slot._asdict())
+        data['is_open_attend'] = is_open_attend
+        data['is_bad_attendance'] = is_bad_attendance(time_slot, is_open_attend, current_time)
+        check_duplicate_attendance(membership, time_slot.id, is_open_attend, today)
+        return data
+
+    def create(self, validated_data):
+        validated_data['is_right_place'] = is_right_place(
+            validated_data['membership'].rule_id, validated_data['latitude'], validated_data['longitude']
+        )
+        return create_attendance_history(validated_data)
+
+    def to_representation(self, instance):
+        ret = AttendSerializer(instance, context=self.context).data
+        ret['name'] = instance.membership.teacher.user.name
         return ret
 
 
@@ -543,6 +704,7 @@ class AttendanceDailyHistorySerializer(serializers.Serializer):
     name = serializers.CharField(source='user__name')
     identified_on = serializers.DateTimeField(format='%H:%M:%S')
     image = serializers.CharField()
+    thumbnail = serializers.CharField()
     is_right_place = serializers.BooleanField()
     is_bad_attendance = serializers.BooleanField()
 
@@ -552,6 +714,9 @@ class AttendanceDailyHistorySerializer(serializers.Serializer):
         if ret['image'] and request:
             ret['image'] = request.build_absolute_uri(settings.MEDIA_URL + ret['image'])
 
+        if ret['thumbnail'] and request:
+            ret['thumbnail'] = request.build_absolute_uri(settings.MEDIA_URL + ret['thumbnail'])
+
         return ret
 
 
@@ -0,0 +1,43 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .memberships import refresh_membership_periods
+from .models import AttendanceEvent, AttendanceMembership, AttendancePlace, AttendanceRule, AttendanceTime, TimeSlot
+from .schedules import invalidate_schedules
+
+
+def invalidate_schedules_receiver(sender, action=None, **kwargs):
+    # `m2m_changed` is sent before and after the change
+    if action is None or action.startswith('post_'):
+        invalidate_schedules()
+
+
+def refresh_membership_periods_receiver(sender, instance, **kwargs):
+    refresh_membership_periods([instance.teacher_id])
+
+
+def connect_signals():
+    """
+    Compile the attendance schedules again when what they are made of changes
+
+    Events created with `bulk_create` send no signal, their callers invalidate
+    the schedules themselves. The same goes for the membership periods.
+    """
+    for model in (AttendanceRule, AttendanceTime, TimeSlot, AttendanceEvent, AttendancePlace):
+        post_save.connect(invalidate_schedules_receiver, sender=model, dispatch_uid=f'schedules_save_{model.__name__}')
+        post_delete.connect(
+            invalidate_schedules_receiver, sender=model, dispatch_uid=f'schedules_delete_{model.__name__}'
+        )
+
+    m2m_changed.connect(
+        invalidate_schedules_receiver, sender=AttendanceTime.slots.through, dispatch_uid='schedules_time_slots'
+    )
+    m2m_changed.connect(
+        invalidate_schedules_receiver, sender=AttendanceRule.zones.through, dispatch_uid='schedules_rule_zones'
+    )
+
+    post_save.connect(
+        refresh_membership_periods_receiver, sender=AttendanceMembership, dispatch_uid='membership_periods_save'
+    )
+    post_delete.connect(
+        refresh_membership_periods_receiver, sender=AttendanceMembership, dispatch_uid='membership_periods_delete'
+    )
@@ -0,0 +1,49 @@
+"""
+Checks of a teacher's day for the attendance status screen
+
+The app polls the status, so the serialized checks of a membership and day
+are fetched in one query and kept in the `ATTENDANCE_STATUS_CACHE` of each
+process, under the membership's `checks_version`. Saving a history of the
+membership increments the version in the database, which makes every
+process on every node fetch them again. Code that updates histories with
+`QuerySet.update` calls `invalidate_day_checks` itself.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+
+from .models import AttendanceHistory, AttendanceMembership
+
+
+def get_day_checks(membership, day, request):
+    """
+    Return the serialized last open and close check of each slot, by (slot id, is_open_attend)
+
+    `membership` is expected with its rule and attendance place, loaded with
+    the request so its `checks_version` is current.
+    """
+    from .serializers import AttendSerializer
+
+    cache = caches[settings.ATTENDANCE_STATUS_CACHE]
+    # image urls are absolute
+    key = f'{membership.id}:{day}:{request.get_host()}:{membership.checks_version}'
+    checks = cache.get(key)
+    if checks is not None:
+        return checks
+
+    checks = {}
+    histories = AttendanceHistory.objects.filter(
+        membership=membership, identified_on__date=day
+    ).order_by('identified_on')
+    for history in histories:
+        history.membership = membership
+        checks[(history.time_slot_id, history.is_open_attend)] = AttendSerializer(
+            history, context={'request': request}
+        ).data
+
+    cache.set(key, checks)
+    return checks
+
+
+def invalidate_day_checks(membership_id):
+    AttendanceMembership.objects.filter(id=membership_id).update(checks_version=F('checks_version') + 1)
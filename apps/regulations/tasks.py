@@ -1,7 +1,21 @@
-from datetime import timedelta, date
+from datetime import timedelta, date, datetime
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import IntegrityError, transaction
 from config.celery import app
 from apps.teachers.models import TeacherProfile
-from apps.regulations.models import AttendanceHistory, AttendanceDatePerson, AttendanceEvent
+from apps.regulations.models import AttendanceHistory, AttendanceDatePerson, AttendanceTicket
+from apps.regulations import exceptions as e
+from apps.regulations.archive import archive_attendance, restore_attendance
+from apps.regulations.helpers import is_right_place
+from apps.regulations.memberships import MembershipTimeline
+from apps.regulations.schedules import get_schedule
+from apps.regulations.status import invalidate_day_checks
+from apps.regulations.serializers import AttendSerializer, verify_attendance_face
+from apps.core.thumbnails import save_thumbnail
+
+
+channel_layer = get_channel_layer()
 
 
 @app.task
@@ -9,35 +23,27 @@ def update_attendance_report():
     today = date.today()
     yesterday = today - timedelta(days=1)
     result = []
+    counted = set(AttendanceDatePerson.objects.filter(date=yesterday).values_list('teacher_id', flat=True))
+    timeline = MembershipTimeline(yesterday, yesterday)
 
     for teacher in TeacherProfile.objects.all():
-        if AttendanceDatePerson.objects.filter(teacher=teacher, date=yesterday).exists():
+        if teacher.id in counted:
             continue
 
-        membership = teacher.attendance_membership.filter(
-            joined_on__date__lte=yesterday).order_by('-joined_on').first()
-        if membership is None:
+        period = timeline.get(teacher.id, yesterday)
+        if period is None:
             continue
 
-        rule = membership.rule
-        if AttendanceEvent.objects.filter(
-            rule=rule, is_attendance_day=False, start_date__gte=yesterday, end_date__lte=yesterday
-        ).exists():
-            pass
-
-        week_mapping = {
-            0: rule.mon,
-            1: rule.tue,
-            2: rule.wed,
-            3: rule.thr,
-            4: rule.fri,
-            5: rule.sat,
-            6: rule.sun
-        }
-        time_rule = week_mapping[yesterday.weekday()]
-        total_check = time_rule.slots.count() * 2
+        schedule = get_schedule(period.rule_id)
+        if schedule.is_attendance_day(yesterday):
+            total_check = len(schedule.days[yesterday.weekday()].slots) * 2
+            holidays = 0
+        else:
+            total_check = 0
+            holidays = 1
+
         attendance_history = AttendanceHistory.objects.filter(
-            membership=membership, identified_on__date=yesterday
+            membership_id=period.membership_id, identified_on__date=yesterday
         )
         checks = attendance_history.count()
         late_attendances = 0
@@ -61,7 +67,141 @@ def update_attendance_report():
             late_attendances=late_attendances,
             early_leaves=early_leaves,
             outside_checks=outside_checks,
-            holidays=0
+            holidays=holidays
         ))
 
     AttendanceDatePerson.objects.bulk_create(result)
+
+
+@app.task(bind=True, max_retries=3)
+def process_attend_ticket(self, context):
+    """
+    Verify the face of an asynchronous check-in, create its history and push the outcome
+    """
+    ticket = AttendanceTicket.objects.select_related(
+        'membership__teacher__user', 'membership__rule__attendance_place'
+    ).filter(id=context['ticket'], status=AttendanceTicket.STATUS_PENDING).first()
+    if ticket is None:
+        return
+
+    membership = ticket.membership
+    try:
+        with ticket.image.open('rb') as image:
+            verify_attendance_face(membership.teacher.user, image)
+    except e.FACE_RECOGNITION_BUSY as exc:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=exc, countdown=2 ** self.request.retries)
+
+        ticket.status = AttendanceTicket.STATUS_FAILED
+        ticket.msg = e.get_error_message(exc)
+    except Exception as exc:
+        ticket.status = AttendanceTicket.STATUS_FAILED
+        ticket.msg = e.get_error_message(exc)
+    else:
+        try:
+            # the photo is already stored where the history keeps its images
+            with transaction.atomic():
+                history = AttendanceHistory.objects.create(
+                    membership=membership,
+                    time_slot=ticket.time_slot,
+                    is_open_attend=ticket.is_open_attend,
+                    is_bad_attendance=ticket.is_bad_attendance,
+                    image=ticket.image.name,
+                    longitude=ticket.longitude,
+                    latitude=ticket.latitude,
+                    is_right_place=is_right_place(membership.rule_id, ticket.latitude, ticket.longitude),
+                    identified_date=ticket.identified_on.date(),
+                )
+        except IntegrityError:
+            # another check-in of the window was saved since the ticket was accepted
+            ticket.status = AttendanceTicket.STATUS_FAILED
+            ticket.msg = e.get_error_message(e.ATTENDANCE_DUPLICATED())
+        else:
+            AttendanceHistory.objects.filter(id=history.id).update(identified_on=ticket.identified_on)
+            history.identified_on = ticket.identified_on
+            invalidate_day_checks(membership.id)
+            ticket.status = AttendanceTicket.STATUS_SUCCEEDED
+            ticket.history = history
+
+    ticket.save()
+    notify_attend_ticket(ticket)
+    if ticket.history is not None:
+        make_attendance_thumbnail.apply_async(
+            args=[{
+                'history': ticket.history.id
+            }]
+        )
+
+
+def notify_attend_ticket(ticket):
+    """
+    Push the outcome of the check-in over the user's NotificationConsumer
+    """
+    user = ticket.membership.teacher.user
+    if not user.channel_name:
+        return
+
+    if ticket.status == AttendanceTicket.STATUS_SUCCEEDED:
+        data = {
+            'code': 0,
+            'type': 'attendance',
+            'ticket': str(ticket.id),
+            'data': AttendSerializer(ticket.history).data
+        }
+    else:
+        data = {
+            'code': -1,
+            'type': 'attendance',
+            'ticket': str(ticket.id),
+            'msg': ticket.msg
+        }
+
+    async_to_sync(channel_layer.send)(
+        user.channel_name,
+        {
+            'type': 'notify',
+            'data': data
+        }
+    )
+
+
+@app.task
+def make_attendance_thumbnail(context):
+    """
+    Render the thumbnail of the check-in photo
+    """
+    history = AttendanceHistory.objects.filter(id=context['history']).first()
+    if history is not None and history.image:
+        save_thumbnail(history)
+        # the status screen shows the thumbnail
+        invalidate_day_checks(history.membership_id)
+
+
+@app.task
+def archive_attendance_history():
+    """
+    Move the check-ins older than the archive horizon to the archive
+    """
+    result = archive_attendance()
+    return {
+        'archives': [archive.id for archive in result['archives']],
+        'held_back': result['held_back'],
+        'expired': result['expired'],
+    }
+
+
+@app.task
+def restore_attendance_history(context):
+    """
+    Copy a teacher's archived check-ins of one month back to the history
+    """
+    teacher = TeacherProfile.objects.get(id=context['teacher'])
+    ids = restore_attendance(teacher, datetime.strptime(context['month'], '%Y-%m-%d').date())
+    for history_id in ids:
+        make_attendance_thumbnail.apply_async(
+            args=[{
+                'history': history_id
+            }]
+        )
+
+    return ids
@@ -1,3 +1,44 @@
-from django.test import TestCase
+import io
+import shutil
+import tempfile
 
-# Create your tests here.
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from .photos import store_photo
+
+EXIF_GPS_INFO = 0x8825
+
+
+def jpeg_with_gps(size=(640, 480)):
+    exif = Image.Exif()
+    exif[EXIF_GPS_INFO] = {1: 'N', 2: (46.0, 0.0, 0.0), 3: 'E', 4: (127.0, 0.0, 0.0)}
+    buffer = io.BytesIO()
+    # a low quality JPEG which fits and is smaller than its re-encoding
+    Image.effect_noise(size, 60).convert('RGB').save(buffer, 'JPEG', quality=30, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+class StorePhotoTestCase(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_stored_photo_has_no_exif(self):
+        original = jpeg_with_gps()
+        self.assertIn(EXIF_GPS_INFO, Image.open(io.BytesIO(original)).getexif())
+
+        with default_storage.open(store_photo(original), 'rb') as f:
+            stored = f.read()
+
+        self.assertFalse(b'Exif\x00\x00' in stored, 'the stored photo has an EXIF block')
+        image = Image.open(io.BytesIO(stored))
+        self.assertNotIn('exif', image.info)
+        self.assertEqual(len(image.getexif()), 0)
@@ -14,5 +14,8 @@ urlpatterns = [
     path('', include(router.urls)),
     path('attendance-status', v.AttendanceStatusAPIView.as_view()),
     path('attend', v.AttendAPIView.as_view()),
+    path('attend/tickets', v.AttendTicketAPIView.as_view()),
+    path('attend/tickets/<uuid:ticket_id>', v.AttendTicketDetailAPIView.as_view()),
+    path('attend/kiosk', v.KioskAttendAPIView.as_view()),
     path('attendance-comment', v.AttendanceCommentAPIView.as_view())
 ]
@@ -12,7 +12,10 @@ from drf_renderer_xlsx.renderers import XLSXRenderer
 from . import models as m
 from . import serializers as s
 from . import exceptions as e
-from .helpers import get_week_day
+from .memberships import current_period
+from .schedules import get_schedule
+from .status import get_day_checks
+from .tasks import make_attendance_thumbnail, process_attend_ticket
 from ..core.export import EXCEL_BODY_STYLE, EXCEL_HEAD_STYLE
 
 
@@ -408,6 +411,7 @@ class AttendanceDailyReportViewSet(XLSXFileMixin, viewsets.ModelViewSet):
         queryset = queryset.annotate(
             identified_on=Subquery(attendance.values('identified_on')[:1]),
             image=Subquery(attendance.values('image')[:1]),
+            thumbnail=Subquery(attendance.values('thumbnail')[:1]),
             is_right_place=Subquery(attendance.values('is_right_place')[:1]),
             is_bad_attendance=Subquery(attendance.values('is_bad_attendance')[:1])
         )
@@ -497,14 +501,14 @@ class AttendanceDatePersonViewSet(XLSXFileMixin, viewsets.ModelViewSet):
 class AttendanceStatusAPIView(views.APIView):
 
     def get(self, request, format=None):
-        membership = m.AttendanceMembership.objects.filter(teacher=request.user.profile).order_by('-joined_on').first()
-        if membership:
+        period = current_period(request.user.profile.id, 'membership__rule__attendance_place')
+        if period:
+            membership = period.membership
             today = date.today()
+            schedule = get_schedule(membership.rule_id)
 
             # check whether today is attendance day or not
-            if membership.rule.events.filter(
-                is_attendance_day=False, start_date__gte=today, end_date__lte=today
-            ).exists():
+            if today in schedule.holidays:
                 return Response(
                     {
                         "code": -1,
@@ -514,7 +518,7 @@ class AttendanceStatusAPIView(views.APIView):
                 )
 
             # check day attendance rule
-            day_rule = get_week_day(membership.rule, today.weekday())
+            day_rule = schedule.days[today.weekday()]
             if not day_rule:
                 return Response(
                     {
@@ -526,7 +530,7 @@ class AttendanceStatusAPIView(views.APIView):
                 )
 
             # check whether day rule has time slots
-            if not day_rule.slots.exists():
+            if not day_rule.slots:
                 return Response(
                     {
                         "code": -1,
@@ -545,25 +549,9 @@ class AttendanceStatusAPIView(views.APIView):
 
             expand_rule_index = 0
             time_delta = timedelta(days=1)
-            for slot_index, slot in enumerate(day_rule.slots.all()):
-                today_checks = m.AttendanceHistory.objects.filter(
-                    membership=membership, time_slot=slot, identified_on__date=today
-                ).order_by('identified_on')
-
-                open_check, close_check = None, None
-
-                for today_check in today_checks:
-                    # identified_on = today_check.identified_on.time()
-                    # if identified_on >= slot.start_open_time and identified_on <= slot.finish_open_time:
-                    #     open_check = today_check
-                    # elif identified_on >= slot.finish_open_time and identified_on <= slot.finish_close_time:
-                    #     close_check = today_check
-
-                    if today_check.is_open_attend:
-                        open_check = today_check
-                    else:
-                        close_check = today_check
-
+            checks = get_day_checks(membership, today, request)
+            no_check = s.AttendSerializer(None, context={'request': request}).data
+            for slot_index, slot in enumerate(day_rule.slots):
                 new_time_delta = abs(current_time - datetime.combine(today, slot.open_time))
                 if time_delta > new_time_delta:
                     time_delta = new_time_delta
@@ -576,18 +564,12 @@ class AttendanceStatusAPIView(views.APIView):
 
                 ret['rules'].append({
                     'rule': s.TimeSlotOpenTimeSerializer(slot).data,
-                    'check': s.AttendSerializer(
-                        open_check,
-                        context={'request': request}
-                    ).data,
+                    'check': checks.get((slot.id, True), no_check),
                     'is_expanded': False
                 })
                 ret['rules'].append({
                     'rule': s.TimeSlotCloseTimeSerializer(slot).data,
-                    'check': s.AttendSerializer(
-                        close_check,
-                        context={'request': request}
-                    ).data,
+                    'check': checks.get((slot.id, False), no_check),
                     'is_expanded': False
                 })
 
@@ -612,9 +594,39 @@ class AttendanceStatusAPIView(views.APIView):
             )
 
 
+def replay_attendance(history, request):
+    """
+    Answer a check-in which was already made with its stored check
+    """
+    return Response(
+        {
+            'code': 0,
+            'data': s.AttendSerializer(history, context={'request': request}).data,
+            'replayed': True
+        },
+        status=status.HTTP_200_OK
+    )
+
+
 class AttendAPIView(views.APIView):
+    """
+    Attend with face verification
+
+    A retry with the `Idempotency-Key` header of an earlier check-in, or a check
+    of a window the user checked already today, gets the stored check back
+    without verifying the face again. A window of another teacher's membership
+    is only answered as a duplicate.
+    """
 
     def post(self, request):
+        idempotency_key = request.META.get('HTTP_IDEMPOTENCY_KEY') or None
+        if idempotency_key is not None:
+            history = m.AttendanceHistory.objects.filter(
+                membership__teacher__user=request.user, idempotency_key=idempotency_key
+            ).first()
+            if history is not None:
+                return replay_attendance(history, request)
+
         serializer = s.AttendSerializer(
             data=request.data,
             context={'user': request.user, 'imei': request.data.get('imei', None), 'request': request}
@@ -622,50 +634,146 @@ class AttendAPIView(views.APIView):
 
         try:
             serializer.is_valid(raise_exception=True)
-            serializer.save()
-            code = 0
+            history = serializer.save(idempotency_key=idempotency_key)
             data = serializer.data
-        except e.FACE_RECOGNITION_NO_DATASET:
-            code = -1
-            data = '无本人人脸库，请输入本人人脸后进行操作'
-        except e.FACE_RECOGNITION_FAILED:
-            code = -1
-            data = '检查失败, 请确保是本人'
-        except e.NO_ATTENDANCE_DAY:
-            code = -1
-            data = '今天是休息天，无需考勤'
-        except e.OUT_OF_ATTENDANCE_TIME:
-            code = -1
-            data = '已过考勤时间，所以不能操作'
-        except e.TIMESLOT_MISSING:
-            code = -1
-            data = 'Timeslot error'
-        except e.FACE_RECOGNITION_IMEI_NOT_MATCH:
-            code = -1
-            data = '这台设备不是登记的考勤设备，请确认'
-        except e.FACE_DETECTION_FAILED:
-            code = -1
-            data = '未识别到人脸，请正确面对镜头'
-        except Exception:
-            code = -1
-            data = '未知问题'
-        finally:
-            if code == 0:
-                return Response(
-                    {
-                        'code': 0,
-                        'data': data
-                    },
-                    status=status.HTTP_200_OK
-                )
-            else:
-                return Response(
-                    {
-                        'code': code,
-                        'msg': data
-                    },
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+        except Exception as exc:
+            # the window may be another teacher's, only the user's own check is sent back
+            if isinstance(exc, e.ATTENDANCE_DUPLICATED) and exc.history is not None and \
+                    exc.history.membership.teacher.user_id == request.user.id:
+                return replay_attendance(exc.history, request)
+
+            return Response(
+                {
+                    'code': -1,
+                    'msg': e.get_error_message(exc)
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        make_attendance_thumbnail.apply_async(
+            args=[{
+                'history': history.id
+            }]
+        )
+        return Response(
+            {
+                'code': 0,
+                'data': data
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+class AttendTicketAPIView(views.APIView):
+    """
+    Attend without waiting for face verification
+
+    The response carries a ticket id right after the cheap checks. The outcome
+    is pushed over the notification websocket and can be polled with the ticket.
+    With `CELERY_TASK_ALWAYS_EAGER` the face is still verified within the request.
+    """
+
+    def post(self, request):
+        serializer = s.AttendTicketSerializer(
+            data=request.data,
+            context={'user': request.user, 'imei': request.data.get('imei', None), 'request': request}
+        )
+
+        try:
+            serializer.is_valid(raise_exception=True)
+            ticket = serializer.save()
+        except Exception as exc:
+            return Response(
+                {
+                    'code': -1,
+                    'msg': e.get_error_message(exc)
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        process_attend_ticket.apply_async(
+            args=[{
+                'ticket': str(ticket.id)
+            }]
+        )
+        ticket.refresh_from_db()
+        return Response(
+            {
+                'code': 0,
+                'data': s.AttendTicketSerializer(ticket, context={'request': request}).data
+            },
+            status=status.HTTP_202_ACCEPTED
+        )
+
+
+class AttendTicketDetailAPIView(views.APIView):
+    """
+    Polling fallback for clients without the notification websocket
+    """
+
+    def get(self, request, ticket_id):
+        ticket = get_object_or_404(
+            m.AttendanceTicket, id=ticket_id, membership__teacher__user=request.user
+        )
+        return Response(
+            {
+                'code': 0,
+                'data': s.AttendTicketSerializer(ticket, context={'request': request}).data
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+class KioskAttendAPIView(views.APIView):
+    """
+    Attend from a shared device at the entrance
+
+    The device only sends the photo, its id and its location. The teacher is
+    identified among every enrolled face and the check is matched to the
+    time slot whose window contains the current time.
+    """
+
+    def post(self, request):
+        serializer = s.KioskAttendSerializer(
+            data=request.data,
+            context={'request': request}
+        )
+
+        try:
+            serializer.is_valid(raise_exception=True)
+            history = serializer.save()
+            data = serializer.data
+        except e.ATTENDANCE_DUPLICATED as exc:
+            data = s.KioskAttendSerializer(exc.history, context={'request': request}).data
+            return Response(
+                {
+                    'code': 0,
+                    'data': data,
+                    'replayed': True
+                },
+                status=status.HTTP_200_OK
+            )
+        except Exception as exc:
+            return Response(
+                {
+                    'code': -1,
+                    'msg': e.get_error_message(exc)
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        make_attendance_thumbnail.apply_async(
+            args=[{
+                'history': history.id
+            }]
+        )
+        return Response(
+            {
+                'code': 0,
+                'data': data
+            },
+            status=status.HTTP_200_OK
+        )
 
 
 class AttendanceCommentAPIView(views.APIView):
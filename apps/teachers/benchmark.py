@@ -0,0 +1,502 @@
+"""
+Face pipeline benchmark
+
+Drives the face helpers of the check-in path (`encode_query_face` and
+`match_attendance_face` of `AttendSerializer.validate`, and the kiosk gallery
+lookup) and the encoding of the enrollment path (`encode_teacher_image`)
+without touching the database, and reports per-stage latency percentiles
+and peak RSS. The photos are encoded by `encode_faces`, so by the inference
+service when FACE_INFERENCE_ADDRESS is set, and the teacher's encodings come
+from the feature cache, compacted when FACE_COMPACTION is enabled. Every
+benchmark is a plain callable taking the photo bytes and returning its stage
+timings, see `apps/teachers/tests.py` for the pytest-benchmark tests.
+
+`samples/face.jpg` is the astronaut photo of scikit-image (NASA, public
+domain), the default photo of the face benchmarks.
+"""
+import base64
+import ctypes
+import io
+import os
+import platform
+import queue
+import resource
+import tempfile
+import threading
+import time
+import tracemalloc
+from multiprocessing import Barrier, Pool, get_context
+
+import numpy as np
+from django.conf import settings
+from django.test.utils import override_settings
+from PIL import Image, ImageDraw
+
+from . import models as m
+from .compaction import CompactFeatures
+from .features import (
+    ENCODER_VERSION, ENCODING_SIZE, FEATURE_DTYPE, count_matches, encoding_to_bytes, save_snapshot
+)
+from .gallery import FaceGallery
+from .inference import InferenceServer, _call, _get_image_bytes, encode_faces, warm_up
+from .preprocessing import _decode_with_pil, load_image
+
+
+STAGES = ('decode', 'detect', 'encode', 'compare', 'identify', 'total')
+
+# tolerance of AttendSerializer.validate
+FACE_TOLERANCE = 0.5
+
+SAMPLE_FACE = os.path.join(os.path.dirname(__file__), 'samples', 'face.jpg')
+
+
+class NoFaceError(Exception):
+    pass
+
+
+def synthetic_images(count, width=1280, height=960, seed=0):
+    """
+    JPEG photos of noise with a face-sized ellipse
+
+    The detector finds no face in them, so they only measure decoding and
+    detection. Use `sample_face_images` when the faces must be encoded.
+    """
+    rng = np.random.RandomState(seed)
+    ret = []
+    for _ in range(count):
+        pixels = rng.randint(0, 256, (height, width, 3), dtype=np.uint8)
+        image = Image.fromarray(pixels)
+        draw = ImageDraw.Draw(image)
+        box = (width * 3 // 8, height // 4, width * 5 // 8, height * 3 // 4)
+        draw.ellipse(box, fill=tuple(rng.randint(120, 220, 3).tolist()))
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=90)
+        ret.append(buffer.getvalue())
+
+    return ret
+
+
+def sample_face_images(count, width=1280, height=960, seed=0):
+    """
+    JPEG photos of the sample face scaled to the height, on a background of noise
+    """
+    rng = np.random.RandomState(seed)
+    with Image.open(SAMPLE_FACE) as sample:
+        side = min(width, height)
+        face = sample.convert('RGB').resize((side, side), Image.BICUBIC)
+
+    ret = []
+    for _ in range(count):
+        image = Image.fromarray(rng.randint(0, 256, (height, width, 3), dtype=np.uint8))
+        image.paste(face, ((width - side) // 2, (height - side) // 2))
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=90)
+        ret.append(buffer.getvalue())
+
+    return ret
+
+
+def synthetic_encodings(teachers, per_teacher, noise=0.02, seed=0):
+    """
+    Random encodings with the spread of real ones, grouped by teacher
+
+    `noise` is the per-dimension deviation of a teacher's encodings around
+    their center, 0.02 puts most of them about 0.3 from each other.
+    """
+    rng = np.random.RandomState(seed)
+    centers = rng.normal(0, 0.09, (teachers, ENCODING_SIZE)).astype(FEATURE_DTYPE)
+    noise = rng.normal(0, noise, (teachers, per_teacher, ENCODING_SIZE)).astype(FEATURE_DTYPE)
+    return centers[:, None, :] + noise
+
+
+class Pipeline:
+    """
+    The check-in and enrollment code paths against an in-memory gallery
+
+    The checking teacher is not saved, their encodings are written as the
+    snapshot the feature cache maps, so FEATURE_ROOT must be a scratch
+    directory. A photo without exactly one face raises NoFaceError.
+    """
+
+    def __init__(self, teachers=1000, per_teacher=10):
+        if not settings.FEATURE_ROOT:
+            raise ValueError('The check-in benchmark needs a FEATURE_ROOT')
+
+        encodings = synthetic_encodings(teachers, per_teacher)
+        # ids of saved teachers start at 1
+        self.teacher = m.TeacherProfile(id=0, user=m.User(username='benchmark'), features_version=1)
+        save_snapshot(self.teacher.id, self.teacher.features_version, encodings[0])
+
+        self.gallery = FaceGallery(capacity=teachers * per_teacher)
+        for teacher_id, teacher_encodings in enumerate(encodings, 1):
+            self.gallery.update_teacher(teacher_id, teacher_encodings)
+
+    def checkin(self, image_bytes):
+        """
+        What `AttendSerializer.validate` does with the face of the photo
+        """
+        from ..regulations import exceptions as e
+        from ..regulations.serializers import match_attendance_face
+
+        timings = {}
+        started_on = time.perf_counter()
+        query = self._encode_query(image_bytes, timings)
+
+        compared_on = time.perf_counter()
+        try:
+            match_attendance_face(self.teacher.user, query)
+        except e.FACE_RECOGNITION_FAILED:
+            # the sample photos are not of the teacher, a rejection costs the same
+            pass
+
+        timings['compare'] = time.perf_counter() - compared_on
+        timings['total'] = time.perf_counter() - started_on
+        return timings
+
+    def kiosk(self, image_bytes):
+        """
+        Encode the photo, then identify it among every enrolled teacher
+        """
+        timings = {}
+        started_on = time.perf_counter()
+        query = self._encode_query(image_bytes, timings)
+
+        identified_on = time.perf_counter()
+        self.gallery.identify(query, k=3, tolerance=FACE_TOLERANCE)
+        timings['identify'] = time.perf_counter() - identified_on
+        timings['total'] = time.perf_counter() - started_on
+        return timings
+
+    def enroll(self, image_bytes):
+        """
+        What `encode_teacher_image` does for a new photo, without saving it
+        """
+        timings = {}
+        started_on = time.perf_counter()
+        face_locations, face_encodings = encode_faces(image_bytes, timings)
+        if len(face_locations) != 1:
+            raise NoFaceError(f'{len(face_locations)} faces found in a photo, the benchmarks need one face per photo')
+
+        encoding_to_bytes(face_encodings[0])
+        timings['total'] = time.perf_counter() - started_on
+        return timings
+
+    def _encode_query(self, image_bytes, timings):
+        from ..regulations import exceptions as e
+        from ..regulations.serializers import encode_query_face
+
+        try:
+            return encode_query_face(image_bytes, timings)
+        except e.FACE_DETECTION_FAILED:
+            raise NoFaceError('No single face found in a photo, the benchmarks need one face per photo')
+
+
+def summarize(samples):
+    """
+    Percentiles in milliseconds of a list of durations in seconds
+    """
+    if not samples:
+        return {'count': 0}
+
+    values = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        'count': len(values),
+        'mean_ms': float(values.mean()),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'max_ms': float(values.max()),
+    }
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+_pipeline = None
+
+
+def _init_worker(teachers, per_teacher, feature_root, ready):
+    global _pipeline
+
+    if not settings.FACE_INFERENCE['ADDRESS']:
+        warm_up()
+
+    override_settings(FEATURE_ROOT=feature_root).enable()
+    _pipeline = Pipeline(teachers, per_teacher)
+    ready.wait()
+
+
+def _run_one(args):
+    name, image_bytes = args
+    timings = getattr(_pipeline, name)(image_bytes)
+    return timings, peak_rss_kb()
+
+
+def run_benchmark(name, images, workers=1, repeat=1, teachers=1000, per_teacher=10):
+    """
+    Run one benchmark of `Pipeline` over the photos with `workers` processes
+
+    Every worker warms the models up and builds its gallery before the clock
+    starts. Raise NoFaceError when a photo has not exactly one face.
+    """
+    tasks = [(name, image_bytes) for image_bytes in images] * repeat
+    samples = {stage: [] for stage in STAGES}
+    peak_rss = 0
+    ready = Barrier(workers + 1)
+    feature_root = tempfile.TemporaryDirectory()
+    initargs = (teachers, per_teacher, feature_root.name, ready)
+    with feature_root, Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+        ready.wait()
+        started_on = time.perf_counter()
+        for timings, rss in pool.imap_unordered(_run_one, tasks):
+            for stage, seconds in timings.items():
+                samples[stage].append(seconds)
+            peak_rss = max(peak_rss, rss)
+
+        elapsed = time.perf_counter() - started_on
+
+    return {
+        'benchmark': name,
+        'workers': workers,
+        'requests': len(tasks),
+        'seconds': elapsed,
+        'throughput': len(tasks) / elapsed if elapsed else 0.0,
+        'peak_rss_kb': peak_rss,
+        'stages': {stage: summarize(values) for stage, values in samples.items() if values},
+    }
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'encoder_version': ENCODER_VERSION,
+        'face_image_max_dimension': settings.FACE_IMAGE_MAX_DIMENSION,
+    }
+
+
+def find_regressions(result, baseline, threshold):
+    """
+    Return the (benchmark, workers, stage) whose p95 grew more than `threshold` over the baseline
+    """
+    previous = {(run['benchmark'], run['workers']): run for run in baseline.get('runs', [])}
+    ret = []
+    for run in result['runs']:
+        base = previous.get((run['benchmark'], run['workers']))
+        if base is None:
+            continue
+
+        for stage, summary in run['stages'].items():
+            base_p95 = base['stages'].get(stage, {}).get('p95_ms')
+            if base_p95 and summary.get('p95_ms', 0) > base_p95 * (1 + threshold):
+                ret.append((run['benchmark'], run['workers'], stage, base_p95, summary['p95_ms']))
+
+    return ret
+
+
+def compaction_tradeoff(matrix, teacher_ids, configs, tolerance=FACE_TOLERANCE, impostors=50, seed=0):
+    """
+    Compare the attendance decision on full and compacted encodings
+
+    One encoding of every teacher is held out as a genuine query against the
+    rest of the teacher's encodings, and up to `impostors` held out encodings
+    of other teachers are impostor queries. `configs` are (exemplars, dtype)
+    pairs, None for the full encodings.
+    """
+    rng = np.random.RandomState(seed)
+    bounds = np.flatnonzero(np.diff(teacher_ids)) + 1
+    groups = [group for group in np.split(matrix, bounds) if len(group) >= 2]
+    queries = np.asarray([group[0] for group in groups])
+    enrolled = [group[1:] for group in groups]
+
+    pairs = []
+    for owner in range(len(groups)):
+        others = np.delete(np.arange(len(groups)), owner)
+        chosen = rng.choice(others, min(impostors, len(others)), replace=False) if len(others) else []
+        pairs.append((owner, owner))
+        pairs.extend((owner, int(other)) for other in chosen)
+
+    ret = []
+    reference = None
+    for config in configs:
+        if config is None:
+            features = enrolled
+        else:
+            features = [CompactFeatures(encodings, *config) for encodings in enrolled]
+
+        decisions = np.zeros(len(pairs), dtype=bool)
+        started_on = time.perf_counter()
+        for i, (owner, query) in enumerate(pairs):
+            matches, total = count_matches(features[owner], queries[query], tolerance)
+            decisions[i] = matches > total // 2
+        elapsed = time.perf_counter() - started_on
+
+        genuine = np.asarray([owner == query for owner, query in pairs])
+        if reference is None:
+            reference = decisions
+
+        ret.append({
+            'exemplars': config[0] if config else None,
+            'dtype': config[1] if config else 'float32',
+            'bytes_per_teacher': float(np.mean([item.nbytes for item in features])),
+            'match_us': 1e6 * elapsed / max(len(pairs), 1),
+            'frr': float(np.count_nonzero(~decisions[genuine]) / max(np.count_nonzero(genuine), 1)),
+            'far': float(np.count_nonzero(decisions[~genuine]) / max(np.count_nonzero(~genuine), 1)),
+            'agreement': float(np.mean(decisions == reference)),
+        })
+
+    return ret
+
+
+def run_batching_benchmark(images, batch_size, processes, clients, repeat=1):
+    """
+    Throughput and latency of an inference service batching `batch_size` photos
+
+    A service is started on a temporary socket and `clients` threads send it
+    the photos concurrently, as web workers do at the morning peak.
+    """
+    address = os.path.join(tempfile.mkdtemp(), 'face_inference.sock')
+    authkey = settings.FACE_INFERENCE['AUTHKEY']
+    server = InferenceServer(
+        address, authkey.encode(), processes, queue_size=clients, timeout=60, batch_size=batch_size
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        while not os.path.exists(address):
+            time.sleep(0.01)
+
+        # let every pool process load the models
+        for image_bytes in images[:processes]:
+            _call({'op': 'encode', 'image': image_bytes}, 60, address)
+
+        tasks = queue.Queue()
+        for image_bytes in images * repeat:
+            tasks.put(image_bytes)
+
+        latencies = []
+
+        def client():
+            while True:
+                try:
+                    image_bytes = tasks.get_nowait()
+                except queue.Empty:
+                    return
+
+                started_on = time.perf_counter()
+                _call({'op': 'encode', 'image': image_bytes}, 60, address)
+                latencies.append(time.perf_counter() - started_on)
+
+        started_on = time.perf_counter()
+        threads = [threading.Thread(target=client) for _ in range(clients)]
+        for client_thread in threads:
+            client_thread.start()
+        for client_thread in threads:
+            client_thread.join()
+        elapsed = time.perf_counter() - started_on
+
+        stats = server.stats()
+    finally:
+        server.close()
+        thread.join()
+
+    batching = stats.get('batching', {})
+    return {
+        'batch_size': batch_size,
+        'processes': processes,
+        'clients': clients,
+        'requests': len(latencies),
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'mean_batch_size': batching.get('mean_batch_size', 1.0),
+        'latency': summarize(latencies),
+    }
+
+
+def ingest(data_url):
+    """
+    Take a check-in photo from its data URL to the array given to the face detector
+    """
+    from ..core.serializers import Base64ImageField
+
+    image = Base64ImageField().to_internal_value(data_url)
+    return load_image(_get_image_bytes(image))
+
+
+def legacy_ingest(data_url):
+    """
+    `ingest` as it was before the data URL was decoded in place and OpenCV decoded the photo
+    """
+    from django.core.files.base import ContentFile
+    from django.forms import ImageField
+
+    header, data = data_url.split(';base64,')
+    image = ImageField().to_python(ContentFile(base64.b64decode(data), name='photo.jpg'))
+    image.seek(0)
+    image_bytes = image.read()
+    return _decode_with_pil(Image.open(io.BytesIO(image_bytes)), settings.FACE_IMAGE_MAX_DIMENSION)
+
+
+INGESTS = {'current': ingest, 'legacy': legacy_ingest}
+
+
+def _rss_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1])
+
+
+def _measure_ingest(name, data_url, small_data_url, repeat):
+    ingest_photo = INGESTS[name]
+    # load the code paths without letting the allocator keep photo-sized blocks around
+    ingest_photo(small_data_url)
+
+    # hand the memory freed by the parent back to the system and reset the
+    # high-water mark of the process, Linux only
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        rss_before = _rss_kb('VmRSS:')
+    except (OSError, AttributeError):
+        rss_before = None
+
+    tracemalloc.start()
+    ingest_photo(data_url)
+    traced_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    rss_peak = _rss_kb('VmHWM:') - rss_before if rss_before is not None else None
+
+    started_on = time.perf_counter()
+    for _ in range(repeat):
+        ingest_photo(data_url)
+    elapsed = time.perf_counter() - started_on
+
+    return {
+        'ingest': name,
+        'mean_ms': 1000 * elapsed / repeat,
+        'traced_peak_kb': traced_peak // 1024,
+        'rss_peak_kb': rss_peak,
+    }
+
+
+def measure_ingest(image_bytes, repeat=5):
+    """
+    Latency and peak memory of the current and the legacy ingest of one photo
+
+    Each ingest runs in a fresh process. The traced peak counts the Python and
+    numpy buffers, the RSS peak also the decoders' own memory; both leave out
+    the data URL string the request parser already holds.
+    """
+    data_url = 'data:image/jpeg;base64,' + base64.b64encode(image_bytes).decode('ascii')
+    small_data_url = 'data:image/jpeg;base64,' + base64.b64encode(synthetic_images(1, 64, 48)[0]).decode('ascii')
+    ret = []
+    for name in INGESTS:
+        with get_context('fork').Pool(1) as pool:
+            ret.append(pool.apply(_measure_ingest, (name, data_url, small_data_url, repeat)))
+
+    return ret
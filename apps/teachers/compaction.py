@@ -0,0 +1,110 @@
+"""
+Compact form of a teacher's encodings: a centroid plus a few diverse exemplars
+
+Every stored encoding is assigned to its nearest exemplar, which then votes
+with the number of encodings it stands for. The attendance rule "more than
+half of the encodings are within the tolerance" becomes "more than half of
+the weight is within the tolerance", which is the same rule whenever every
+encoding is kept. The centroid and the largest distance of an encoding to it
+reject faces that cannot match any encoding without looking at exemplars.
+
+Exemplars may be stored as float16, or as int8 with one scale per exemplar.
+"""
+import numpy as np
+
+
+FEATURE_DTYPE = np.float32
+
+DTYPES = ('float32', 'float16', 'int8')
+
+
+def select_exemplars(encodings, count):
+    """
+    Pick `count` encodings far from each other, starting with the one nearest the centroid
+    """
+    if len(encodings) <= count:
+        return np.arange(len(encodings))
+
+    centroid = encodings.mean(axis=0)
+    selected = [int(np.argmin(np.linalg.norm(encodings - centroid, axis=1)))]
+    nearest = np.linalg.norm(encodings - encodings[selected[0]], axis=1)
+    while len(selected) < count:
+        index = int(np.argmax(nearest))
+        selected.append(index)
+        np.minimum(nearest, np.linalg.norm(encodings - encodings[index], axis=1), out=nearest)
+
+    return np.asarray(selected)
+
+
+def quantize(exemplars, dtype):
+    """
+    Return the stored exemplars and their per-row scale, None unless int8
+    """
+    if dtype == 'float32':
+        return exemplars.astype(np.float32), None
+
+    if dtype == 'float16':
+        return exemplars.astype(np.float16), None
+
+    if dtype == 'int8':
+        scale = np.abs(exemplars).max(axis=1) / 127
+        scale[scale == 0] = 1
+        return np.round(exemplars / scale[:, None]).astype(np.int8), scale.astype(np.float32)
+
+    raise ValueError(f'Unknown exemplar dtype {dtype}')
+
+
+class CompactFeatures:
+    """
+    Centroid, radius and weighted, possibly quantized exemplars of one teacher
+    """
+
+    def __init__(self, encodings, exemplars=8, dtype='float32'):
+        encodings = np.asarray(encodings, dtype=FEATURE_DTYPE)
+        self.total = len(encodings)
+        self.centroid = encodings.mean(axis=0) if self.total else np.zeros(encodings.shape[1], FEATURE_DTYPE)
+        self.radius = float(np.linalg.norm(encodings - self.centroid, axis=1).max()) if self.total else 0.0
+
+        selected = encodings[select_exemplars(encodings, exemplars)]
+        self._exemplars, self._scale = quantize(selected, dtype)
+
+        # every encoding votes through its nearest exemplar
+        weights = np.zeros(len(selected), dtype=np.int32)
+        if self.total:
+            squared = (encodings ** 2).sum(axis=1)[:, None] - 2 * encodings @ selected.T
+            squared += (selected ** 2).sum(axis=1)[None, :]
+            np.add.at(weights, squared.argmin(axis=1), 1)
+
+        self.weights = weights
+
+    def __len__(self):
+        return self.total
+
+    @property
+    def exemplars(self):
+        if self._scale is not None:
+            return self._exemplars.astype(FEATURE_DTYPE) * self._scale[:, None]
+
+        return self._exemplars.astype(FEATURE_DTYPE, copy=False)
+
+    @property
+    def nbytes(self):
+        ret = self.centroid.nbytes + self._exemplars.nbytes + self.weights.nbytes
+        if self._scale is not None:
+            ret += self._scale.nbytes
+
+        return ret
+
+    def count_matches(self, query, tolerance):
+        """
+        Return the weight of the exemplars within `tolerance` and the total weight
+        """
+        if not self.total:
+            return 0, 0
+
+        query = np.asarray(query, dtype=FEATURE_DTYPE)
+        if np.linalg.norm(self.centroid - query) > tolerance + self.radius:
+            return 0, self.total
+
+        distances = np.linalg.norm(self.exemplars - query, axis=1)
+        return int(self.weights[distances <= tolerance].sum()), self.total
@@ -0,0 +1,226 @@
+"""
+Bulk photo enrollment from a zip file or a directory laid out as `<work_no>/*.jpg`
+
+Photos are detected and encoded by a process pool in batches. Every batch is
+committed before the next one starts, and a photo whose content is already
+enrolled for the teacher, or was rejected by an earlier run of the same
+enrollment, is skipped, so an interrupted run resumes where it stopped.
+
+The pool cannot be started by a Celery worker process, which is daemonic, nor
+should it run in a web request, so uploaded archives are enrolled by a
+`manage.py bulk_enroll` process of their own, see `start_enrollment`.
+"""
+import hashlib
+import os
+import subprocess
+import sys
+import zipfile
+from multiprocessing import Pool
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+
+from . import models as m
+from ..core.thumbnails import render_thumbnail, thumbnail_path
+from .features import ENCODER_VERSION, encoding_to_bytes
+from .inference import detect_and_encode, warm_up
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+class ArchiveReader:
+    """
+    Read the photos of a zip file or a directory
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self._zip = zipfile.ZipFile(source) if zipfile.is_zipfile(source) else None
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+
+    def members(self):
+        """
+        Return (work_no, name) of every photo, `name` is relative to the source
+        """
+        if self._zip is not None:
+            names = [info.filename for info in self._zip.infolist() if not info.is_dir()]
+        else:
+            names = [
+                os.path.relpath(os.path.join(root, filename), self.source)
+                for root, _, filenames in os.walk(self.source) for filename in filenames
+            ]
+
+        ret = []
+        for name in sorted(names):
+            parts = name.replace(os.sep, '/').split('/')
+            if len(parts) == 2 and parts[1].lower().endswith(IMAGE_EXTENSIONS):
+                ret.append((parts[0], name))
+
+        return ret
+
+    def read(self, name):
+        if self._zip is not None:
+            return self._zip.read(name)
+
+        with open(os.path.join(self.source, name), 'rb') as f:
+            return f.read()
+
+
+def _detect(image_bytes):
+    try:
+        result = detect_and_encode(image_bytes)
+        # the photo is already in memory, so its thumbnail is rendered here instead of in a task
+        thumbnail = render_thumbnail(image_bytes) if len(result['locations']) == 1 else None
+    except Exception:
+        return None
+
+    return result['locations'], result['encodings'], thumbnail
+
+
+def start_enrollment(enrollment):
+    """
+    Run the enrollment in a detached `manage.py bulk_enroll` process
+    """
+    subprocess.Popen(
+        [sys.executable, str(settings.ROOT_DIR.path('manage.py')), 'bulk_enroll', '--enrollment', str(enrollment.id)],
+        cwd=str(settings.ROOT_DIR),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+
+
+def run_enrollment(enrollment, processes=None, batch_size=None, progress=None):
+    """
+    Enroll every photo of the enrollment source
+
+    `progress` is called with the enrollment after every committed batch.
+    """
+    reader = ArchiveReader(enrollment.source)
+    try:
+        members = reader.members()
+        teachers = {
+            teacher.work_no: teacher
+            for teacher in m.TeacherProfile.objects.filter(
+                work_no__in={work_no for work_no, _ in members}
+            ).select_related('user')
+        }
+        enrolled_hashes = set(m.TeacherImage.objects.filter(
+            teacher__in=teachers.values(), encoding__isnull=False, encoder_version=ENCODER_VERSION
+        ).values_list('teacher_id', 'content_hash'))
+        rejected_hashes = set(enrollment.rejections.values_list('work_no', 'content_hash'))
+
+        enrollment.status = m.BulkEnrollment.STATUS_RUNNING
+        enrollment.total = len(members)
+        enrollment.processed = enrollment.enrolled = enrollment.skipped = 0
+        enrollment.error = ''
+        enrollment.save()
+
+        processes = processes or os.cpu_count()
+        batch_size = batch_size or processes * 4
+        with Pool(processes, initializer=warm_up) as pool:
+            for start in range(0, len(members), batch_size):
+                images, rejections, skipped = _enroll_batch(
+                    enrollment, reader, members[start:start + batch_size], pool,
+                    teachers, enrolled_hashes, rejected_hashes
+                )
+                with transaction.atomic():
+                    m.TeacherImage.objects.bulk_create(images)
+                    m.BulkEnrollmentRejection.objects.bulk_create(rejections)
+                    enrollment.processed = min(start + batch_size, len(members))
+                    enrollment.enrolled += len(images)
+                    enrollment.skipped += skipped
+                    enrollment.save(update_fields=['processed', 'enrolled', 'skipped', 'updated'])
+                    if images:
+                        m.TeacherProfile.objects.filter(id__in={image.teacher_id for image in images}).update(
+                            features_version=F('features_version') + 1
+                        )
+                        m.FeatureVersion.bump()
+
+                if progress is not None:
+                    progress(enrollment)
+    except Exception as exc:
+        enrollment.status = m.BulkEnrollment.STATUS_FAILED
+        enrollment.error = str(exc)
+        enrollment.save(update_fields=['status', 'error', 'updated'])
+        raise
+    finally:
+        reader.close()
+
+    enrollment.status = m.BulkEnrollment.STATUS_COMPLETED
+    enrollment.save(update_fields=['status', 'updated'])
+    return enrollment
+
+
+def _enroll_batch(enrollment, reader, members, pool, teachers, enrolled_hashes, rejected_hashes):
+    rejections = []
+    pending = []
+    skipped = 0
+    for work_no, name in members:
+        image_bytes = reader.read(name)
+        content_hash = hashlib.sha256(image_bytes).hexdigest()
+        teacher = teachers.get(work_no)
+        if (work_no, content_hash) in rejected_hashes or \
+           (teacher is not None and (teacher.id, content_hash) in enrolled_hashes):
+            skipped += 1
+            continue
+
+        if teacher is None:
+            rejected_hashes.add((work_no, content_hash))
+            rejections.append(m.BulkEnrollmentRejection(
+                enrollment=enrollment, work_no=work_no, filename=name, content_hash=content_hash,
+                reason=m.BulkEnrollmentRejection.REASON_UNKNOWN_TEACHER
+            ))
+            continue
+
+        # the same photo twice in the archive is encoded once
+        enrolled_hashes.add((teacher.id, content_hash))
+        pending.append((teacher, work_no, name, content_hash, image_bytes))
+
+    results = pool.map(_detect, [item[-1] for item in pending])
+
+    images = []
+    for (teacher, work_no, name, content_hash, image_bytes), result in zip(pending, results):
+        if result is None or len(result[0]) != 1:
+            if result is None:
+                reason, faces = m.BulkEnrollmentRejection.REASON_UNREADABLE, 0
+            elif not result[0]:
+                reason, faces = m.BulkEnrollmentRejection.REASON_NO_FACE, 0
+            else:
+                reason, faces = m.BulkEnrollmentRejection.REASON_MULTIPLE_FACES, len(result[0])
+
+            enrolled_hashes.discard((teacher.id, content_hash))
+            rejected_hashes.add((work_no, content_hash))
+            rejections.append(m.BulkEnrollmentRejection(
+                enrollment=enrollment, work_no=work_no, filename=name,
+                content_hash=content_hash, reason=reason, faces=faces
+            ))
+            continue
+
+        teacher_image = m.TeacherImage(teacher=teacher)
+        path = default_storage.save(
+            m.image_path(teacher_image, os.path.basename(name)), ContentFile(image_bytes)
+        )
+        top, right, bottom, left = result[0][0]
+        teacher_image.image.name = path
+        teacher_image.thumbnail.name = default_storage.save(
+            thumbnail_path(teacher_image, os.path.splitext(path)[0] + '.jpg'), ContentFile(result[2])
+        )
+        teacher_image.content_hash = content_hash
+        teacher_image.encoding = encoding_to_bytes(result[1][0])
+        teacher_image.face_top = max(top, 0)
+        teacher_image.face_right = max(right, 0)
+        teacher_image.face_bottom = max(bottom, 0)
+        teacher_image.face_left = max(left, 0)
+        teacher_image.encoder_version = ENCODER_VERSION
+        images.append(teacher_image)
+
+    return images, rejections, skipped
@@ -0,0 +1,225 @@
+"""
+Face encodings stored with each TeacherImage and their per-process cache
+
+The database is the only source of truth, so any number of app servers can
+serve check-ins. Each node keeps a float32 `.npy` snapshot of a teacher's
+encodings per `features_version` in `FEATURE_ROOT`, which its workers
+memory-map instead of querying and copying them. Every process keeps the
+encodings it used recently in memory and reuses them while the teacher's
+`features_version` is unchanged.
+"""
+import glob
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F
+
+from . import models as m
+from .compaction import CompactFeatures
+
+
+ENCODING_SIZE = 128
+FEATURE_DTYPE = np.float32
+
+# Bump when the detector, the encoder or the preprocessing changes in a way
+# that makes stored encodings incomparable with new ones. The first version is
+# the RGB decode of `preprocessing.load_image`, enrollment decoded BGR before
+ENCODER_VERSION = 'dlib-resnet-v1'
+
+
+def encoding_to_bytes(encoding):
+    return np.asarray(encoding, dtype=FEATURE_DTYPE).tobytes()
+
+
+def encoding_from_bytes(data):
+    """
+    View the bytes stored in the database as an encoding, without copying them
+    """
+    return np.frombuffer(data, dtype=FEATURE_DTYPE)
+
+
+def _current_images():
+    return m.TeacherImage.objects.filter(encoding__isnull=False, encoder_version=ENCODER_VERSION)
+
+
+def feature_file(teacher_id, version):
+    return os.path.join(settings.FEATURE_ROOT, f'{teacher_id}-{version}.npy')
+
+
+def save_snapshot(teacher_id, version, encodings):
+    """
+    Write the snapshot of the teacher's encodings at `version` and remove the older ones
+
+    The file is written next to its final location and renamed over it, so
+    readers never map a half-written file.
+    """
+    os.makedirs(settings.FEATURE_ROOT, exist_ok=True)
+    file_name = feature_file(teacher_id, version)
+    temp_file_name = f'{file_name}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp_file_name, 'wb') as f:
+        np.save(f, encodings)
+
+    os.replace(temp_file_name, file_name)
+    for old_file_name in glob.glob(os.path.join(settings.FEATURE_ROOT, f'{teacher_id}-*.npy')):
+        if old_file_name != file_name:
+            try:
+                # workers which mapped it keep their pages
+                os.remove(old_file_name)
+            except FileNotFoundError:
+                pass
+
+
+def load_teacher_encodings(teacher_id, version=None):
+    """
+    Return the encodings of the teacher as a read-only (n, 128) array
+
+    With the teacher's `features_version`, the encodings are memory-mapped from
+    the node's snapshot of that version, which is written from the database
+    first when missing. The loads then cost no copy and the pages are shared
+    by every worker on the node.
+    """
+    use_snapshot = version is not None and settings.FEATURE_ROOT
+    if use_snapshot:
+        try:
+            return np.load(feature_file(teacher_id, version), mmap_mode='r')
+        except (FileNotFoundError, ValueError):
+            pass
+
+    rows = _current_images().filter(teacher__id=teacher_id).values_list('encoding', flat=True)
+    encodings = np.frombuffer(b''.join(bytes(row) for row in rows), dtype=FEATURE_DTYPE)
+    encodings = encodings.reshape(-1, ENCODING_SIZE)
+    # an empty array cannot be mapped
+    if use_snapshot and len(encodings):
+        save_snapshot(teacher_id, version, encodings)
+
+    return encodings
+
+
+def load_embedding_matrix(teacher_ids=None):
+    """
+    Pull every current encoding in one query
+
+    Return a (n, 128) float32 matrix and the teacher id of each row, grouped by teacher.
+    """
+    queryset = _current_images()
+    if teacher_ids is not None:
+        queryset = queryset.filter(teacher__id__in=teacher_ids)
+
+    rows = list(queryset.order_by('teacher_id', 'id').values_list('teacher_id', 'encoding'))
+    teacher_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    matrix = np.frombuffer(b''.join(bytes(row[1]) for row in rows), dtype=FEATURE_DTYPE)
+    return matrix.reshape(-1, ENCODING_SIZE), teacher_ids
+
+
+def count_matches(encodings, query, tolerance):
+    """
+    Return how many of the encodings are within `tolerance` of the query, and how many there are
+
+    `encodings` is an array or the CompactFeatures kept by the feature cache.
+    """
+    if isinstance(encodings, CompactFeatures):
+        return encodings.count_matches(query, tolerance)
+
+    distances = np.linalg.norm(encodings - np.asarray(query, dtype=FEATURE_DTYPE), axis=1)
+    return int(np.count_nonzero(distances <= tolerance)), len(encodings)
+
+
+def bump_features_version(teacher_id):
+    """
+    Invalidate the cached encodings of the teacher on every node
+    """
+    m.TeacherProfile.objects.filter(id=teacher_id).update(features_version=F('features_version') + 1)
+    m.FeatureVersion.bump()
+
+
+class FeatureCache:
+    """
+    Per-process LRU cache of teacher encodings
+
+    An entry is reused only while the `features_version` of the teacher is the
+    one it was loaded at, so the cache never needs explicit invalidation.
+    With `compaction` set, entries are kept as CompactFeatures.
+    """
+
+    def __init__(self, max_bytes, compaction=None):
+        self.max_bytes = max_bytes
+        self.compaction = compaction
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, teacher):
+        """
+        Return the encodings of the teacher as a read-only (n, 128) array or CompactFeatures
+        """
+        version = teacher.features_version
+        with self._lock:
+            entry = self._entries.get(teacher.id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(teacher.id)
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+
+        encodings = load_teacher_encodings(teacher.id, version)
+        if self.compaction:
+            encodings = CompactFeatures(
+                encodings, exemplars=self.compaction['EXEMPLARS'], dtype=self.compaction['DTYPE']
+            )
+
+        self._put(teacher.id, version, encodings)
+        return encodings
+
+    def discard(self, teacher_id):
+        with self._lock:
+            entry = self._entries.pop(teacher_id, None)
+            if entry is not None:
+                self._bytes -= entry[1].nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'compaction': self.compaction,
+            }
+
+    def _put(self, teacher_id, version, encodings):
+        if encodings.nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            entry = self._entries.pop(teacher_id, None)
+            if entry is not None:
+                self._bytes -= entry[1].nbytes
+
+            self._entries[teacher_id] = (version, encodings)
+            self._bytes += encodings.nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+
+feature_cache = FeatureCache(
+    settings.FEATURE_CACHE_MAX_BYTES,
+    settings.FACE_COMPACTION if settings.FACE_COMPACTION['ENABLED'] else None
+)
@@ -0,0 +1,235 @@
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from . import models as m
+from .features import ENCODING_SIZE, FEATURE_DTYPE, load_embedding_matrix, load_teacher_encodings
+
+GalleryMatch = namedtuple('GalleryMatch', ['teacher_id', 'distance', 'matches', 'total'])
+
+
+class FaceGallery:
+    """
+    Every enrolled encoding of every teacher in one contiguous matrix
+
+    Row `i` of the matrix belongs to the teacher at `teacher_slots[labels[i]]`.
+    Removing a teacher moves the last rows into the freed ones, so updating a
+    single teacher costs time proportional to that teacher's encodings only.
+    """
+
+    def __init__(self, capacity=1024):
+        self._matrix = np.empty((capacity, ENCODING_SIZE), dtype=FEATURE_DTYPE)
+        self._square_norms = np.empty(capacity, dtype=FEATURE_DTYPE)
+        self._labels = np.empty(capacity, dtype=np.int32)
+        self._size = 0
+        self._rows = {}
+        self._slots = {}
+        self._teacher_slots = []
+        self._free_slots = []
+        self._versions = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, teacher_id):
+        return teacher_id in self._rows
+
+    def update_teacher(self, teacher_id, encodings, version=None):
+        """
+        Replace the encodings of the teacher
+        """
+        with self._lock:
+            self.remove_teacher(teacher_id)
+            self._versions[teacher_id] = version
+            if encodings is None or len(encodings) == 0:
+                return
+
+            encodings = np.asarray(encodings, dtype=FEATURE_DTYPE).reshape(-1, ENCODING_SIZE)
+            count = len(encodings)
+            self._reserve(self._size + count)
+
+            if self._free_slots:
+                slot = self._free_slots.pop()
+                self._teacher_slots[slot] = teacher_id
+            else:
+                slot = len(self._teacher_slots)
+                self._teacher_slots.append(teacher_id)
+
+            start, stop = self._size, self._size + count
+            self._matrix[start:stop] = encodings
+            self._square_norms[start:stop] = np.einsum('ij,ij->i', encodings, encodings)
+            self._labels[start:stop] = slot
+            self._size = stop
+            self._rows[teacher_id] = list(range(start, stop))
+            self._slots[teacher_id] = slot
+
+    def remove_teacher(self, teacher_id):
+        with self._lock:
+            rows = self._rows.pop(teacher_id, None)
+            self._versions.pop(teacher_id, None)
+            if rows is None:
+                return
+
+            slot = self._slots.pop(teacher_id)
+            self._teacher_slots[slot] = None
+            self._free_slots.append(slot)
+
+            for row in sorted(rows, reverse=True):
+                last = self._size - 1
+                if row != last:
+                    moved_teacher = self._teacher_slots[self._labels[last]]
+                    moved_rows = self._rows[moved_teacher]
+                    moved_rows[moved_rows.index(last)] = row
+                    self._matrix[row] = self._matrix[last]
+                    self._square_norms[row] = self._square_norms[last]
+                    self._labels[row] = self._labels[last]
+
+                self._size = last
+
+    def distances(self, encoding):
+        """
+        Euclidean distance from the encoding to every row, in one matrix-vector product
+        """
+        query = np.asarray(encoding, dtype=FEATURE_DTYPE)
+        matrix = self._matrix[:self._size]
+        squared = self._square_norms[:self._size] - 2 * (matrix @ query)
+        squared += query @ query
+        np.maximum(squared, 0, out=squared)
+        return np.sqrt(squared, out=squared)
+
+    def identify(self, encoding, k=5, tolerance=0.5):
+        """
+        Return the `k` teachers whose closest encoding is nearest to the query
+
+        Each result also counts how many of the teacher's encodings are within
+        `tolerance`, which is what the attendance decision rule votes on.
+        """
+        with self._lock:
+            if self._size == 0:
+                return []
+
+            distances = self.distances(encoding)
+            labels = self._labels[:self._size]
+
+            # the k nearest teachers own the first k distinct labels among the
+            # nearest rows, so a partial sort usually suffices
+            candidates = min(self._size, max(k * 16, 64))
+            if candidates < self._size:
+                nearest = np.argpartition(distances, candidates - 1)[:candidates]
+                nearest = nearest[np.argsort(distances[nearest])]
+                teacher_slots = _first_unique(labels[nearest], k)
+                if len(teacher_slots) < k:
+                    teacher_slots = _first_unique(labels[np.argsort(distances)], k)
+            else:
+                teacher_slots = _first_unique(labels[np.argsort(distances)], k)
+
+            within = distances <= tolerance
+            ret = []
+            for slot in teacher_slots:
+                teacher_id = self._teacher_slots[slot]
+                rows = self._rows[teacher_id]
+                ret.append(GalleryMatch(
+                    teacher_id=teacher_id,
+                    distance=float(distances[rows].min()),
+                    matches=int(within[rows].sum()),
+                    total=len(rows),
+                ))
+
+            return ret
+
+    def sync(self):
+        """
+        Reload the teachers whose `features_version` changed since the last sync
+
+        The encodings of every changed teacher are pulled in a single query.
+        """
+        versions = dict(m.TeacherProfile.objects.values_list('id', 'features_version'))
+        with self._lock:
+            for teacher_id in set(self._versions).difference(versions):
+                self.remove_teacher(teacher_id)
+
+            changed = [
+                teacher_id for teacher_id, version in versions.items()
+                if teacher_id not in self._versions or self._versions[teacher_id] != version
+            ]
+            if not changed:
+                return
+
+            matrix, teacher_ids = load_embedding_matrix(changed if self._versions else None)
+            if len(teacher_ids):
+                # rows are grouped by teacher, split them where the id changes
+                bounds = np.flatnonzero(np.diff(teacher_ids)) + 1
+                for start, stop in zip(np.r_[0, bounds], np.r_[bounds, len(teacher_ids)]):
+                    teacher_id = int(teacher_ids[start])
+                    self.update_teacher(teacher_id, matrix[start:stop], versions[teacher_id])
+
+            for teacher_id in changed:
+                if self._versions.get(teacher_id) != versions[teacher_id]:
+                    self.update_teacher(teacher_id, None, versions[teacher_id])
+
+    def _reserve(self, size):
+        capacity = len(self._matrix)
+        if size <= capacity:
+            return
+
+        while capacity < size:
+            capacity *= 2
+
+        matrix = np.empty((capacity, ENCODING_SIZE), dtype=FEATURE_DTYPE)
+        matrix[:self._size] = self._matrix[:self._size]
+        square_norms = np.empty(capacity, dtype=FEATURE_DTYPE)
+        square_norms[:self._size] = self._square_norms[:self._size]
+        labels = np.empty(capacity, dtype=np.int32)
+        labels[:self._size] = self._labels[:self._size]
+        self._matrix, self._square_norms, self._labels = matrix, square_norms, labels
+
+
+def _first_unique(values, k):
+    ret = []
+    seen = set()
+    for value in values.tolist():
+        if value not in seen:
+            seen.add(value)
+            ret.append(value)
+            if len(ret) == k:
+                break
+
+    return ret
+
+
+_gallery = None
+_gallery_version = None
+_gallery_lock = threading.Lock()
+
+
+def get_gallery():
+    """
+    Process-wide gallery, synced with the database when any encodings changed
+    """
+    global _gallery, _gallery_version
+
+    version = m.FeatureVersion.get_version()
+    with _gallery_lock:
+        if _gallery is None:
+            _gallery = FaceGallery()
+            _gallery.sync()
+        elif version != _gallery_version:
+            _gallery.sync()
+
+        _gallery_version = version
+        return _gallery
+
+
+def refresh_teacher(teacher):
+    """
+    Apply the current encodings of one teacher to the gallery of this process
+
+    Other processes pick the change up from the bumped FeatureVersion.
+    """
+    with _gallery_lock:
+        if _gallery is not None:
+            _gallery.update_teacher(
+                teacher.id, load_teacher_encodings(teacher.id, teacher.features_version), teacher.features_version
+            )
@@ -0,0 +1,512 @@
+"""
+Face detection and encoding, either inline or in the local inference service
+
+The service (`manage.py run_face_inference`) owns a pool of processes that
+load the dlib models once at start. Web workers send it the uploaded bytes
+and wait for the result with a timeout, so a slow photo only occupies one
+pool process instead of the whole web worker.
+"""
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing import Pool
+from multiprocessing.connection import Client, Listener
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('queue', 'decode', 'detect', 'encode', 'total')
+
+
+class InferenceError(Exception):
+    pass
+
+
+class InferenceBusy(InferenceError):
+    pass
+
+
+def detect_and_encode(image_bytes):
+    """
+    Detect the faces in the photo and encode them when there is exactly one
+
+    Return the face locations in original photo coordinates, the encodings
+    and the time spent on each stage.
+    """
+    import face_recognition
+    from .preprocessing import load_image, scale_locations
+
+    timings = {}
+    started_on = time.perf_counter()
+    image, scale = load_image(image_bytes)
+    decoded_on = time.perf_counter()
+    timings['decode'] = decoded_on - started_on
+
+    face_locations = face_recognition.face_locations(image, model="hog")
+    detected_on = time.perf_counter()
+    timings['detect'] = detected_on - decoded_on
+
+    encodings = []
+    if len(face_locations) == 1:
+        encodings = face_recognition.face_encodings(image, face_locations)
+
+    timings['encode'] = time.perf_counter() - detected_on
+    return {
+        'locations': scale_locations(face_locations, scale),
+        'encodings': encodings,
+        'timings': timings,
+    }
+
+
+def detect_and_encode_batch(images):
+    """
+    Run `detect_and_encode` over several photos in one pool task
+
+    The photos are still detected and encoded one after another, dlib has no
+    batched HOG detector. A batch only saves the pool round trips.
+    """
+    return [detect_and_encode(image_bytes) for image_bytes in images]
+
+
+def warm_up():
+    """
+    Load the dlib models and the photo decoder and run them once so the first request is not slower
+    """
+    import io
+    import face_recognition
+    from PIL import Image
+    from .preprocessing import load_image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (150, 150)).save(buffer, 'JPEG')
+    image, _ = load_image(buffer.getvalue())
+    face_recognition.face_locations(image, model="hog")
+    face_recognition.face_encodings(image, [(0, 150, 150, 0)])
+
+
+def warm_up_worker():
+    """
+    Prepare a process that serves faces before its first request
+
+    The dlib models are only loaded when the faces are encoded inline, the
+    inference service warms up its own pool. The kiosk gallery is built in
+    any case.
+    """
+    from django.db import connections
+    from .gallery import get_gallery
+
+    if not settings.FACE_INFERENCE['ADDRESS']:
+        warm_up()
+
+    get_gallery()
+    # uWSGI forks its workers after loading the application, they must not share a connection
+    connections.close_all()
+
+
+def _get_image_bytes(image):
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return bytes(image)
+
+    image.seek(0)
+    image_bytes = image.read()
+    image.seek(0)
+    return image_bytes
+
+
+def _call(request, timeout, address=None):
+    config = settings.FACE_INFERENCE
+    conn = Client(address or config['ADDRESS'], authkey=config['AUTHKEY'].encode())
+    try:
+        conn.send(request)
+        if not conn.poll(timeout):
+            raise InferenceBusy('Face inference timed out')
+
+        response = conn.recv()
+    finally:
+        conn.close()
+
+    if response.get('error') == 'busy':
+        raise InferenceBusy('Face inference queue is full')
+
+    if response.get('error'):
+        raise InferenceError(response['error'])
+
+    return response
+
+
+_pending = threading.BoundedSemaphore(settings.FACE_INFERENCE['MAX_PENDING'])
+
+
+def encode_faces(image, timings=None):
+    """
+    Return the face locations and encodings of the photo
+
+    `image` is an uploaded file or its bytes. Without a configured service
+    address the work runs inline in the calling process. The time spent on
+    each stage is added to the `timings` dict when given.
+    """
+    image_bytes = _get_image_bytes(image)
+    if settings.FACE_INFERENCE['ADDRESS']:
+        result = _request_encoding(image_bytes)
+    else:
+        result = detect_and_encode(image_bytes)
+
+    if timings is not None:
+        timings.update(result['timings'])
+
+    return result['locations'], result['encodings']
+
+
+def _request_encoding(image_bytes):
+    config = settings.FACE_INFERENCE
+    timeout = config['TIMEOUT']
+    if not _pending.acquire(timeout=timeout):
+        raise InferenceBusy('Too many pending face inference requests')
+
+    try:
+        return _call({'op': 'encode', 'image': image_bytes}, timeout)
+    except (ConnectionError, FileNotFoundError) as exc:
+        if not config['FALLBACK_INLINE']:
+            raise InferenceError('Face inference service is unavailable') from exc
+
+        logger.warning('Face inference service is unavailable, encoding inline')
+        return detect_and_encode(image_bytes)
+    finally:
+        _pending.release()
+
+
+def get_stats():
+    """
+    Queue depth and stage latencies reported by the inference service
+    """
+    if not settings.FACE_INFERENCE['ADDRESS']:
+        return {'enabled': False}
+
+    try:
+        stats = _call({'op': 'stats'}, settings.FACE_INFERENCE['TIMEOUT'])['stats']
+    except (ConnectionError, FileNotFoundError, InferenceError) as exc:
+        return {'enabled': True, 'error': str(exc)}
+
+    stats['enabled'] = True
+    return stats
+
+
+class LatencyRecorder:
+    """
+    Keep the most recent latencies of every stage
+    """
+
+    def __init__(self, window=1000):
+        self._samples = {stage: deque(maxlen=window) for stage in STAGES}
+        self._lock = threading.Lock()
+
+    def add(self, timings):
+        with self._lock:
+            for stage, seconds in timings.items():
+                self._samples[stage].append(seconds)
+
+    def summary(self):
+        ret = {}
+        with self._lock:
+            for stage, samples in self._samples.items():
+                samples = sorted(samples)
+                if not samples:
+                    ret[stage] = {'count': 0}
+                    continue
+
+                ret[stage] = {
+                    'count': len(samples),
+                    'mean_ms': 1000 * sum(samples) / len(samples),
+                    'p50_ms': 1000 * samples[len(samples) // 2],
+                    'p95_ms': 1000 * samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+                    'max_ms': 1000 * samples[-1],
+                }
+
+        return ret
+
+
+class MicroBatcher:
+    """
+    Group concurrent requests into batches handled by one call
+
+    A batch takes the items already waiting, up to `batch_size`, and is
+    dispatched at once; it never waits for more items to arrive. `handler`
+    receives the items and a callback to call with the list of results, or
+    with an exception, so several batches may be in flight at once.
+    """
+
+    def __init__(self, handler, batch_size):
+        self.batch_size = batch_size
+        self._handler = handler
+        self._queue = queue.Queue()
+        self._sizes = Counter()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._collect, daemon=True).start()
+
+    def submit(self, item):
+        """
+        Return a Future of the result of the item
+        """
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def stats(self):
+        with self._lock:
+            sizes = dict(sorted(self._sizes.items()))
+
+        batches = sum(sizes.values())
+        return {
+            'batch_size': self.batch_size,
+            'batches': batches,
+            'mean_batch_size': sum(size * count for size, count in sizes.items()) / batches if batches else 0.0,
+            'batch_sizes': sizes,
+        }
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            with self._lock:
+                self._sizes[len(batch)] += 1
+
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        futures = [future for _, future in batch]
+
+        def done(results):
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+        def failed(exc):
+            for future in futures:
+                future.set_exception(exc)
+
+        try:
+            self._handler([item for item, _ in batch], done, failed)
+        except Exception as exc:
+            failed(exc)
+
+
+def _connect_socket(address):
+    """
+    Open and close a plain connection to the socket, raise OSError when nothing listens on it
+    """
+    probe = socket.socket(socket.AF_UNIX)
+    try:
+        probe.connect(address)
+    finally:
+        probe.close()
+
+
+def remove_stale_socket(address):
+    """
+    Remove the socket file left behind by a service that did not shut down
+
+    Raise InferenceError when a service is still listening on it.
+    """
+    if not os.path.exists(address):
+        return
+
+    try:
+        _connect_socket(address)
+    except OSError:
+        os.unlink(address)
+    else:
+        raise InferenceError(f'A face inference service is already listening on {address}')
+
+
+class InferenceServer:
+    """
+    Serve face inference requests over a local socket with a process pool
+
+    At most `queue_size` photos are queued or running at once; a request
+    that cannot get a place, or whose photo is not done, within `timeout`
+    seconds is answered as busy. The place of a photo is only given back once
+    the pool is done with it.
+    With `batch_size` above 1, the requests waiting for the pool are sent to
+    it in batches by a MicroBatcher, see `detect_and_encode_batch`.
+    """
+
+    def __init__(self, address, authkey, processes, queue_size, timeout, batch_size=1):
+        self.address = address
+        self.authkey = authkey
+        self.processes = processes
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._queue_size = queue_size
+        self._depth = 0
+        self._served = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._lock = threading.Lock()
+        self._latencies = LatencyRecorder()
+        self._pool = None
+        self._batcher = None
+        self._closed = False
+
+    def serve_forever(self):
+        self._pool = Pool(self.processes, initializer=warm_up)
+        if self.batch_size > 1:
+            self._batcher = MicroBatcher(self._encode_batch, self.batch_size)
+
+        remove_stale_socket(self.address)
+        listener = Listener(self.address, authkey=self.authkey)
+        logger.info('Face inference service listening on %s with %d processes', self.address, self.processes)
+        try:
+            while not self._closed:
+                try:
+                    conn = listener.accept()
+                except Exception:
+                    # the connection of `close` does not authenticate
+                    if self._closed:
+                        break
+
+                    logger.exception('Failed to accept face inference connection')
+                    continue
+
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+            self._pool.terminate()
+
+    def close(self):
+        """
+        Stop serving, also from a signal handler of the thread blocked in `serve_forever`
+        """
+        self._closed = True
+        try:
+            # wake up the pending accept, without waiting for it to answer
+            _connect_socket(self.address)
+        except OSError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            ret = {
+                'processes': self.processes,
+                'queue_size': self._queue_size,
+                'queue_depth': self._depth,
+                'served': self._served,
+                'rejected': self._rejected,
+                'timed_out': self._timed_out,
+            }
+
+        ret['latency'] = self._latencies.summary()
+        if self._batcher is not None:
+            ret['batching'] = self._batcher.stats()
+
+        return ret
+
+    def _handle(self, conn):
+        try:
+            request = conn.recv()
+            if request.get('op') == 'stats':
+                conn.send({'stats': self.stats()})
+            elif request.get('op') == 'encode':
+                conn.send(self._encode(request['image']))
+            else:
+                conn.send({'error': 'Unknown operation'})
+        except (EOFError, OSError):
+            pass
+        except Exception as exc:
+            logger.exception('Face inference request failed')
+            try:
+                conn.send({'error': str(exc) or exc.__class__.__name__})
+            except OSError:
+                pass
+        finally:
+            conn.close()
+
+    def _encode(self, image_bytes):
+        queued_on = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._rejected += 1
+            return {'error': 'busy'}
+
+        with self._lock:
+            self._depth += 1
+
+        try:
+            if self._batcher is not None:
+                future = self._batcher.submit(image_bytes)
+            else:
+                future = Future()
+                self._pool.apply_async(
+                    detect_and_encode, (image_bytes,), callback=future.set_result, error_callback=future.set_exception
+                )
+        except Exception:
+            self._release()
+            raise
+
+        # the place is only given back once the pool is done with the photo, even when the request timed out
+        future.add_done_callback(self._release)
+        try:
+            result = future.result(self.timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._timed_out += 1
+            return {'error': 'busy'}
+
+        total = time.perf_counter() - queued_on
+        timings = dict(result['timings'])
+        timings['total'] = total
+        timings['queue'] = max(total - sum(result['timings'].values()), 0)
+        self._latencies.add(timings)
+        return result
+
+    def _release(self, future=None):
+        with self._lock:
+            self._depth -= 1
+            self._served += 1
+        self._slots.release()
+
+    def _encode_batch(self, images, done, failed):
+        """
+        Split the batch into one pool task per process, a task runs its photos one after another
+        """
+        size = -(-len(images) // self.processes)
+        chunks = [images[i:i + size] for i in range(0, len(images), size)]
+        results = [None] * len(chunks)
+        pending = [len(chunks)]
+        lock = threading.Lock()
+
+        def chunk_done(index, chunk_results):
+            with lock:
+                results[index] = chunk_results
+                pending[0] -= 1
+                finished = pending[0] == 0
+
+            if finished:
+                done([result for chunk_results in results for result in chunk_results])
+
+        def chunk_failed(exc):
+            with lock:
+                # only the first failure is reported
+                reported = pending[0] <= 0
+                pending[0] = 0
+
+            if not reported:
+                failed(exc)
+
+        for index, chunk in enumerate(chunks):
+            self._pool.apply_async(
+                detect_and_encode_batch, (chunk,),
+                callback=lambda chunk_results, index=index: chunk_done(index, chunk_results),
+                error_callback=chunk_failed
+            )
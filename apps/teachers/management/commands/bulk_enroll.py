@@ -0,0 +1,80 @@
+import csv
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.teachers.enrollment import run_enrollment
+from apps.teachers.models import BulkEnrollment
+
+
+class Command(BaseCommand):
+    help = 'Enroll teacher photos from a zip file or directory laid out as <work_no>/*.jpg'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', nargs='?', help='Zip file or directory')
+        parser.add_argument('--enrollment', type=int, help='Run this enrollment, e.g. of an uploaded archive')
+        parser.add_argument('--processes', type=int, help='Encoding processes, the CPU count by default')
+        parser.add_argument('--batch-size', type=int, help='Photos committed at once')
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Start a new enrollment instead of resuming the last one of the same source'
+        )
+        parser.add_argument('--report', help='Write the rejected photos to this CSV file')
+
+    def handle(self, *args, **options):
+        if options['enrollment']:
+            enrollment = BulkEnrollment.objects.filter(id=options['enrollment']).first()
+            if enrollment is None:
+                raise CommandError(f"Enrollment {options['enrollment']} does not exist")
+        elif options['source']:
+            enrollment = self.get_enrollment(options)
+        else:
+            raise CommandError('Give a source or an enrollment')
+
+        run_enrollment(
+            enrollment, processes=options['processes'], batch_size=options['batch_size'],
+            progress=self.write_progress
+        )
+
+        rejections = enrollment.rejections.order_by('work_no', 'filename')
+        if options['report']:
+            with open(options['report'], 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['work_no', 'filename', 'reason', 'faces'])
+                for rejection in rejections:
+                    writer.writerow([
+                        rejection.work_no, rejection.filename, rejection.get_reason_display(), rejection.faces
+                    ])
+        else:
+            for rejection in rejections:
+                self.stdout.write(
+                    f'Rejected {rejection.filename}: {rejection.get_reason_display()} ({rejection.faces} faces)'
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Enrollment {enrollment.id}: {enrollment.enrolled} enrolled, {enrollment.skipped} skipped, '
+            f'{rejections.count()} rejected of {enrollment.total} photos'
+        ))
+
+    def get_enrollment(self, options):
+        source = os.path.abspath(options['source'])
+        if not os.path.exists(source):
+            raise CommandError(f'{source} does not exist')
+
+        enrollment = None
+        if not options['restart']:
+            enrollment = BulkEnrollment.objects.filter(source=source).exclude(
+                status=BulkEnrollment.STATUS_COMPLETED
+            ).order_by('-id').first()
+
+        if enrollment is None:
+            return BulkEnrollment.objects.create(source=source)
+
+        self.stdout.write(f'Resuming enrollment {enrollment.id}')
+        return enrollment
+
+    def write_progress(self, enrollment):
+        self.stdout.write(
+            f'{enrollment.processed}/{enrollment.total} processed, '
+            f'{enrollment.enrolled} enrolled, {enrollment.skipped} skipped'
+        )
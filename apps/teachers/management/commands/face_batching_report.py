@@ -0,0 +1,61 @@
+import glob
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.teachers.benchmark import run_batching_benchmark, sample_face_images
+
+
+class Command(BaseCommand):
+    help = 'Measure the face inference service throughput for several batch sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--images',
+            help='Directory of photos with one face each, photos of the sample face are used by default'
+        )
+        parser.add_argument('--samples', type=int, default=32, help='Number of photos of the sample face')
+        parser.add_argument('--size', default='640x480', help='Size of the photos of the sample face')
+        parser.add_argument('--limit', type=int, default=64)
+        parser.add_argument('--repeat', type=int, default=1)
+        parser.add_argument('--batch-sizes', default='1,2,4,8,16')
+        parser.add_argument('--processes', type=int, default=os.cpu_count())
+        parser.add_argument('--clients', type=int, default=32, help='Concurrent requests')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        if options['images']:
+            paths = sorted(
+                path for path in glob.glob(os.path.join(options['images'], '**', '*'), recursive=True)
+                if path.lower().endswith(('.jpg', '.jpeg', '.png'))
+            )[:options['limit']]
+            images = []
+            for path in paths:
+                with open(path, 'rb') as f:
+                    images.append(f.read())
+        else:
+            width, height = (int(value) for value in options['size'].split('x'))
+            images = sample_face_images(options['samples'], width, height)
+
+        if not images:
+            raise CommandError('No photos to benchmark')
+
+        results = []
+        self.stdout.write(
+            f"{'batch size':>10} {'mean batch':>10} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+        )
+        for batch_size in [int(value) for value in options['batch_sizes'].split(',')]:
+            result = run_batching_benchmark(
+                images, batch_size, options['processes'], options['clients'], repeat=options['repeat']
+            )
+            results.append(result)
+            latency = result['latency']
+            self.stdout.write(
+                f"{batch_size:>10} {result['mean_batch_size']:>10.2f} {result['throughput']:>8.1f} "
+                f"{latency['p50_ms']:>9.1f} {latency['p95_ms']:>9.1f} {latency['p99_ms']:>9.1f}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
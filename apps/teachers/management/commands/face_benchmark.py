@@ -0,0 +1,110 @@
+import glob
+import json
+import os
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.teachers.benchmark import NoFaceError, environment, find_regressions, run_benchmark, sample_face_images
+from apps.teachers.models import TeacherImage
+
+
+class Command(BaseCommand):
+    help = 'Measure per-stage latency, throughput and peak RSS of the face check-in and enrollment paths'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--images',
+            help='Directory of photos with one face each, photos of the sample face are used by default'
+        )
+        parser.add_argument('--enrolled', action='store_true', help='Use the enrolled teacher images')
+        parser.add_argument('--samples', type=int, default=20, help='Number of photos of the sample face')
+        parser.add_argument('--size', default='1280x960', help='Size of the photos of the sample face')
+        parser.add_argument('--limit', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=1)
+        parser.add_argument('--benchmarks', default='checkin,kiosk,enroll')
+        parser.add_argument(
+            '--workers', default=f'1,{os.cpu_count()}',
+            help='Comma separated numbers of concurrent worker processes'
+        )
+        parser.add_argument('--teachers', type=int, default=1000, help='Size of the synthetic gallery')
+        parser.add_argument('--per-teacher', type=int, default=10)
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='JSON result file to compare the p95 latencies with')
+        parser.add_argument(
+            '--max-regression', type=float, default=0.2,
+            help='Fail when a p95 latency grew by more than this ratio over the baseline'
+        )
+
+    def handle(self, *args, **options):
+        images = self.load_images(options)
+        if not images:
+            raise CommandError('No photos to benchmark')
+
+        result = {
+            'created': datetime.now().isoformat(),
+            'environment': environment(),
+            'images': len(images),
+            'runs': [],
+        }
+        for name in options['benchmarks'].split(','):
+            for workers in sorted({int(value) for value in options['workers'].split(',')}):
+                try:
+                    run = run_benchmark(
+                        name, images, workers=workers, repeat=options['repeat'],
+                        teachers=options['teachers'], per_teacher=options['per_teacher']
+                    )
+                except NoFaceError as exc:
+                    raise CommandError(str(exc))
+
+                result['runs'].append(run)
+                self.write_run(run)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(result, f, indent=2)
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                regressions = find_regressions(result, json.load(f), options['max_regression'])
+
+            for name, workers, stage, before, after in regressions:
+                self.stderr.write(f'{name} x{workers} {stage}: p95 {before:.1f}ms -> {after:.1f}ms')
+
+            if regressions:
+                raise CommandError(f'{len(regressions)} stages regressed')
+
+    def load_images(self, options):
+        if options['images']:
+            paths = sorted(
+                path for path in glob.glob(os.path.join(options['images'], '**', '*'), recursive=True)
+                if path.lower().endswith(('.jpg', '.jpeg', '.png'))
+            )
+        elif options['enrolled']:
+            paths = [
+                os.path.join(settings.MEDIA_ROOT, path)
+                for path in TeacherImage.objects.values_list('image', flat=True)
+            ]
+        else:
+            width, height = (int(value) for value in options['size'].split('x'))
+            return sample_face_images(options['samples'], width, height)
+
+        ret = []
+        for path in paths[:options['limit']]:
+            with open(path, 'rb') as f:
+                ret.append(f.read())
+
+        return ret
+
+    def write_run(self, run):
+        self.stdout.write(
+            f"{run['benchmark']} with {run['workers']} workers: {run['requests']} requests, "
+            f"{run['throughput']:.1f}/s, peak RSS {run['peak_rss_kb'] / 1024:.0f}MB"
+        )
+        self.stdout.write(f"{'stage':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for stage, summary in run['stages'].items():
+            self.stdout.write(
+                f"{stage:>10} {summary['p50_ms']:>9.2f} {summary['p95_ms']:>9.2f} "
+                f"{summary['p99_ms']:>9.2f} {summary['max_ms']:>9.2f}"
+            )
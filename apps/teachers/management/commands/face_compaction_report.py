@@ -0,0 +1,59 @@
+import json
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.teachers.benchmark import compaction_tradeoff, synthetic_encodings
+from apps.teachers.compaction import DTYPES
+from apps.teachers.features import load_embedding_matrix
+
+
+class Command(BaseCommand):
+    help = 'Compare accuracy, latency and memory of full and compacted teacher encodings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--synthetic', type=int, default=0,
+            help='Number of synthetic teachers, the enrolled encodings are used by default'
+        )
+        parser.add_argument('--per-teacher', type=int, default=20)
+        parser.add_argument('--noise', type=float, default=0.03, help='Spread of the synthetic encodings')
+        parser.add_argument('--exemplars', default='2,4,8,16')
+        parser.add_argument('--dtypes', default=','.join(DTYPES))
+        parser.add_argument('--tolerance', type=float, default=0.5)
+        parser.add_argument('--impostors', type=int, default=50, help='Impostor queries per teacher')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        if options['synthetic']:
+            encodings = synthetic_encodings(options['synthetic'], options['per_teacher'], options['noise'])
+            matrix = encodings.reshape(-1, encodings.shape[-1])
+            teacher_ids = np.repeat(np.arange(options['synthetic']), options['per_teacher'])
+        else:
+            matrix, teacher_ids = load_embedding_matrix()
+
+        if not len(matrix):
+            raise CommandError('No encodings to compare')
+
+        configs = [None] + [
+            (int(exemplars), dtype)
+            for exemplars in options['exemplars'].split(',') for dtype in options['dtypes'].split(',')
+        ]
+        results = compaction_tradeoff(
+            matrix, teacher_ids, configs, tolerance=options['tolerance'], impostors=options['impostors']
+        )
+
+        self.stdout.write(
+            f"{'exemplars':>9} {'dtype':>8} {'bytes':>8} {'match us':>9} "
+            f"{'FAR':>8} {'FRR':>8} {'agreement':>10}"
+        )
+        for result in results:
+            self.stdout.write(
+                f"{result['exemplars'] or 'all':>9} {result['dtype']:>8} {result['bytes_per_teacher']:>8.0f} "
+                f"{result['match_us']:>9.1f} {result['far']:>8.4f} {result['frr']:>8.4f} "
+                f"{result['agreement']:>10.4f}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from apps.teachers.benchmark import measure_ingest, synthetic_images
+
+
+class Command(BaseCommand):
+    help = 'Compare the latency and peak memory of ingesting a check-in photo with the legacy ingest'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--image', help='Sample photo, a synthetic photo is used by default')
+        parser.add_argument('--size', default='3264x2448', help='Size of the synthetic photo')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--output', help='Write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        if options['image']:
+            with open(options['image'], 'rb') as f:
+                image_bytes = f.read()
+        else:
+            width, height = (int(value) for value in options['size'].split('x'))
+            image_bytes = synthetic_images(1, width, height)[0]
+
+        results = measure_ingest(image_bytes, options['repeat'])
+        self.stdout.write(f"Photo of {len(image_bytes) / 1024 / 1024:.1f}MB")
+        self.stdout.write(f"{'ingest':>8} {'mean ms':>9} {'traced MB':>10} {'RSS MB':>8}")
+        for result in results:
+            rss_peak = f"{result['rss_peak_kb'] / 1024:.1f}" if result['rss_peak_kb'] is not None else '-'
+            self.stdout.write(
+                f"{result['ingest']:>8} {result['mean_ms']:>9.1f} {result['traced_peak_kb'] / 1024:>10.1f} "
+                f"{rss_peak:>8}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
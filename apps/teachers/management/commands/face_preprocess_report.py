@@ -0,0 +1,92 @@
+import glob
+import os
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.teachers.models import TeacherImage
+from apps.teachers.preprocessing import load_image
+
+
+class Command(BaseCommand):
+    help = 'Compare face detection latency and accuracy for several FACE_IMAGE_MAX_DIMENSION values'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--images',
+            help='Directory of sample photos, enrolled teacher images are used by default'
+        )
+        parser.add_argument('--limit', type=int, default=50)
+        parser.add_argument(
+            '--dimensions', default='0,480,640,800,1024',
+            help='Comma separated max dimensions, 0 stands for the original size'
+        )
+
+    def handle(self, *args, **options):
+        import face_recognition
+
+        dimensions = [int(value) for value in options['dimensions'].split(',')]
+        if 0 not in dimensions:
+            dimensions.insert(0, 0)
+
+        if options['images']:
+            image_paths = sorted(
+                path for path in glob.glob(os.path.join(options['images'], '**', '*'), recursive=True)
+                if path.lower().endswith(('.jpg', '.jpeg', '.png'))
+            )
+        else:
+            image_paths = [
+                os.path.join(settings.MEDIA_ROOT, path)
+                for path in TeacherImage.objects.values_list('image', flat=True)
+            ]
+
+        image_paths = image_paths[:options['limit']]
+        results = {dimension: {'decode': [], 'detect': [], 'encode': [], 'detected': 0, 'distances': []}
+                   for dimension in dimensions}
+
+        for image_path in image_paths:
+            with open(image_path, 'rb') as f:
+                image_bytes = f.read()
+
+            reference = None
+            for dimension in sorted(dimensions):
+                result = results[dimension]
+                started_on = time.perf_counter()
+                image, _ = load_image(image_bytes, dimension)
+                decoded_on = time.perf_counter()
+                face_locations = face_recognition.face_locations(image, model="hog")
+                detected_on = time.perf_counter()
+                result['decode'].append(decoded_on - started_on)
+                result['detect'].append(detected_on - decoded_on)
+                if len(face_locations) != 1:
+                    continue
+
+                encoding = face_recognition.face_encodings(image, face_locations)[0]
+                result['encode'].append(time.perf_counter() - detected_on)
+                result['detected'] += 1
+                if dimension == 0:
+                    reference = encoding
+                elif reference is not None:
+                    result['distances'].append(np.linalg.norm(reference - encoding))
+
+        self.stdout.write(f'{len(image_paths)} images')
+        self.stdout.write(
+            f"{'max dimension':>14} {'decode ms':>10} {'detect ms':>10} {'encode ms':>10} "
+            f"{'one face':>9} {'mean dist':>10} {'max dist':>9}"
+        )
+        for dimension in sorted(dimensions):
+            result = results[dimension]
+            distances = result['distances']
+            self.stdout.write(
+                f"{dimension or 'original':>14} "
+                f"{_mean_ms(result['decode']):>10.1f} {_mean_ms(result['detect']):>10.1f} "
+                f"{_mean_ms(result['encode']):>10.1f} "
+                f"{result['detected']:>4}/{len(image_paths):<4} "
+                f"{np.mean(distances) if distances else 0:>10.3f} {max(distances) if distances else 0:>9.3f}"
+            )
+
+
+def _mean_ms(samples):
+    return 1000 * sum(samples) / len(samples) if samples else 0
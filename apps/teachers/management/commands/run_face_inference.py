@@ -0,0 +1,33 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.teachers.inference import InferenceServer
+
+
+class Command(BaseCommand):
+    help = 'Run the local face inference service used by the web workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.FACE_INFERENCE['PROCESSES'])
+        parser.add_argument('--queue-size', type=int, default=settings.FACE_INFERENCE['QUEUE_SIZE'])
+        parser.add_argument('--batch-size', type=int, default=settings.FACE_INFERENCE['BATCH_SIZE'])
+
+    def handle(self, *args, **options):
+        config = settings.FACE_INFERENCE
+        if not config['ADDRESS']:
+            raise CommandError('FACE_INFERENCE_ADDRESS is not configured')
+
+        server = InferenceServer(
+            address=config['ADDRESS'],
+            authkey=config['AUTHKEY'].encode(),
+            processes=options['processes'],
+            queue_size=options['queue_size'],
+            timeout=config['TIMEOUT'],
+            batch_size=options['batch_size'],
+        )
+        # systemd stops the service with SIGTERM, close it so the socket file is removed
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.close())
+        self.stdout.write(f"Face inference service listening on {config['ADDRESS']}")
+        server.serve_forever()
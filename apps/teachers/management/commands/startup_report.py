@@ -0,0 +1,93 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.teachers.startup import MODES
+
+
+METRICS = ('startup_ms', 'startup_rss_kb', 'warm_up_ms', 'first_request_ms', 'second_request_ms', 'rss_kb')
+
+
+class Command(BaseCommand):
+    help = 'Compare the cold start and first face request of a worker with eager, lazy and warmed up imports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--image', help='Photo sent as the first requests, a photo of the sample face by default')
+        parser.add_argument('--modes', default=','.join(MODES))
+        parser.add_argument('--repeat', type=int, default=3, help='Fresh processes per mode, medians are reported')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+
+    def run_probe(self, mode, image_path):
+        # faces are encoded inline, as in a process without the inference service
+        env = dict(os.environ, FACE_INFERENCE_ADDRESS='', FACE_WARM_UP='false')
+        completed = subprocess.run(
+            [sys.executable, '-m', 'apps.teachers.startup', mode, image_path],
+            cwd=settings.BASE_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True
+        )
+        if completed.returncode:
+            raise CommandError(f'The {mode} probe failed:\n{completed.stderr}')
+
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        modes = options['modes'].split(',')
+        for mode in modes:
+            if mode not in MODES:
+                raise CommandError(f"Unknown mode {mode}, expected one of {', '.join(MODES)}")
+
+        if options['image']:
+            image_path = options['image']
+        else:
+            from apps.teachers.benchmark import sample_face_images
+
+            with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as f:
+                f.write(sample_face_images(1, 640, 480)[0])
+            image_path = f.name
+
+        results = {}
+        try:
+            for mode in modes:
+                runs = [self.run_probe(mode, image_path) for _ in range(options['repeat'])]
+                result = {metric: statistics.median(run[metric] for run in runs) for metric in METRICS}
+                result['heavy_modules'] = runs[0]['heavy_modules']
+                results[mode] = result
+        finally:
+            if not options['image']:
+                os.unlink(image_path)
+
+        self.stdout.write(
+            f"{'mode':>6} {'start ms':>9} {'start MB':>9} {'warm-up ms':>10} {'1st req ms':>10} {'2nd req ms':>10} "
+            f"{'peak MB':>8}  heavy modules at start"
+        )
+        for mode, result in results.items():
+            self.stdout.write(
+                f"{mode:>6} {result['startup_ms']:>9.1f} {result['startup_rss_kb'] / 1024:>9.1f} "
+                f"{result['warm_up_ms']:>10.1f} {result['first_request_ms']:>10.1f} "
+                f"{result['second_request_ms']:>10.1f} {result['rss_kb'] / 1024:>8.1f}  "
+                f"{', '.join(result['heavy_modules']) or '-'}"
+            )
+
+        if 'lazy' in results and 'eager' in results:
+            lazy, eager = results['lazy'], results['eager']
+            self.stdout.write(
+                f"Lazy imports start {eager['startup_ms'] - lazy['startup_ms']:.1f} ms faster and "
+                f"{(eager['startup_rss_kb'] - lazy['startup_rss_kb']) / 1024:.1f} MB smaller than eager ones"
+            )
+
+        if 'lazy' in results and 'warm' in results:
+            lazy, warm = results['lazy'], results['warm']
+            self.stdout.write(
+                f"Warm-up takes {warm['warm_up_ms']:.1f} ms at start and saves "
+                f"{lazy['first_request_ms'] - warm['first_request_ms']:.1f} ms on the first face request"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from apps.teachers.features import ENCODER_VERSION
+from apps.teachers.models import TeacherImage
+from apps.teachers.tasks import sync_extract_feature
+
+
+class Command(BaseCommand):
+    help = 'Encode the teacher images which have no encoding or were encoded by an older encoder'
+
+    def handle(self, *args, **options):
+        teacher_ids = TeacherImage.objects.filter(
+            Q(encoding__isnull=True) | ~Q(encoder_version=ENCODER_VERSION)
+        ).values_list('teacher_id', flat=True).distinct()
+
+        teacher_ids = sorted(set(teacher_ids))
+        for index, teacher_id in enumerate(teacher_ids, 1):
+            sync_extract_feature({'teacher': teacher_id})
+            self.stdout.write(f'{index}/{len(teacher_ids)} teacher {teacher_id}')
+
+        self.stdout.write(self.style.SUCCESS(f'Synced the encodings of {len(teacher_ids)} teachers'))
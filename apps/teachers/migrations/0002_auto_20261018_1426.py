@@ -0,0 +1,23 @@
+# Generated by Django 2.2 on 2026-10-18 14:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teachers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='teacherimage',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='teacherimage',
+            name='encoding',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
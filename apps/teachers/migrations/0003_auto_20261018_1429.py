@@ -0,0 +1,50 @@
+# Generated by Django 2.2 on 2026-10-18 14:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teachers', '0002_auto_20261018_1426'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeatureVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='teacherimage',
+            name='encoder_version',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='teacherimage',
+            name='face_bottom',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='teacherimage',
+            name='face_left',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='teacherimage',
+            name='face_right',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='teacherimage',
+            name='face_top',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='teacherprofile',
+            name='features_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
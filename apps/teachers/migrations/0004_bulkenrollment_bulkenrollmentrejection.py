@@ -0,0 +1,45 @@
+# Generated by Django 2.2 on 2026-10-18 14:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teachers', '0003_auto_20261018_1429'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BulkEnrollment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('source', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('P', '等待'), ('R', '进行中'), ('C', '完成'), ('F', '失败')], default='P', max_length=1)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('enrolled', models.PositiveIntegerField(default=0)),
+                ('skipped', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'ordering': ('-updated',),
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='BulkEnrollmentRejection',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('work_no', models.CharField(max_length=100)),
+                ('filename', models.CharField(max_length=255)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('reason', models.CharField(choices=[('T', '工号不存在'), ('N', '未检测到人脸'), ('M', '检测到多张人脸'), ('U', '无法读取图片')], max_length=1)),
+                ('faces', models.PositiveIntegerField(default=0)),
+                ('enrollment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rejections', to='teachers.BulkEnrollment')),
+            ],
+        ),
+    ]
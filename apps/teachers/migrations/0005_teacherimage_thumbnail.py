@@ -0,0 +1,19 @@
+# Generated by Django 2.2 on 2026-10-18 14:49
+
+import apps.core.thumbnails
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teachers', '0004_bulkenrollment_bulkenrollmentrejection'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='teacherimage',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to=apps.core.thumbnails.thumbnail_path),
+        ),
+    ]
@@ -1,7 +1,11 @@
+import hashlib
+
 from django.db import models
+from django.db.models import F
 
 from ..accounts.models import User
 from ..core.models import TimeStampedModel
+from ..core.thumbnails import thumbnail_path
 
 
 class Department(TimeStampedModel):
@@ -71,14 +75,49 @@ class TeacherProfile(TimeStampedModel):
         default=GENDER_MALE
     )
 
+    # incremented whenever the face encodings of the teacher are rebuilt
+    features_version = models.PositiveIntegerField(
+        default=0
+    )
+
     def __str__(self):
         return f"{self.user.name}'s profile"
 
 
+class FeatureVersion(models.Model):
+    """Face encodings version
+
+    Single row counter incremented whenever the encodings of any teacher
+    change, so every node knows when to re-sync its face gallery
+    """
+    version = models.PositiveIntegerField(
+        default=0
+    )
+
+    @classmethod
+    def get_version(cls):
+        return cls.objects.filter(id=1).values_list('version', flat=True).first() or 0
+
+    @classmethod
+    def bump(cls):
+        if not cls.objects.filter(id=1).update(version=F('version') + 1):
+            cls.objects.get_or_create(id=1, defaults={'version': 1})
+
+
 def image_path(instance, filename):
     return f"{instance.teacher.user.username}/{filename}"
 
 
+def get_content_hash(file):
+    sha256 = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks():
+        sha256.update(chunk)
+
+    file.seek(0)
+    return sha256.hexdigest()
+
+
 class TeacherImage(models.Model):
 
     teacher = models.ForeignKey(
@@ -88,3 +127,155 @@ class TeacherImage(models.Model):
     )
 
     image = models.ImageField(upload_to=image_path)
+
+    # rendered by `make_teacher_image_thumbnails` once the image is stored
+    thumbnail = models.ImageField(
+        upload_to=thumbnail_path,
+        null=True,
+        blank=True
+    )
+
+    # sha256 of the image file, the encoding below is valid for this content only
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        db_index=True
+    )
+
+    # float32 128d face encoding, null until the image is encoded
+    encoding = models.BinaryField(
+        null=True,
+        blank=True,
+        editable=False
+    )
+
+    # face box in original image coordinates
+    face_top = models.PositiveIntegerField(
+        null=True,
+        blank=True
+    )
+
+    face_right = models.PositiveIntegerField(
+        null=True,
+        blank=True
+    )
+
+    face_bottom = models.PositiveIntegerField(
+        null=True,
+        blank=True
+    )
+
+    face_left = models.PositiveIntegerField(
+        null=True,
+        blank=True
+    )
+
+    encoder_version = models.CharField(
+        max_length=50,
+        blank=True,
+        default=''
+    )
+
+    def save(self, *args, **kwargs):
+        # a newly assigned file is not committed to the storage yet
+        if self.image and (not self.content_hash or not self.image._committed):
+            content_hash = get_content_hash(self.image)
+            if content_hash != self.content_hash:
+                self.content_hash = content_hash
+                self.encoding = None
+                self.thumbnail = None
+
+        super().save(*args, **kwargs)
+
+
+class BulkEnrollment(TimeStampedModel):
+    """Bulk photo enrollment model
+
+    One run over a zip file or directory laid out as `<work_no>/*.jpg`
+    """
+    STATUS_PENDING = 'P'
+    STATUS_RUNNING = 'R'
+    STATUS_COMPLETED = 'C'
+    STATUS_FAILED = 'F'
+    STATUS = (
+        (STATUS_PENDING, '等待'),
+        (STATUS_RUNNING, '进行中'),
+        (STATUS_COMPLETED, '完成'),
+        (STATUS_FAILED, '失败'),
+    )
+
+    # path of the zip file or the directory
+    source = models.CharField(
+        max_length=255
+    )
+
+    status = models.CharField(
+        max_length=1,
+        choices=STATUS,
+        default=STATUS_PENDING
+    )
+
+    total = models.PositiveIntegerField(
+        default=0
+    )
+
+    processed = models.PositiveIntegerField(
+        default=0
+    )
+
+    enrolled = models.PositiveIntegerField(
+        default=0
+    )
+
+    # images enrolled or rejected by a previous run
+    skipped = models.PositiveIntegerField(
+        default=0
+    )
+
+    error = models.TextField(
+        blank=True,
+        default=''
+    )
+
+
+class BulkEnrollmentRejection(models.Model):
+    """Image rejected by a bulk enrollment
+    """
+    REASON_UNKNOWN_TEACHER = 'T'
+    REASON_NO_FACE = 'N'
+    REASON_MULTIPLE_FACES = 'M'
+    REASON_UNREADABLE = 'U'
+    REASON = (
+        (REASON_UNKNOWN_TEACHER, '工号不存在'),
+        (REASON_NO_FACE, '未检测到人脸'),
+        (REASON_MULTIPLE_FACES, '检测到多张人脸'),
+        (REASON_UNREADABLE, '无法读取图片'),
+    )
+
+    enrollment = models.ForeignKey(
+        BulkEnrollment,
+        on_delete=models.CASCADE,
+        related_name='rejections'
+    )
+
+    work_no = models.CharField(
+        max_length=100
+    )
+
+    filename = models.CharField(
+        max_length=255
+    )
+
+    content_hash = models.CharField(
+        max_length=64
+    )
+
+    reason = models.CharField(
+        max_length=1,
+        choices=REASON
+    )
+
+    faces = models.PositiveIntegerField(
+        default=0
+    )
@@ -0,0 +1,110 @@
+"""
+Photo preprocessing shared by enrollment and check-in
+
+HOG detection time grows with the pixel count, while faces taken by a phone
+at arm's length stay detectable far below the camera resolution. Photos are
+therefore decoded at reduced size where the codec allows it, oriented with
+their EXIF tag, downscaled to `FACE_IMAGE_MAX_DIMENSION` and converted to RGB
+a single time.
+
+OpenCV decodes straight from the uploaded buffer through a memoryview, PIL
+only reads the header and decodes the formats OpenCV does not know.
+"""
+import io
+
+import cv2
+import numpy as np
+from django.conf import settings
+from PIL import Image, ImageOps
+
+
+EXIF_ORIENTATION = 0x0112
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+# JPEG decoders scale down by 1/2, 1/4 or 1/8 while decoding
+REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def load_image(image_bytes, max_dimension=None):
+    """
+    Decode the photo into an RGB array for face detection
+
+    Neither PIL nor OpenCV copy `image_bytes`. Return the array and the factor
+    that maps coordinates in the array back to coordinates in the original,
+    correctly oriented photo.
+    """
+    if max_dimension is None:
+        max_dimension = settings.FACE_IMAGE_MAX_DIMENSION
+
+    # a BytesIO over bytes shares their buffer until it is written to
+    image = Image.open(io.BytesIO(image_bytes))
+    width, height = image.size
+    try:
+        orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+    except Exception:
+        orientation = 1
+
+    if orientation in TRANSPOSED_ORIENTATIONS:
+        width, height = height, width
+
+    array = _decode(image_bytes, max(width, height), max_dimension)
+    if array is None:
+        array = _decode_with_pil(image, max_dimension)
+
+    return array, width / array.shape[1]
+
+
+def _decode(image_bytes, size, max_dimension):
+    """
+    Decode with OpenCV, which applies the EXIF orientation itself, None when it cannot
+    """
+    flags = cv2.IMREAD_COLOR
+    if max_dimension:
+        for factor, reduced_flags in REDUCED_FLAGS:
+            if size // factor >= max_dimension:
+                flags = reduced_flags
+                break
+
+    array = cv2.imdecode(np.frombuffer(memoryview(image_bytes), dtype=np.uint8), flags)
+    if array is None:
+        return None
+
+    cv2.cvtColor(array, cv2.COLOR_BGR2RGB, dst=array)
+    height, width = array.shape[:2]
+    if max_dimension and max(width, height) > max_dimension:
+        ratio = max_dimension / max(width, height)
+        size = (max(round(width * ratio), 1), max(round(height * ratio), 1))
+        array = cv2.resize(array, size, interpolation=cv2.INTER_AREA)
+
+    return array
+
+
+def _decode_with_pil(image, max_dimension):
+    if max_dimension:
+        image.draft('RGB', (max_dimension, max_dimension))
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    if max_dimension and max(image.size) > max_dimension:
+        image.thumbnail((max_dimension, max_dimension), Image.BILINEAR)
+
+    return np.asarray(image)
+
+
+def scale_locations(face_locations, scale):
+    """
+    Map (top, right, bottom, left) boxes found in a downscaled photo to the original photo
+    """
+    if scale == 1:
+        return list(face_locations)
+
+    return [
+        tuple(int(round(value * scale)) for value in face_location)
+        for face_location in face_locations
+    ]
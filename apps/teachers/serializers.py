@@ -45,7 +45,12 @@ class TeacherImageSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = m.TeacherImage
-        fields = '__all__'
+        exclude = (
+            'encoding',
+        )
+        read_only_fields = (
+            'thumbnail',
+        )
 
 
 class TeacherImageOnlySerializer(serializers.ModelSerializer):
@@ -55,7 +60,10 @@ class TeacherImageOnlySerializer(serializers.ModelSerializer):
     class Meta:
         model = m.TeacherImage
         exclude = (
-            'teacher',
+            'teacher', 'encoding',
+        )
+        read_only_fields = (
+            'thumbnail',
         )
 
 
@@ -193,3 +201,27 @@ class TeacherProfileExportSerializer(serializers.ModelSerializer):
 
     def get_position(self, instance):
         return instance.position.name if instance.position else ''
+
+
+class BulkEnrollmentRejectionSerializer(serializers.ModelSerializer):
+
+    reason = TMSChoiceField(m.BulkEnrollmentRejection.REASON)
+
+    class Meta:
+        model = m.BulkEnrollmentRejection
+        fields = (
+            'work_no', 'filename', 'reason', 'faces'
+        )
+
+
+class BulkEnrollmentSerializer(serializers.ModelSerializer):
+
+    status = TMSChoiceField(m.BulkEnrollment.STATUS, read_only=True)
+    rejections = BulkEnrollmentRejectionSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = m.BulkEnrollment
+        fields = (
+            'id', 'status', 'total', 'processed', 'enrolled', 'skipped', 'error', 'rejections',
+            'created', 'updated'
+        )
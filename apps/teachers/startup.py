@@ -0,0 +1,88 @@
+"""
+Startup cost of a worker process, see `manage.py startup_report`
+
+`python -m apps.teachers.startup <mode> [photo]` starts Django the way a web
+or Celery worker does (settings, URLconf and task modules), optionally sends
+the photo through the face pipeline twice and prints the measurements as one
+JSON line. The modes are
+
+- lazy: the face code is imported on the first face request
+- eager: the face code is imported at start, as before it was deferred
+- warm: lazy imports followed by the `FACE_WARM_UP` hook
+"""
+import json
+import resource
+import sys
+import time
+from importlib import import_module
+
+
+MODES = ('lazy', 'eager', 'warm')
+
+HEAVY_MODULES = ('face_recognition', 'dlib', 'cv2', 'numpy', 'PIL', 'geopy')
+
+# what the views, serializers and tasks imported at module level
+EAGER_IMPORTS = (
+    'face_recognition',
+    'geopy.distance',
+    'apps.teachers.features',
+    'apps.teachers.gallery',
+    'apps.teachers.inference',
+    'apps.teachers.enrollment',
+)
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def probe(mode, image_bytes=None):
+    started_on = time.perf_counter()
+
+    import django
+    django.setup()
+
+    from django.urls import get_resolver
+    from django.utils.module_loading import autodiscover_modules
+
+    get_resolver().url_patterns
+    autodiscover_modules('tasks')
+    if mode == 'eager':
+        for name in EAGER_IMPORTS:
+            import_module(name)
+
+    ret = {
+        'mode': mode,
+        'startup_ms': 1000 * (time.perf_counter() - started_on),
+        'startup_rss_kb': peak_rss_kb(),
+        'heavy_modules': [name for name in HEAVY_MODULES if name in sys.modules],
+        'warm_up_ms': 0.0,
+    }
+
+    if mode == 'warm':
+        from apps.teachers.inference import warm_up_worker
+
+        warmed_on = time.perf_counter()
+        warm_up_worker()
+        ret['warm_up_ms'] = 1000 * (time.perf_counter() - warmed_on)
+
+    if image_bytes is not None:
+        from apps.teachers.inference import encode_faces
+
+        for name in ('first_request_ms', 'second_request_ms'):
+            requested_on = time.perf_counter()
+            encode_faces(image_bytes)
+            ret[name] = 1000 * (time.perf_counter() - requested_on)
+
+    ret['rss_kb'] = peak_rss_kb()
+    return ret
+
+
+if __name__ == '__main__':
+    mode = sys.argv[1]
+    image_bytes = None
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], 'rb') as f:
+            image_bytes = f.read()
+
+    print(json.dumps(probe(mode, image_bytes)))
@@ -1,9 +1,5 @@
-import os
-import cv2
-import face_recognition
-import numpy as np
 from config.celery import app
-from django.conf import settings
+from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from . import models as m
 
@@ -11,55 +7,86 @@ from . import models as m
 @app.task
 def extract_feature(context):
     """
-    Append the 128d-features to the encoding files once images are added
+    Encode the images once they are added
     This is not used for now. Older version
     """
-    teacher_id = context['teacher']
-    image_ids = context['image_ids']
-    teacher = get_object_or_404(m.TeacherProfile, id=teacher_id)
-    username = teacher.user.username
+    sync_extract_feature({'teacher': context['teacher']})
+
 
-    if not os.path.exists(settings.FEATURE_ROOT):
-        os.makedirs(settings.FEATURE_ROOT)
+def encode_teacher_image(teacher_image):
+    """
+    Store the face encoding and box of the image, return False when it has no single face
+
+    An encoding already computed for the same content by the current encoder
+    is reused, so only new or changed photos are decoded.
+    """
+    from .features import ENCODER_VERSION, encoding_to_bytes
+    from .inference import encode_faces
+
+    if not teacher_image.content_hash:
+        teacher_image.content_hash = m.get_content_hash(teacher_image.image)
+
+    fields = m.TeacherImage.objects.filter(
+        content_hash=teacher_image.content_hash, encoding__isnull=False, encoder_version=ENCODER_VERSION
+    ).exclude(id=teacher_image.id).values('encoding', 'face_top', 'face_right', 'face_bottom', 'face_left').first()
+
+    if fields is None:
+        with teacher_image.image.open('rb') as f:
+            face_locations, face_encodings = encode_faces(f.read())
+
+        if len(face_locations) != 1:
+            return False
 
-    image_paths = teacher.images.filter(id__in=image_ids).values_list('image', flat=True)
+        top, right, bottom, left = face_locations[0]
+        fields = {
+            'encoding': encoding_to_bytes(face_encodings[0]),
+            'face_top': max(top, 0),
+            'face_right': max(right, 0),
+            'face_bottom': max(bottom, 0),
+            'face_left': max(left, 0),
+        }
 
-    encodings = []
-    for image_path in image_paths:
-        image = face_recognition.load_image_file(os.path.join(settings.MEDIA_ROOT, image_path))
-        encodings.append(face_recognition.face_encodings(image)[0])
+    fields['content_hash'] = teacher_image.content_hash
+    fields['encoder_version'] = ENCODER_VERSION
+    for name, value in fields.items():
+        setattr(teacher_image, name, value)
 
-    file_name = os.path.join(settings.FEATURE_ROOT, f"{username}.txt")
-    with open(file_name, "ab") as f:
-        np.savetxt(f, encodings)
+    m.TeacherImage.objects.filter(id=teacher_image.id).update(**fields)
+    return True
 
 
 @app.task
 def sync_extract_feature(context):
     """
-    Reconstruct the encoding files
+    Encode the images of the teacher which are new or were encoded by an older encoder
     """
+    from .features import ENCODER_VERSION, bump_features_version
+    from .gallery import refresh_teacher
+
     teacher_id = context['teacher']
     teacher = get_object_or_404(m.TeacherProfile, id=teacher_id)
-    username = teacher.user.username
 
-    if not os.path.exists(settings.FEATURE_ROOT):
-        os.makedirs(settings.FEATURE_ROOT)
+    for teacher_image in teacher.images.all():
+        if teacher_image.encoding is not None and teacher_image.encoder_version == ENCODER_VERSION:
+            continue
 
-    teacher_images = teacher.images.values_list('id', 'image')
+        if not encode_teacher_image(teacher_image):
+            teacher_image.delete()
 
-    encodings = []
-    for teacher_image in teacher_images:
-        image_server_path = os.path.join(settings.MEDIA_ROOT, teacher_image[1])
-        image = cv2.imread(image_server_path)
-        face_locations = face_recognition.face_locations(image, model="hog")
-        if len(face_locations) != 1:
-            m.TeacherImage.objects.get(id=teacher_image[0]).delete()
-            continue
+    bump_features_version(teacher.id)
+    teacher.refresh_from_db(fields=['features_version'])
+    refresh_teacher(teacher)
 
-        cv2.imwrite(image_server_path, image)
-        encodings.append(face_recognition.face_encodings(image, face_locations)[0])
 
-    file_name = os.path.join(settings.FEATURE_ROOT, f"{username}.txt")
-    with open(file_name, "wb") as f:
-        np.savetxt(f, encodings)
+@app.task
+def make_teacher_image_thumbnails(context):
+    """
+    Render the missing thumbnails of the teacher's images
+    """
+    from ..core.thumbnails import save_thumbnail
+
+    teacher_images = m.TeacherImage.objects.filter(teacher_id=context['teacher']).filter(
+        Q(thumbnail='') | Q(thumbnail__isnull=True)
+    )
+    for teacher_image in teacher_images:
+        save_thumbnail(teacher_image)
@@ -1,3 +1,43 @@
-from django.test import TestCase
+"""
+pytest-benchmark tests of the face check-in, kiosk and enrollment paths
 
-# Create your tests here.
+The photo is the sample face of `benchmark.sample_face_images`, a benchmark
+fails with NoFaceError when the detector finds no face in it.
+"""
+import pytest
+from django.conf import settings
+
+from .benchmark import STAGES, Pipeline, sample_face_images
+from .inference import warm_up
+
+
+@pytest.fixture(scope='module')
+def photo():
+    if not settings.FACE_INFERENCE['ADDRESS']:
+        warm_up()
+
+    return sample_face_images(1)[0]
+
+
+@pytest.fixture
+def pipeline(settings, tmp_path):
+    settings.FEATURE_ROOT = str(tmp_path)
+    return Pipeline(teachers=1000, per_teacher=10)
+
+
+def check_timings(timings, *stages):
+    assert set(timings) <= set(STAGES)
+    for stage in ('decode', 'detect', 'encode', 'total') + stages:
+        assert stage in timings
+
+
+def test_checkin(benchmark, pipeline, photo):
+    check_timings(benchmark(pipeline.checkin, photo), 'compare')
+
+
+def test_kiosk(benchmark, pipeline, photo):
+    check_timings(benchmark(pipeline.kiosk, photo), 'identify')
+
+
+def test_enroll(benchmark, pipeline, photo):
+    check_timings(benchmark(pipeline.enroll, photo))
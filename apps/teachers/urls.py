@@ -7,6 +7,7 @@ router = DefaultRouter(trailing_slash=False)
 router.register(r'departments', v.DepartmentViewSet)
 router.register(r'positions', v.PositionViewSet)
 router.register(r'teachers', v.TeacherViewSet)
+router.register(r'bulk-enrollments', v.BulkEnrollmentViewSet)
 
 urlpatterns = [
     path('', include(router.urls))
@@ -1,10 +1,7 @@
 import base64
-import io
-import os
+import zipfile
 import six
-import face_recognition
-import numpy as np
-from django.conf import settings
+from django.core.files.storage import default_storage
 from django.db.models import Q
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
@@ -16,7 +13,8 @@ from drf_renderer_xlsx.renderers import XLSXRenderer
 from . import models as m
 from . import serializers as s
 from ..core.export import EXCEL_BODY_STYLE, EXCEL_HEAD_STYLE
-from .tasks import sync_extract_feature
+from .enrollment import start_enrollment
+from .tasks import make_teacher_image_thumbnails, sync_extract_feature
 
 
 class DepartmentViewSet(XLSXFileMixin, viewsets.ModelViewSet):
@@ -223,6 +221,7 @@ class TeacherViewSet(XLSXFileMixin, viewsets.ModelViewSet):
     def destroy(self, request, pk=None):
         instance = self.get_object()
         instance.user.delete()
+        m.FeatureVersion.bump()
 
         return Response(
             {
@@ -265,6 +264,7 @@ class TeacherViewSet(XLSXFileMixin, viewsets.ModelViewSet):
             id__in=request.data.get('ids', [])
         ).values_list('user__id', flat=True)
         m.User.objects.filter(id__in=user_ids).delete()
+        m.FeatureVersion.bump()
         return Response(
             {
                 'msg': 'Delete successfully'
@@ -375,6 +375,11 @@ class TeacherViewSet(XLSXFileMixin, viewsets.ModelViewSet):
                 'teacher': instance.id
             }]
         )
+        make_teacher_image_thumbnails.apply_async(
+            args=[{
+                'teacher': instance.id
+            }]
+        )
         return Response(
             s.TeacherImageSetSerializer(instance, context={'request': request}).data,
             status=status.HTTP_200_OK
@@ -403,6 +408,11 @@ class TeacherViewSet(XLSXFileMixin, viewsets.ModelViewSet):
                 'teacher': my_profile.id
             }]
         )
+        make_teacher_image_thumbnails.apply_async(
+            args=[{
+                'teacher': my_profile.id
+            }]
+        )
 
         return Response(
             s.TeacherImageSetSerializer(my_profile, context={'request': request}).data,
@@ -417,6 +427,30 @@ class TeacherViewSet(XLSXFileMixin, viewsets.ModelViewSet):
             status=status.HTTP_200_OK
         )
 
+    @action(detail=False, url_path="feature-cache")
+    def get_feature_cache_stats(self, request):
+        """
+        Hit/miss counters of the face encoding cache in this worker process
+        """
+        from .features import feature_cache
+
+        return Response(
+            feature_cache.stats(),
+            status=status.HTTP_200_OK
+        )
+
+    @action(detail=False, url_path="face-inference")
+    def get_face_inference_stats(self, request):
+        """
+        Queue depth and per-stage latency of the face inference service
+        """
+        from .inference import get_stats as get_inference_stats
+
+        return Response(
+            get_inference_stats(),
+            status=status.HTTP_200_OK
+        )
+
     @action(detail=False, methods=['post'], url_path="me/identify-face")
     def identify_face(self, request):
         """
@@ -425,6 +459,9 @@ class TeacherViewSet(XLSXFileMixin, viewsets.ModelViewSet):
         This endpoint is not used in actually identifying the faces in attendance system.
         This is only kind of test version api.
         """
+        from .features import count_matches, feature_cache
+        from .inference import InferenceError, encode_faces
+
         query_image = request.data.pop('image', None)
         if query_image is None or not isinstance(query_image, six.string_types) or\
            not query_image.startswith('data:image'):
@@ -450,12 +487,29 @@ class TeacherViewSet(XLSXFileMixin, viewsets.ModelViewSet):
             )
         else:
 
-            query_image = face_recognition.load_image_file(io.BytesIO(query_image))
-            query_encoding = face_recognition.face_encodings(query_image)[0]
+            try:
+                _, query_encodings = encode_faces(query_image)
+            except InferenceError:
+                return Response(
+                    {
+                        "code": -1,
+                        "msg": "Face inference is busy"
+                    },
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE
+                )
 
-            username = request.user.username
-            file_name = os.path.join(settings.FEATURE_ROOT, f"{username}.txt")
-            if not os.path.exists(file_name):
+            if not query_encodings:
+                return Response(
+                    {
+                        "code": -1,
+                        "msg": "No face in the photo"
+                    },
+                    status=status.HTTP_200_OK
+                )
+
+            query_encoding = query_encodings[0]
+            encodings = feature_cache.get(request.user.profile)
+            if encodings is None or len(encodings) == 0:
                 return Response(
                     {
                         "code": -1,
@@ -464,10 +518,8 @@ class TeacherViewSet(XLSXFileMixin, viewsets.ModelViewSet):
                     status=status.HTTP_200_OK
                 )
 
-            encodings = np.loadtxt(file_name)
-            matches = face_recognition.compare_faces(encodings, query_encoding)
-            matches_count = matches.count(True)
-            if matches_count > int(len(matches) * 0.8):
+            matches_count, total = count_matches(encodings, query_encoding, 0.6)
+            if matches_count > int(total * 0.8):
                 return Response(
                     {
                         "code": 0,
@@ -483,3 +535,46 @@ class TeacherViewSet(XLSXFileMixin, viewsets.ModelViewSet):
                     },
                     status=status.HTTP_200_OK
                 )
+
+
+class BulkEnrollmentViewSet(viewsets.ModelViewSet):
+    """
+    Bulk photo enrollment from a zip file laid out as `<work_no>/*.jpg`
+    """
+    queryset = m.BulkEnrollment.objects.all()
+    serializer_class = s.BulkEnrollmentSerializer
+    parser_classes = [MultiPartParser]
+    http_method_names = ['get', 'post', 'head', 'options']
+
+    def create(self, request):
+        archive = request.data.get('archive', None)
+        if archive is None or not zipfile.is_zipfile(archive):
+            return Response(
+                {
+                    "code": -1,
+                    "msg": "Error request body"
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        path = default_storage.save(f'enrollments/{archive.name}', archive)
+        instance = m.BulkEnrollment.objects.create(source=default_storage.path(path))
+        start_enrollment(instance)
+        instance.refresh_from_db()
+        return Response(
+            self.serializer_class(instance).data,
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(detail=True, methods=['post'], url_path='resume')
+    def resume(self, request, pk=None):
+        """
+        Continue an interrupted enrollment, enrolled and rejected photos are skipped
+        """
+        instance = self.get_object()
+        start_enrollment(instance)
+        instance.refresh_from_db()
+        return Response(
+            self.serializer_class(instance).data,
+            status=status.HTTP_200_OK
+        )
@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init
 
 os.environ.setdefault(
     'DJANGO_SETTINGS_MODULE', 'config.settings.local'
@@ -10,3 +11,12 @@ app = Celery('school')
 app.config_from_object('config.celeryconfig', namespace='CELERY')
 
 app.autodiscover_tasks()
+
+
+@worker_process_init.connect
+def warm_up_face_worker(**kwargs):
+    from django.conf import settings
+
+    if settings.FACE_WARM_UP:
+        from apps.teachers.inference import warm_up_worker
+        warm_up_worker()
@@ -1,12 +1,27 @@
+import environ
 from celery.schedules import crontab
 
 
+env = environ.Env()
+
 broker_url = 'amqp://localhost'
 beat_schedule = {
     'update_date_person_report': {
         'task': 'apps.regulations.tasks.update_attendance_report',
         'schedule': crontab(minute=0, hour=2),
     },
+    'archive_attendance_history': {
+        'task': 'apps.regulations.tasks.archive_attendance_history',
+        'schedule': crontab(minute=0, hour=3, day_of_month=1),
+    },
+}
+
+# check-ins are not queued behind reports and notifications
+task_routes = {
+    'apps.regulations.tasks.process_attend_ticket': {'queue': 'attendance'},
 }
 
-task_always_eager = True
+# Tasks run inline in the calling process, e.g. the face verification of an asynchronous
+# check-in runs inside its request and the attendance queue stays empty. The deploy
+# units turn it off, the development setup has no broker
+task_always_eager = env.bool('CELERY_TASK_ALWAYS_EAGER', True)
@@ -144,9 +144,95 @@ STATICFILES_FINDERS = [
 # ----------------------------------------------------------------------------
 MEDIA_URL =  '/media/'
 MEDIA_ROOT = str(ROOT_DIR("media"))
-FEATURE_ROOT = str(ROOT_DIR("features"))
+# node-local snapshots of the face encodings stored in the database, empty to read them from the database
+FEATURE_ROOT = env.str('FEATURE_ROOT', str(ROOT_DIR("features")))
 
 
+# Caches
+# ----------------------------------------------------------------------------
+# process-local caches are invalidated by version counters in the database, which
+# are never evicted and are shared by every node
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # checks of the day per membership, polled by the attendance status screen
+    'attendance-status': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'attendance-status',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': env.int('ATTENDANCE_STATUS_CACHE_ENTRIES', 5000),
+        },
+    },
+}
+ATTENDANCE_STATUS_CACHE = 'attendance-status'
+
+
+# Face recognition
+# ----------------------------------------------------------------------------
+# Upper bound of parsed face encodings kept in memory by each worker process
+FEATURE_CACHE_MAX_BYTES = env.int('FEATURE_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+
+# Keep a centroid plus at most EXEMPLARS encodings per teacher in the cache, stored as
+# float32, float16 or int8. Use `manage.py face_compaction_report` to measure the trade-off
+FACE_COMPACTION = {
+    'ENABLED': env.bool('FACE_COMPACTION_ENABLED', False),
+    'EXEMPLARS': env.int('FACE_COMPACTION_EXEMPLARS', 8),
+    'DTYPE': env.str('FACE_COMPACTION_DTYPE', 'float16'),
+}
+
+# Photos are downscaled to this size before face detection, 0 keeps the original size.
+# Use `manage.py face_preprocess_report` to measure the latency and accuracy of a value
+FACE_IMAGE_MAX_DIMENSION = env.int('FACE_IMAGE_MAX_DIMENSION', 800)
+
+# Local face inference service, see `manage.py run_face_inference`.
+# Faces are detected and encoded inside the web process while ADDRESS is empty
+FACE_INFERENCE = {
+    'ADDRESS': env.str('FACE_INFERENCE_ADDRESS', ''),
+    'AUTHKEY': env.str('FACE_INFERENCE_AUTHKEY', 'schools-face-inference'),
+    'PROCESSES': env.int('FACE_INFERENCE_PROCESSES', 2),
+    'QUEUE_SIZE': env.int('FACE_INFERENCE_QUEUE_SIZE', 16),
+    'MAX_PENDING': env.int('FACE_INFERENCE_MAX_PENDING', 8),
+    'TIMEOUT': env.float('FACE_INFERENCE_TIMEOUT', 10.0),
+    'FALLBACK_INLINE': env.bool('FACE_INFERENCE_FALLBACK_INLINE', True),
+    # up to BATCH_SIZE waiting photos are sent to a pool process in one task, where they are
+    # still encoded one after another. See `manage.py face_batching_report`
+    'BATCH_SIZE': env.int('FACE_INFERENCE_BATCH_SIZE', 1),
+}
+
+# Load the face models and the kiosk gallery when a web or attendance worker starts instead of
+# on its first face request. Use `manage.py startup_report` to measure the difference
+FACE_WARM_UP = env.bool('FACE_WARM_UP', False)
+
+
+# Attendance photos
+# ----------------------------------------------------------------------------
+# Check-in photos are stored re-encoded to this size and JPEG quality. Asynchronous
+# check-ins are verified on the stored photo, keep MAX_DIMENSION >= FACE_IMAGE_MAX_DIMENSION
+ATTENDANCE_PHOTO = {
+    'MAX_DIMENSION': env.int('ATTENDANCE_PHOTO_MAX_DIMENSION', 1280),
+    'QUALITY': env.int('ATTENDANCE_PHOTO_QUALITY', 80),
+}
+
+
+# Attendance archive
+# ----------------------------------------------------------------------------
+# Check-ins older than HORIZON_DAYS are moved month by month to the archive table and their
+# photos to zip bundles, see `manage.py archive_attendance`. A month restored with
+# `manage.py restore_attendance` is archived again after RESTORED_DAYS
+ATTENDANCE_ARCHIVE = {
+    'HORIZON_DAYS': env.int('ATTENDANCE_ARCHIVE_HORIZON_DAYS', 365),
+    'RESTORED_DAYS': env.int('ATTENDANCE_ARCHIVE_RESTORED_DAYS', 30),
+}
+
+
+# Thumbnails
+# ----------------------------------------------------------------------------
+# Side in pixels of the square thumbnails of teacher and attendance photos
+THUMBNAIL_SIZE = env.int('THUMBNAIL_SIZE', 160)
+THUMBNAIL_QUALITY = env.int('THUMBNAIL_QUALITY', 80)
+
 
 AUTH_USER_MODEL = 'accounts.User'
 AUTHENTICATION_BACKENDS = [
@@ -9,8 +9,13 @@ https://docs.djangoproject.com/en/3.0/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings.local')
 
 application = get_wsgi_application()
+
+if settings.FACE_WARM_UP:
+    from apps.teachers.inference import warm_up_worker
+    warm_up_worker()
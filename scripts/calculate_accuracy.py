@@ -1,75 +1,185 @@
+"""
+Evaluate the face matching rule on a dataset laid out as <dataset>/<person>/*.jpg
+
+Every image is encoded once by a process pool and the encodings are cached on
+disk, keyed by path, size and mtime, so later runs only encode new photos. The
+first image with a single face of each person is the query, the next `--num`
+ones are the person's enrolled encodings. All query to encoding distances are
+computed at once and the attendance rule (more than `ratio` of the person's
+encodings within `tolerance`) is swept over tolerances and ratios, reporting
+the false accept and false reject rates.
+"""
 import argparse
+import csv
 import os
 import random
-import cv2
+import time
+from multiprocessing import Pool
+
 import face_recognition
+import numpy as np
 from imutils import paths
 
 
-ap = argparse.ArgumentParser()
-ap.add_argument("-d", "--dataset", required=True, help="Path to the face dataset")
-ap.add_argument("-n", "--num", required=True, type=int, help="Number of images")
-args = vars(ap.parse_args())
-
-persons = [person for person in os.listdir(args["dataset"]) if os.path.isdir(os.path.join(args["dataset"], person))]
-test_images = []
-encodings = {}
-
-print(f"[INFO] gathering one test file and encoding from {args['num']} training files")
-for (i, person) in enumerate(persons):
-    image_paths = list(paths.list_images(os.path.join(args["dataset"], person)))
-    random.shuffle(image_paths)
-
-    print(f"[INFO] encoding {i + 1}th faces")
-    encodings[person] = []
-    image_nums = 0
-    for image_path in image_paths:
-        image = cv2.imread(image_path)
-        face_locations = face_recognition.face_locations(image, model="hog")
-        if len(face_locations) != 1:
-            print(f"Could not detect face from this file {image_path}")
-            continue
+ENCODING_SIZE = 128
+
+
+def encode_image(image_path):
+    """
+    Return the encoding of the image, None when it has no single face
+    """
+    try:
+        image = face_recognition.load_image_file(image_path)
+    except Exception:
+        return image_path, None
+
+    face_locations = face_recognition.face_locations(image, model="hog")
+    if len(face_locations) != 1:
+        return image_path, None
+
+    return image_path, face_recognition.face_encodings(image, face_locations)[0]
+
+
+def cache_key(image_path):
+    stat = os.stat(image_path)
+    return f"{image_path}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def load_cache(cache_path):
+    if not os.path.exists(cache_path):
+        return {}
+
+    data = np.load(cache_path)
+    return {
+        key: encoding if valid else None
+        for key, encoding, valid in zip(data['keys'].tolist(), data['encodings'], data['valid'])
+    }
+
+
+def save_cache(cache_path, cache):
+    keys = sorted(cache)
+    encodings = np.zeros((len(keys), ENCODING_SIZE), dtype=np.float32)
+    valid = np.zeros(len(keys), dtype=bool)
+    for i, key in enumerate(keys):
+        if cache[key] is not None:
+            encodings[i] = cache[key]
+            valid[i] = True
+
+    np.savez(cache_path, keys=np.array(keys), encodings=encodings, valid=valid)
+
+
+def encode_dataset(image_paths, cache_path, processes):
+    cache = load_cache(cache_path)
+    keys = {image_path: cache_key(image_path) for image_path in image_paths}
+    missing = [image_path for image_path in image_paths if keys[image_path] not in cache]
+    print(f"[INFO] {len(image_paths) - len(missing)} cached encodings, encoding {len(missing)} images")
+
+    started_on = time.perf_counter()
+    with Pool(processes) as pool:
+        for i, (image_path, encoding) in enumerate(pool.imap_unordered(encode_image, missing, chunksize=8), 1):
+            cache[keys[image_path]] = encoding
+            if i % 100 == 0 or i == len(missing):
+                elapsed = time.perf_counter() - started_on
+                print(f"[INFO] encoded {i}/{len(missing)} images, {i / elapsed:.1f} images/s")
+            if i % 1000 == 0:
+                save_cache(cache_path, cache)
 
-        if len(test_images) == i:
-            test_images.append(image_path)
+    if missing:
+        save_cache(cache_path, cache)
+
+    return {image_path: cache[keys[image_path]] for image_path in image_paths}
+
+
+def pairwise_distances(queries, encodings):
+    """
+    Euclidean distances between every query and every encoding, as one matrix product
+    """
+    squared = (queries ** 2).sum(axis=1)[:, None] + (encodings ** 2).sum(axis=1)[None, :]
+    squared -= 2 * queries @ encodings.T
+    np.maximum(squared, 0, out=squared)
+    return np.sqrt(squared)
+
+
+def parse_range(value):
+    """
+    Parse "start:stop:step" or a comma separated list
+    """
+    if ':' in value:
+        start, stop, step = (float(part) for part in value.split(':'))
+        return np.round(np.arange(start, stop + step / 2, step), 6).tolist()
+
+    return [float(part) for part in value.split(',')]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-d", "--dataset", required=True, help="Path to the face dataset")
+    ap.add_argument("-n", "--num", type=int, default=10, help="Number of enrolled images per person")
+    ap.add_argument("-p", "--processes", type=int, default=os.cpu_count(), help="Encoding processes")
+    ap.add_argument("-c", "--cache", help="Encoding cache file, <dataset>/encodings.npz by default")
+    ap.add_argument("-t", "--tolerances", default="0.30:0.70:0.02", help="start:stop:step or a list")
+    ap.add_argument("-r", "--ratios", default="0.5,0.6,0.7,0.8", help="Majority ratios")
+    ap.add_argument("-s", "--seed", type=int, default=0, help="Seed of the image shuffle")
+    ap.add_argument("-o", "--output", help="Write the FAR/FRR curves to this CSV file")
+    args = vars(ap.parse_args())
+
+    dataset = args["dataset"]
+    persons = sorted(person for person in os.listdir(dataset) if os.path.isdir(os.path.join(dataset, person)))
+    image_paths = {person: sorted(paths.list_images(os.path.join(dataset, person))) for person in persons}
+    encodings = encode_dataset(
+        [image_path for person in persons for image_path in image_paths[person]],
+        args["cache"] or os.path.join(dataset, "encodings.npz"),
+        args["processes"],
+    )
+
+    rng = random.Random(args["seed"])
+    queries, enrolled, starts, names = [], [], [], []
+    for person in persons:
+        person_paths = list(image_paths[person])
+        rng.shuffle(person_paths)
+        person_encodings = [encodings[image_path] for image_path in person_paths if encodings[image_path] is not None]
+        if len(person_encodings) < 2:
+            print(f"[INFO] skipped {person}: not enough images with a single face")
             continue
 
-        if image_nums >= args["num"]:
-            break
-
-        image_nums += 1
-        encodings[person].append(face_recognition.face_encodings(image, face_locations)[0])
-
-
-false_positives = 0
-false_negatives = 0
-true_positives = 0
-true_negatives = 0
-
-print("[INFO] Evaluating")
-for (i, person) in enumerate(persons):
-    for (j, test_image) in enumerate(test_images):
-        query_image = face_recognition.load_image_file(test_image)
-        face_locations = face_recognition.face_locations(query_image, model="hog")
-        query_encoding = face_recognition.face_encodings(query_image, face_locations)[0]
-
-        matches = face_recognition.compare_faces(encodings[person], query_encoding, tolerance=0.5)
-        matches_count = matches.count(True)
-
-        if i == j:
-            if matches_count <= len(matches) // 2:
-                print(f"{person} recognition is failed")
-                true_negatives += 1
-            else:
-                print(f"{person} recognition passed")
-                true_positives += 1
-        else:
-            if matches_count > len(matches) // 2:
-                print(f"{j} th person seems like {person}")
-                false_positives += 1
-
-
-print(f"[INFO] total persons: {len(person)}")
-print(f"[INFO] True negatives: {true_negatives}")
-print(f"[INFO] True positive: {true_positives}")
-print(f"[INFO] False positives: {false_positives}")
+        names.append(person)
+        queries.append(person_encodings[0])
+        starts.append(len(enrolled))
+        enrolled.extend(person_encodings[1:args["num"] + 1])
+
+    queries = np.asarray(queries, dtype=np.float32)
+    enrolled = np.asarray(enrolled, dtype=np.float32)
+    starts = np.asarray(starts)
+    totals = np.diff(np.append(starts, len(enrolled)))
+    print(f"[INFO] {len(names)} persons, {len(enrolled)} enrolled encodings")
+
+    distances = pairwise_distances(queries, enrolled)
+    genuine = np.eye(len(names), dtype=bool)
+    impostor_pairs = max(len(names) * (len(names) - 1), 1)
+
+    rows = []
+    for tolerance in parse_range(args["tolerances"]):
+        # matches of every query against every person, summed over the person's encodings
+        counts = np.add.reduceat(distances <= tolerance, starts, axis=1)
+        for ratio in parse_range(args["ratios"]):
+            accepted = counts > np.floor(totals * ratio)
+            frr = np.count_nonzero(~accepted[genuine]) / len(names)
+            far = np.count_nonzero(accepted[~genuine]) / impostor_pairs
+            rows.append((tolerance, ratio, far, frr))
+
+    print(f"{'tolerance':>10} {'ratio':>6} {'FAR':>9} {'FRR':>9}")
+    for tolerance, ratio, far, frr in rows:
+        print(f"{tolerance:>10.3f} {ratio:>6.2f} {far:>9.5f} {frr:>9.5f}")
+
+    tolerance, ratio, far, frr = min(rows, key=lambda row: (abs(row[2] - row[3]), row[2] + row[3]))
+    print(f"[INFO] closest to equal error: tolerance {tolerance:.3f}, ratio {ratio:.2f}, FAR {far:.5f}, FRR {frr:.5f}")
+
+    if args["output"]:
+        with open(args["output"], "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["tolerance", "ratio", "far", "frr"])
+            writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()